@@ -0,0 +1,149 @@
+"""Входы обычных клиентов во время потока дорогих запросов атакующего, с допуском и без.
+
+    python benchmarks/bench_admission.py --clients 8 --attackers 32 --duration 10
+
+Для каждого режима сервер Flask запускается в отдельном процессе во временном
+каталоге. --attackers потоков от имени одного зарегистрированного клиента
+непрерывно отправляют запросы, каждый из которых без допуска доходит до
+криптографии: /auth/mutual (подпись RSA сервера, --attack mutual) или
+/auth/timestamp со случайной подписью правильной длины (проверка RSA,
+--attack timestamp). Одновременно --clients потоков выполняют аутентификацию
+запрос-ответ. В отчёт идут пропускная способность и задержки обычных входов и
+распределение ответов атакующим.
+"""
+import argparse
+import base64
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER_DIR = os.path.abspath(os.path.join(ROOT, "server"))
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+import requests
+
+from client import Client
+from loadgen import LatencyRecorder
+
+MODES = {
+    "off": {"ADMISSION_CLIENT_RATE": "0", "MAX_IN_FLIGHT": "0"},
+    "on": {},
+}
+
+SERVER_COMMAND = (
+    "import server; server.generate_server_keys(); server.server_keys.load(); "
+    "server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def start_server(port, workdir, settings):
+    env = {**os.environ, "PYTHONPATH": SERVER_DIR, "REGISTRY_PATH": "", "LOG_LEVEL": "WARNING", **settings}
+    process = subprocess.Popen([sys.executable, "-c", SERVER_COMMAND.format(port=port)], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/get_server_public_key", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Сервер не запустился")
+
+
+def attack_request(kind, client_id):
+    if kind == "mutual":
+        return "/auth/mutual", {"client_id": client_id, "client_nonce": 42}
+    return "/auth/timestamp", {
+        "client_id": client_id,
+        "timestamp": int(time.time()),
+        "signature": base64.b64encode(os.urandom(256)).decode()
+    }
+
+
+def attack(port, kind, client_id, deadline, responses, lock):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        path, body = attack_request(kind, client_id)
+        try:
+            status = session.post(f"http://127.0.0.1:{port}{path}", json=body, timeout=30).status_code
+        except requests.RequestException:
+            status = "error"
+        with lock:
+            responses[status] += 1
+
+
+def login(client, deadline, recorder):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            ok = client.authenticate_with_challenge()
+        except Exception:
+            ok = False
+        recorder.record("challenge", time.perf_counter() - start, ok)
+
+
+def bench(mode, port, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(port, workdir, MODES[mode])
+        try:
+            os.chdir(workdir)
+            clients = [
+                Client(f"user-{i}", "127.0.0.1", port, pool_size=1, retries=0, timeout=30, verbose=False)
+                for i in range(args.clients + 1)
+            ]
+            attacker_id = clients.pop().client_id
+
+            deadline = time.monotonic() + args.duration
+            recorder = LatencyRecorder()
+            responses = collections.Counter()
+            lock = threading.Lock()
+            threads = [
+                threading.Thread(target=attack, args=(port, args.attack, attacker_id, deadline, responses, lock))
+                for _ in range(args.attackers)
+            ]
+            threads += [threading.Thread(target=login, args=(client, deadline, recorder)) for client in clients]
+
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            summary = recorder.summary(time.perf_counter() - start).get("challenge", {})
+
+            for client in clients:
+                client.close()
+        finally:
+            os.chdir(ROOT)
+            process.terminate()
+            process.wait()
+
+    return summary, responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["off", "on"], choices=list(MODES))
+    parser.add_argument("--clients", type=int, default=8, help="число обычных клиентов")
+    parser.add_argument("--attackers", type=int, default=32, help="число атакующих потоков")
+    parser.add_argument("--attack", default="mutual", choices=["mutual", "timestamp"], help="маршрут атаки")
+    parser.add_argument("--duration", type=float, default=10, help="длительность нагрузки, с")
+    parser.add_argument("--port", type=int, default=8290, help="порт первого запускаемого сервера")
+    args = parser.parse_args()
+
+    print(f"Клиентов: {args.clients}, атакующих потоков: {args.attackers} ({args.attack}), "
+          f"длительность: {args.duration} с")
+    print(f"{'допуск':<7} {'входов/с':>9} {'ошибок':>7} {'p50, мс':>8} {'p99, мс':>8}  ответы атакующим")
+    for offset, mode in enumerate(args.modes):
+        summary, responses = bench(mode, args.port + offset, args)
+        print(f"{mode:<7} {summary.get('throughput', 0):>9.1f} {summary.get('errors', 0):>7} "
+              f"{summary.get('p50_ms', 0):>8.1f} {summary.get('p99_ms', 0):>8.1f}  "
+              + ", ".join(f"{status}: {count}" for status, count in sorted(responses.items(), key=str)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Сравнение режимов сервера: Flask (потоковый сервер разработки) и ASGI (uvicorn).
+
+    python benchmarks/bench_asgi.py --clients 32 --idle 500 --duration 10
+
+Для каждого режима сервер запускается в отдельном процессе во временном каталоге,
+затем открывается --idle медленных соединений, которые отправили заголовки
+запроса, но не тело, и --clients потоков выполняют аутентификацию запрос-ответ.
+В отчёт идут число потоков и память процесса сервера при открытых медленных
+соединениях, пропускная способность и задержки p50/p99.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER_DIR = os.path.abspath(os.path.join(ROOT, "server"))
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+import requests
+
+from client import Client
+from loadgen import LatencyRecorder
+
+FLASK_COMMAND = (
+    "import server; server.generate_server_keys(); server.server_keys.load(); "
+    "server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def start_server(mode, port, workdir):
+    if mode == "flask":
+        command = [sys.executable, "-c", FLASK_COMMAND.format(port=port)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "--app-dir", SERVER_DIR, "asgi:app",
+                   "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    # Ограничение частоты по клиентам отключено: клиенты нагрузки входят без пауз
+    env = {**os.environ, "PYTHONPATH": SERVER_DIR, "REGISTRY_PATH": "", "SERVER_KEY_ALGORITHM": "ed25519",
+           "ADMISSION_CLIENT_RATE": "0"}
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/get_server_public_key", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Сервер {mode} не запустился")
+
+
+def process_status(pid):
+    """Число потоков и резидентная память процесса (только Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+    return int(fields["Threads"]), int(fields["VmRSS"].split()[0]) // 1024
+
+
+def open_idle_connections(port, count):
+    """Соединения, отправившие заголовки запроса и ожидающие отправки тела"""
+    connections = []
+    head = (
+        "POST /auth/timestamp HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        "Content-Type: application/json\r\nContent-Length: 1000\r\n\r\n"
+    ).encode()
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(head)
+        connections.append(sock)
+    return connections
+
+
+def run_load(clients, deadline, recorder):
+    def worker(client):
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = client.authenticate_with_challenge()
+            except Exception:
+                ok = False
+            recorder.record("challenge", time.perf_counter() - start, ok)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def bench(mode, port, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(mode, port, workdir)
+        try:
+            os.chdir(workdir)
+            clients = [
+                Client(f"bench-{i}", "127.0.0.1", port, algorithm="ed25519",
+                       pool_size=1, retries=0, timeout=30, verbose=False)
+                for i in range(args.clients)
+            ]
+
+            idle = open_idle_connections(port, args.idle)
+            time.sleep(1)
+            threads, rss = process_status(process.pid)
+
+            recorder = LatencyRecorder()
+            start = time.perf_counter()
+            run_load(clients, time.monotonic() + args.duration, recorder)
+            summary = recorder.summary(time.perf_counter() - start).get("challenge", {})
+
+            for sock in idle:
+                sock.close()
+            for client in clients:
+                client.close()
+        finally:
+            os.chdir(ROOT)
+            process.terminate()
+            process.wait()
+
+    return threads, rss, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["flask", "asgi"], choices=["flask", "asgi"])
+    parser.add_argument("--clients", type=int, default=32, help="число параллельных клиентов")
+    parser.add_argument("--idle", type=int, default=500, help="число медленных соединений")
+    parser.add_argument("--duration", type=float, default=10, help="длительность нагрузки, с")
+    parser.add_argument("--port", type=int, default=8190, help="порт первого запускаемого сервера")
+    args = parser.parse_args()
+
+    print(f"Клиентов: {args.clients}, медленных соединений: {args.idle}, длительность: {args.duration} с")
+    print(f"{'режим':<6} {'потоков':>8} {'память, МБ':>11} {'входов/с':>9} {'ошибок':>7} "
+          f"{'p50, мс':>8} {'p99, мс':>8}")
+    for offset, mode in enumerate(args.modes):
+        threads, rss, summary = bench(mode, args.port + offset, args)
+        print(f"{mode:<6} {threads or '-':>8} {rss or '-':>11} {summary.get('throughput', 0):>9.1f} "
+              f"{summary.get('errors', 0):>7} {summary.get('p50_ms', 0):>8.1f} {summary.get('p99_ms', 0):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
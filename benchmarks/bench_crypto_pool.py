@@ -0,0 +1,87 @@
+"""Пропускная способность пула криптографических операций в зависимости от числа процессов.
+
+Запуск из корня проекта:
+
+    python benchmarks/bench_crypto_pool.py --workers 0 1 2 4 8 --ops 2000
+
+Число процессов 0 означает выполнение операций в потоках запроса, как без пула.
+Пул ускоряет операции только на нескольких ядрах: на одном ядре каждый процесс
+пула медленнее варианта 0, и сервер в этом случае пул не запускает.
+Каждая операция - одна подпись сервера и одна проверка подписи клиента, т.е.
+нагрузка одной пары запросов /auth/mutual + /auth/mutual/verify.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from common.signatures import export_private_pem, export_public_pem, get_algorithm
+from crypto_pool import CryptoPool
+from key_cache import build_verifier
+
+
+def run(workers, ops, concurrency, algorithm, server_key, client_key):
+    client_public_pem = export_public_pem(client_key)
+    messages = [f"client-{i}:{i}:{i * 7}".encode() for i in range(ops)]
+    client_signer = algorithm.signer(client_key)
+    client_signatures = [client_signer.sign(m) for m in messages]
+
+    if workers == 0:
+        signer = algorithm.signer(server_key)
+        verifier = build_verifier(client_public_pem)
+
+        def job(i):
+            signer.sign(messages[i])
+            verifier.verify(messages[i], client_signatures[i])
+    else:
+        pool = CryptoPool(workers, export_private_pem(server_key).encode(), max_pending=concurrency)
+        # Прогрев: запуск процессов и разбор ключа клиента в каждом из них
+        for i in range(workers * 4):
+            pool.verify(client_public_pem, messages[0], client_signatures[0])
+
+        def job(i):
+            pool.sign(messages[i])
+            if not pool.verify(client_public_pem, messages[i], client_signatures[i]):
+                raise RuntimeError("Подпись не прошла проверку")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(job, range(ops)))
+    elapsed = time.perf_counter() - start
+
+    if workers:
+        pool.shutdown()
+    return ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--ops", type=int, default=1000, help="число пар подпись+проверка")
+    parser.add_argument("--concurrency", type=int, default=64, help="число параллельных потоков-запросов")
+    parser.add_argument("--algorithm", default="rsa", help="алгоритм подписи (rsa, ecdsa-p256, ed25519)")
+    args = parser.parse_args()
+
+    algorithm = get_algorithm(args.algorithm)
+    server_key = algorithm.generate()
+    client_key = algorithm.generate()
+
+    print(f"Ядер процессора: {os.cpu_count()}, алгоритм: {algorithm.name}, "
+          f"операций: {args.ops}, потоков: {args.concurrency}")
+    if os.cpu_count() == 1:
+        print("Одно ядро: пул не даст ускорения, сервер выполняет операции в потоке запроса")
+    print(f"{'процессов':>10} {'операций/с':>12} {'ускорение':>10}")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        throughput = run(workers, args.ops, args.concurrency, algorithm, server_key, client_key)
+        baseline = baseline or throughput
+        print(f"{workers:>10} {throughput:>12.1f} {throughput / baseline:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
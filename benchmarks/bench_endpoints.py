@@ -0,0 +1,146 @@
+"""Клиенты с несколькими серверами: выбор сервера по задержке и переход при отказе.
+
+    python benchmarks/bench_endpoints.py --clients 8 --rtt 40 --duration 10
+
+Запускаются два сервера Flask с разными ключами, секретами токенов и реестрами
+в памяти. Медленный сервер доступен через TCP-прокси с задержкой --rtt и стоит
+в списке серверов первым, быстрый - напрямую. --clients потоков в течение
+--duration секунд отправляют сообщения (каждое --login-every-е - после входа
+запрос-ответ); на середине быстрый сервер останавливается. Режимы:
+
+- static: клиент с одним сервером - первым в списке;
+- adaptive: клиент со списком серверов, выбором по задержке и переходом при отказе.
+
+Для каждой половины измерения выводятся число операций в секунду, задержки,
+ошибки и доля операций, выполненных на быстром сервере.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+from bench_handshake import DelayProxy, start_server
+from client import Client
+from loadgen import percentile
+
+MODES = ["static", "adaptive"]
+
+
+class Recorder:
+    """Задержки, ошибки и число операций на быстром сервере по половинам измерения"""
+
+    def __init__(self):
+        self.phases = {"before": [], "after": []}
+        self.errors = {"before": 0, "after": 0}
+        self.fast = {"before": 0, "after": 0}
+        self._lock = threading.Lock()
+
+    def record(self, phase, elapsed, ok, on_fast):
+        with self._lock:
+            self.phases[phase].append(elapsed)
+            self.errors[phase] += not ok
+            self.fast[phase] += on_fast
+
+
+def run_client(client, fast_url, args, deadline, stopped, recorder):
+    count = 0
+    while time.monotonic() < deadline:
+        phase = "after" if stopped.is_set() else "before"
+        start = time.perf_counter()
+        try:
+            if count % args.login_every == 0:
+                ok = client.authenticate_with_challenge() and client.send_message("bench")
+            else:
+                ok = client.send_message("bench")
+        except Exception:
+            ok = False
+        recorder.record(phase, time.perf_counter() - start, ok, client.server_url == fast_url)
+        count += 1
+
+
+def bench(mode, slow_port, fast_port, victim, args):
+    """Нагрузка в режиме mode; на середине останавливается процесс сервера victim"""
+    slow_url = f"http://127.0.0.1:{slow_port}"
+    fast_url = f"http://127.0.0.1:{fast_port}"
+    servers = [slow_url] if mode == "static" else [slow_url, fast_url]
+    clients = [
+        Client(f"{mode}-{i}", servers=servers, algorithm="ed25519", pool_size=1, retries=0,
+               timeout=(1, 5), verbose=False, probe_interval=args.probe_interval)
+        for i in range(args.clients)
+    ]
+    # Первая проба задержек
+    time.sleep(0.5)
+
+    recorder = Recorder()
+    stopped = threading.Event()
+    start = time.monotonic()
+    halfway = start + args.duration / 2
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=run_client, args=(client, fast_url, args, deadline, stopped, recorder))
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(max(0.0, halfway - time.monotonic()))
+    victim.terminate()
+    stopped.set()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.close()
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--clients", type=int, default=8, help="число клиентов")
+    parser.add_argument("--rtt", type=float, default=40, help="задержка сети до медленного сервера, мс")
+    parser.add_argument("--duration", type=float, default=10, help="длительность измерения, с")
+    parser.add_argument("--login-every", type=int, default=10, help="вход перед каждым N-м сообщением")
+    parser.add_argument("--probe-interval", type=float, default=1, help="период проверки серверов, с")
+    parser.add_argument("--port", type=int, default=8590, help="порт первого сервера")
+    args = parser.parse_args()
+
+    print(f"Клиентов: {args.clients}, RTT медленного сервера: {args.rtt:g} мс, длительность: {args.duration:g} с")
+    print(f"{'режим':<9} {'половина':<9} {'опер./с':>8} {'p50, мс':>8} {'p99, мс':>8} {'макс, мс':>9} "
+          f"{'ошибок':>7} {'на быстром':>11}")
+    for offset, mode in enumerate(args.modes):
+        slow_port, fast_port = args.port + 2 * offset, args.port + 2 * offset + 1
+        with tempfile.TemporaryDirectory() as workdir:
+            for name in ("slow", "fast", "client"):
+                os.mkdir(os.path.join(workdir, name))
+            slow_process = start_server(slow_port, os.path.join(workdir, "slow"), "ed25519")
+            fast_process = start_server(fast_port, os.path.join(workdir, "fast"), "ed25519")
+            proxy = DelayProxy(slow_port, args.rtt / 2000)
+            proxy.start()
+            try:
+                os.chdir(os.path.join(workdir, "client"))
+                # У клиента с одним сервером останавливается его единственный сервер
+                victim = slow_process if mode == "static" else fast_process
+                recorder = bench(mode, proxy.port, fast_port, victim, args)
+            finally:
+                os.chdir(ROOT)
+                proxy.stop()
+                for process in (slow_process, fast_process):
+                    process.terminate()
+                    process.wait()
+
+        for phase, label in (("before", "1-я"), ("after", "2-я")):
+            latencies = sorted(recorder.phases[phase])
+            if not latencies:
+                continue
+            print(f"{mode:<9} {label:<9} {len(latencies) / (args.duration / 2):>8.1f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{latencies[-1] * 1000:>9.1f} {recorder.errors[phase]:>7} "
+                  f"{recorder.fast[phase] / len(latencies):>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Время установления сессии: прежний порядок запросов и рукопожатие одним запросом.
+
+    python benchmarks/bench_handshake.py --rtt 0 20 50 --iterations 20
+
+Сервер Flask запускается в отдельном процессе во временном каталоге, а клиенты
+подключаются к нему через TCP-прокси, который задерживает данные в каждую
+сторону на половину --rtt. Измеряется время от создания Client до получения
+токена сессии в трёх сценариях:
+
+- mutual: получение ключа сервера, регистрация и взаимная аутентификация
+  (конструктор Client и authenticate_mutual);
+- handshake: первый вход нового клиента без сохранённого ключа сервера
+  (Client(handshake=True) и authenticate_handshake);
+- handshake-repeat: повторный вход того же клиента с сохранённым ключом сервера.
+
+Каждый вход выполняется новым Client, то есть по новому соединению. Прокси
+задерживает только передачу данных: установление TCP-соединения в измерение
+не входит, поэтому в реальной сети разница будет на один RTT больше.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER_DIR = os.path.abspath(os.path.join(ROOT, "server"))
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+import requests
+
+import client as client_module
+from client import Client
+from loadgen import percentile
+
+SERVER_COMMAND = (
+    "import server; server.generate_server_keys(); server.server_keys.load(); "
+    "server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+SCENARIOS = ["mutual", "handshake", "handshake-repeat"]
+
+
+def start_server(port, workdir, algorithm):
+    env = {
+        **os.environ, "PYTHONPATH": SERVER_DIR, "REGISTRY_PATH": "", "LOG_LEVEL": "WARNING",
+        "ADMISSION_CLIENT_RATE": "0", "SERVER_KEY_ALGORITHM": algorithm
+    }
+    process = subprocess.Popen([sys.executable, "-c", SERVER_COMMAND.format(port=port)], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/get_server_public_key", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Сервер не запустился")
+
+
+class DelayProxy:
+    """TCP-прокси, доставляющий данные в каждую сторону через delay секунд.
+
+    Данные читаются сразу и отправляются по наступлении срока, поэтому
+    несколько фрагментов одного запроса задерживаются на delay, а не на
+    delay на каждый фрагмент. Число HTTP-запросов считается по строкам запроса.
+    """
+
+    def __init__(self, target_port, delay):
+        self.target_port = target_port
+        self.delay = delay
+        self.requests = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.port = None
+
+    async def pipe(self, reader, writer, count_requests):
+        queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, data = await queue.get()
+                if data is None:
+                    break
+                await asyncio.sleep(max(0.0, due - self.loop.time()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        sender = asyncio.ensure_future(deliver())
+        try:
+            while data := await reader.read(65536):
+                if count_requests:
+                    self.requests += data.count(b" HTTP/1.1\r\n")
+                queue.put_nowait((self.loop.time() + self.delay, data))
+        except ConnectionError:
+            pass
+        queue.put_nowait((0, None))
+        await sender
+
+    async def handle(self, reader, writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+            await asyncio.gather(
+                self.pipe(reader, upstream_writer, True),
+                self.pipe(upstream_reader, writer, False),
+                return_exceptions=True
+            )
+        except (asyncio.CancelledError, OSError):
+            # Незакрытые клиентами соединения прерываются при остановке прокси,
+            # а при недоступном сервере соединение клиента закрывается
+            writer.close()
+
+    def start(self):
+        server = self.loop.run_until_complete(asyncio.start_server(self.handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.thread.start()
+
+    async def shutdown(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.loop.stop()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+        self.thread.join()
+        self.loop.close()
+
+
+def connect(scenario, client_id, port, args):
+    """Создание клиента и вход; возвращает True при успехе"""
+    if scenario == "mutual":
+        client = Client(client_id, "127.0.0.1", port, algorithm=args.algorithm, pool_size=1,
+                        retries=0, wire_format=args.wire, verbose=False)
+        ok = client.authenticate_mutual()
+    else:
+        client = Client(client_id, "127.0.0.1", port, algorithm=args.algorithm, pool_size=1,
+                        retries=0, wire_format=args.wire, verbose=False, handshake=True)
+        ok = client.authenticate_handshake()
+    client.close()
+    return ok
+
+
+def bench(rtt, server_port, args):
+    proxy = DelayProxy(server_port, rtt / 2000)
+    proxy.start()
+    results = {}
+    try:
+        for scenario in SCENARIOS:
+            latencies = []
+            errors = 0
+            proxy.requests = 0
+            for i in range(args.iterations):
+                # Повторный вход выполняют клиенты, зарегистрированные в сценарии handshake
+                prefix = "handshake" if scenario == "handshake-repeat" else scenario
+                client_id = f"{prefix}-{rtt}-{i}"
+                if scenario == "handshake" and os.path.exists(client_module.SERVER_PUBLIC_KEY_PATH):
+                    os.remove(client_module.SERVER_PUBLIC_KEY_PATH)
+                start = time.perf_counter()
+                ok = connect(scenario, client_id, proxy.port, args)
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+            latencies.sort()
+            results[scenario] = {
+                "requests": proxy.requests / args.iterations,
+                "p50_ms": percentile(latencies, 0.5) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "errors": errors
+            }
+    finally:
+        proxy.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt", type=float, nargs="+", default=[0, 20, 50], help="задержки сети (RTT), мс")
+    parser.add_argument("--iterations", type=int, default=20, help="число входов в каждом сценарии")
+    parser.add_argument("--algorithm", default="ed25519", help="алгоритм ключей клиента и сервера")
+    parser.add_argument("--wire", default="json", choices=["json", "msgpack"], help="формат сообщений")
+    parser.add_argument("--port", type=int, default=8390, help="порт сервера")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server_dir = os.path.join(workdir, "server")
+        client_dir = os.path.join(workdir, "client")
+        os.mkdir(server_dir)
+        os.mkdir(client_dir)
+        process = start_server(args.port, server_dir, args.algorithm)
+        try:
+            os.chdir(client_dir)
+            # Ключи клиента генерируются заранее, чтобы не входить в измерение
+            Client("warmup", "127.0.0.1", args.port, algorithm=args.algorithm, verbose=False).close()
+
+            print(f"Алгоритм: {args.algorithm}, формат: {args.wire}, входов в сценарии: {args.iterations}")
+            print(f"{'RTT, мс':>8} {'сценарий':<17} {'запросов':>8} {'p50, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+            for rtt in args.rtt:
+                for scenario, result in bench(rtt, args.port, args).items():
+                    print(f"{rtt:>8.0f} {scenario:<17} {result['requests']:>8.1f} {result['p50_ms']:>8.1f} "
+                          f"{result['p99_ms']:>8.1f} {result['errors']:>7}")
+        finally:
+            os.chdir(ROOT)
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
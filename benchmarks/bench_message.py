@@ -0,0 +1,241 @@
+"""Переворот сообщений разного размера: /message в JSON, /message/stream и пакеты /message.
+
+    python benchmarks/bench_message.py --sizes 100 10K 1M 16M 64M 256M --json-max 64M
+
+Сервер Flask запускается в отдельном процессе во временном каталоге. Для
+каждого размера сообщения (текст UTF-8 из латиницы и кириллицы) измеряются:
+
+- json: прежний запрос /message с одной строкой и копией исходного сообщения
+  в ответе (echo), только до --json-max байт;
+- stream: /message/stream, тело и ответ передаются частями, клиент не хранит
+  сообщение целиком;
+
+а также прирост памяти (RSS) процесса сервера во время запроса. Отдельно
+сравниваются --batch коротких сообщений отдельными запросами /message и
+одним пакетным запросом.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVER_DIR = os.path.abspath(os.path.join(ROOT, "server"))
+sys.path.insert(0, os.path.join(ROOT, "client"))
+
+import requests
+
+from client import Client
+from loadgen import percentile
+
+SERVER_COMMAND = (
+    "import server; server.generate_server_keys(); server.server_keys.load(); "
+    "server.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+# Повторяющийся фрагмент текста сообщений (символы по 1 и 2 байта в UTF-8)
+PATTERN = "Перевёрнутое сообщение - reversed message. "
+BLOCK_SIZE = 1024 * 1024
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value):
+    """Размер в байтах из строки вида 100, 10K, 64M"""
+    unit = value[-1].upper()
+    if unit in UNITS:
+        return int(float(value[:-1]) * UNITS[unit])
+    return int(value)
+
+
+def format_size(size):
+    for unit in ("G", "M", "K"):
+        if size >= UNITS[unit]:
+            return f"{size / UNITS[unit]:g}{unit}"
+    return str(size)
+
+
+def make_text(size):
+    """Текст UTF-8 ровно из size байт"""
+    encoded = PATTERN.encode()
+    data = encoded * (size // len(encoded) + 1)
+    # Обрезка по границе символа и добивка пробелами до точного размера
+    text = data[:size].decode(errors="ignore")
+    return text + " " * (size - len(text.encode()))
+
+
+def text_chunks(size):
+    """Текст из size байт частями по BLOCK_SIZE, без хранения целиком"""
+    block = make_text(min(size, BLOCK_SIZE))
+    encoded = block.encode()
+    remaining = size
+    while remaining >= len(encoded) and encoded:
+        yield encoded
+        remaining -= len(encoded)
+    if remaining:
+        yield make_text(remaining).encode()
+
+
+class CountingSink:
+    """Приёмник ответа, считающий байты"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+class RssSampler:
+    """Максимальный RSS процесса по /proc/<pid>/status за время измерения"""
+
+    def __init__(self, pid, interval=0.005):
+        self.path = f"/proc/{pid}/status"
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.base = self.rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+    @property
+    def growth(self):
+        return max(0, self.peak - self.base)
+
+
+def start_server(port, workdir):
+    env = {**os.environ, "PYTHONPATH": SERVER_DIR, "REGISTRY_PATH": "", "LOG_LEVEL": "WARNING",
+           "ADMISSION_CLIENT_RATE": "0"}
+    process = subprocess.Popen([sys.executable, "-c", SERVER_COMMAND.format(port=port)], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/get_server_public_key", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Сервер не запустился")
+
+
+def send_json(client, size):
+    message = make_text(size)
+    response = client.post(
+        "/message", {"client_id": client.client_id, "message": message},
+        headers={"Authorization": f"Bearer {client.session_token}"}
+    )
+    return response.status_code == 200 and len(client.read(response)["reversed_message"]) == len(message)
+
+
+def send_stream(client, size):
+    sink = CountingSink()
+    return client.send_message_stream(text_chunks(size), sink) == size
+
+
+def bench_size(mode, size, client, pid, args):
+    send = send_json if mode == "json" else send_stream
+    latencies = []
+    growth = 0
+    errors = 0
+    for _ in range(args.iterations):
+        with RssSampler(pid) as sampler:
+            start = time.perf_counter()
+            ok = send(client, size)
+            latencies.append(time.perf_counter() - start)
+        growth = max(growth, sampler.growth)
+        errors += not ok
+    latencies.sort()
+    p50 = percentile(latencies, 0.5)
+    return {
+        "p50_ms": p50 * 1000,
+        "mb_per_second": size / UNITS["M"] / p50 if p50 else 0,
+        "rss_growth_mb": growth / UNITS["M"],
+        "errors": errors
+    }
+
+
+def bench_batch(client, args):
+    messages = [make_text(args.batch_message_size) for _ in range(args.batch)]
+    start = time.perf_counter()
+    separate = sum(client.send_message(message) for message in messages)
+    separate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reversed_messages = client.send_messages(messages)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "separate": (separate_seconds, args.batch - separate),
+        "batch": (batch_seconds, 0 if reversed_messages == [m[::-1] for m in messages] else args.batch)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["100", "10K", "1M", "16M", "64M", "256M"],
+                        help="размеры сообщений в байтах (допустимы суффиксы K, M, G)")
+    parser.add_argument("--json-max", default="64M", help="максимальный размер сообщения в режиме json")
+    parser.add_argument("--iterations", type=int, default=3, help="число запросов каждого размера")
+    parser.add_argument("--batch", type=int, default=500, help="число сообщений в пакете")
+    parser.add_argument("--batch-message-size", type=int, default=64, help="размер сообщения в пакете, байт")
+    parser.add_argument("--port", type=int, default=8490, help="порт сервера")
+    args = parser.parse_args()
+    json_max = parse_size(args.json_max)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server_dir = os.path.join(workdir, "server")
+        client_dir = os.path.join(workdir, "client")
+        os.mkdir(server_dir)
+        os.mkdir(client_dir)
+        process = start_server(args.port, server_dir)
+        try:
+            os.chdir(client_dir)
+            client = Client("bench-message", "127.0.0.1", args.port, algorithm="ed25519",
+                            timeout=(3.05, 600), verbose=False)
+            if not client.authenticate_with_timestamp():
+                raise RuntimeError("Не удалось аутентифицироваться")
+
+            print(f"Запросов каждого размера: {args.iterations}")
+            print(f"{'размер':>7} {'режим':<7} {'p50, мс':>9} {'МБ/с':>8} {'RSS +МБ':>8} {'ошибок':>7}")
+            for size in map(parse_size, args.sizes):
+                for mode in ("json", "stream"):
+                    if mode == "json" and size > json_max:
+                        continue
+                    result = bench_size(mode, size, client, process.pid, args)
+                    print(f"{format_size(size):>7} {mode:<7} {result['p50_ms']:>9.1f} "
+                          f"{result['mb_per_second']:>8.1f} {result['rss_growth_mb']:>8.1f} {result['errors']:>7}")
+
+            print(f"\nПакет из {args.batch} сообщений по {args.batch_message_size} байт")
+            for mode, (seconds, errors) in bench_batch(client, args).items():
+                print(f"{mode:<9} {seconds * 1000:>9.1f} мс, сообщений/с: {args.batch / seconds:>9.0f}, "
+                      f"ошибок: {errors}")
+            client.close()
+        finally:
+            os.chdir(ROOT)
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Микробенчмарки примитивов, из которых состоят протоколы аутентификации.
+
+Каждый замер калибруется так, чтобы один повтор длился не меньше --min-time
+секунд, затем выполняется --repeat повторов; в отчёт идут медиана и минимум
+времени одной операции. Результаты можно сохранить как эталон и сравнивать
+с ним последующие запуски:
+
+    python benchmarks/bench_primitives.py --save benchmarks/baseline_primitives.json
+    python benchmarks/bench_primitives.py --compare benchmarks/baseline_primitives.json --threshold 0.25
+
+При сравнении скрипт завершается с кодом 1, если минимальное время хотя бы
+одного замера ухудшилось больше чем на threshold (доля от эталона). Минимум
+меньше медианы подвержен помехам от других процессов.
+"""
+import argparse
+import base64
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import Crypto
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+from Crypto.Hash import SHA256
+from flask import Flask, request, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.signatures import ALGORITHMS, public_key_of
+
+# Замеры со случайной по природе длительностью: выводятся, но не проверяются на регрессию
+UNSTABLE = {"rsa.generate_2048"}
+
+
+def build_benchmarks():
+    """Словарь {имя: функция без аргументов} для всех замеров"""
+    key = RSA.generate(2048)
+    public_key = key.publickey()
+    private_pem = key.export_key()
+    public_pem = public_key.export_key().decode()
+    signer = pkcs1_15.new(key)
+    verifier = pkcs1_15.new(public_key)
+
+    # Сообщения того же вида, что формируют auth_timestamp и auth_mutual_init
+    client_id = "device-000123"
+    timestamp = int(time.time())
+    timestamp_message = f"{client_id}:{timestamp}".encode()
+    mutual_message = f"{client_id}:482913:771204".encode()
+    signature = signer.sign(SHA256.new(timestamp_message))
+    signature_b64 = base64.b64encode(signature).decode()
+    timestamp_hash = SHA256.new(timestamp_message)
+
+    benchmarks = {
+        "rsa.generate_2048": lambda: RSA.generate(2048),
+        "rsa.import_key_private": lambda: RSA.import_key(private_pem),
+        "rsa.import_key_public": lambda: RSA.import_key(public_pem),
+        "pkcs1_15.sign": lambda: signer.sign(SHA256.new(mutual_message)),
+        "pkcs1_15.verify": lambda: verifier.verify(timestamp_hash, signature),
+        "pkcs1_15.new_and_verify": lambda: pkcs1_15.new(public_key).verify(timestamp_hash, signature),
+        "sha256.new": lambda: SHA256.new(timestamp_message),
+        "base64.encode_signature": lambda: base64.b64encode(signature).decode(),
+        "base64.decode_signature": lambda: base64.b64decode(signature_b64),
+    }
+
+    for name, algorithm in ALGORITHMS.items():
+        if name == "rsa":
+            continue
+        algorithm_key = algorithm.generate()
+        algorithm_signer = algorithm.signer(algorithm_key)
+        algorithm_verifier = algorithm.verifier(public_key_of(algorithm_key))
+        algorithm_signature = algorithm_signer.sign(timestamp_message)
+        benchmarks[f"{name}.sign"] = lambda s=algorithm_signer: s.sign(mutual_message)
+        benchmarks[f"{name}.verify"] = (
+            lambda v=algorithm_verifier, sig=algorithm_signature: v.verify(timestamp_message, sig)
+        )
+
+    # Разбор JSON запроса и сериализация ответа Flask для типичных сообщений протоколов
+    app = Flask(__name__)
+    bodies = {
+        "register": {"client_id": client_id, "public_key": public_pem, "algorithm": "rsa"},
+        "auth_timestamp": {"client_id": client_id, "timestamp": timestamp, "signature": signature_b64},
+        "auth_challenge_verify": {"client_id": client_id, "signature": signature_b64},
+    }
+    responses = {
+        "auth_mutual_init": {"status": "success", "server_nonce": 771204, "signature": signature_b64},
+        "auth_success": {"status": "success", "message": "Аутентификация успешна",
+                         "session_token": "ZGV2aWNlLTAwMDEyM3wxNzAwMDAwMDAw.AAAAAAAAAAAAAAAAAAAAAA",
+                         "expires_in": 900},
+    }
+
+    def flask_request(body):
+        raw = json.dumps(body)
+
+        def run():
+            with app.test_request_context("/", method="POST", data=raw, content_type="application/json"):
+                return request.json
+        return run
+
+    def flask_response(body):
+        def run():
+            with app.app_context():
+                return jsonify(body).get_data()
+        return run
+
+    for name, body in bodies.items():
+        benchmarks[f"flask.request_json.{name}"] = flask_request(body)
+    for name, body in responses.items():
+        benchmarks[f"flask.jsonify.{name}"] = flask_response(body)
+
+    return benchmarks
+
+
+def measure(fn, min_time, repeat):
+    """Медиана и минимум времени одной операции (в микросекундах)"""
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+        "min_us": round(min(timings) * 1e6, 3),
+        "number": number,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Вывод сравнения с эталоном; возвращает список ухудшившихся замеров"""
+    regressions = []
+    print(f"\n{'замер':<42} {'эталон, мкс':>12} {'сейчас, мкс':>12} {'изменение':>10}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        change = result["min_us"] / reference["min_us"] - 1
+        mark = ""
+        if name in UNSTABLE:
+            mark = "  (не проверяется)"
+        elif change > threshold:
+            regressions.append(name)
+            mark = "  РЕГРЕССИЯ"
+        print(f"{name:<42} {reference['min_us']:>12.2f} {result['min_us']:>12.2f} {change:>+9.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="*", help="шаблон имён замеров, например 'pkcs1_15.*'")
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность одного повтора, с")
+    parser.add_argument("--repeat", type=int, default=5, help="число повторов")
+    parser.add_argument("--save", help="сохранить результаты как эталон в файл JSON")
+    parser.add_argument("--compare", help="сравнить с эталоном из файла JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое ухудшение (доля от эталона)")
+    args = parser.parse_args()
+
+    benchmarks = {
+        name: fn for name, fn in build_benchmarks().items()
+        if fnmatch.fnmatch(name, args.filter)
+    }
+
+    results = {}
+    print(f"{'замер':<42} {'медиана, мкс':>13} {'минимум, мкс':>13}")
+    for name, fn in benchmarks.items():
+        # Длительность генерации ключа RSA сильно меняется от раза к разу: повтор делается длиннее
+        min_time = args.min_time * 5 if name == "rsa.generate_2048" else args.min_time
+        results[name] = measure(fn, min_time, args.repeat)
+        print(f"{name:<42} {results[name]['median_us']:>13.2f} {results[name]['min_us']:>13.2f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "pycryptodome": Crypto.__version__,
+                    "cpu_count": os.cpu_count(),
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nЭталон сохранён в {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nУхудшение больше {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\nУхудшений больше {args.threshold:.0%} нет")
+
+
+if __name__ == "__main__":
+    main()
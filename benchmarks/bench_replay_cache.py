@@ -0,0 +1,75 @@
+"""Нагрузочный тест кэша повторов протокола с меткой времени.
+
+Моделирует поток входов с заданной частотой (по умолчанию 10 000 в секунду)
+на протяжении нескольких окон допустимого расхождения времени и измеряет
+скорость проверки, число записей и потребление памяти в установившемся режиме.
+Предел числа записей по умолчанию - тот же, что у сервера при тех же
+TIMESTAMP_WINDOW и REPLAY_CACHE_RATE по умолчанию.
+
+    python benchmarks/bench_replay_cache.py --rate 10000 --seconds 900 --window 300
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+
+from replay_cache import DEFAULT_RATE, ReplayCache, ReplayCacheFull, capacity_for_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=DEFAULT_RATE, help="входов в секунду")
+    parser.add_argument("--seconds", type=int, default=900, help="моделируемая длительность")
+    parser.add_argument("--window", type=int, default=300, help="окно допустимого расхождения времени")
+    parser.add_argument("--max-entries", type=int, default=0,
+                        help="предел числа записей (0 - как у сервера по умолчанию)")
+    parser.add_argument("--replay-ratio", type=float, default=0.1, help="доля повторно присланных подписей")
+    args = parser.parse_args()
+
+    max_entries = args.max_entries or capacity_for_rate(DEFAULT_RATE, args.window)
+    now = [1700000000.0]
+    cache = ReplayCache(window=args.window, max_entries=max_entries, clock=lambda: now[0])
+    replay_every = int(1 / args.replay_ratio) if args.replay_ratio else 0
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    accepted = replayed = full = 0
+    peak_size = 0
+    start = time.perf_counter()
+
+    for second in range(args.seconds):
+        now[0] += 1
+        timestamp = int(now[0])
+        for i in range(args.rate):
+            client_id = f"dev-{second}-{i}"
+            if replay_every and i % replay_every == 0 and i:
+                # Повтор предыдущего входа той же секунды
+                client_id = f"dev-{second}-{i - 1}"
+
+            if cache.seen(client_id, timestamp):
+                replayed += 1
+                continue
+            try:
+                if cache.add(client_id, timestamp):
+                    accepted += 1
+                else:
+                    replayed += 1
+            except ReplayCacheFull:
+                full += 1
+        peak_size = max(peak_size, len(cache))
+
+    elapsed = time.perf_counter() - start
+    total = args.rate * args.seconds
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"Входов: {total}, принято: {accepted}, повторов отклонено: {replayed}, отказов при заполнении: {full}")
+    print(f"Скорость проверки: {total / elapsed:,.0f} входов/с ({elapsed / total * 1e6:.2f} мкс на вход)")
+    print(f"Записей в установившемся режиме: {len(cache)}, максимум: {peak_size}, предел: {max_entries}")
+    print(f"Прирост пикового RSS: {(rss_after - rss_before) / 1024:.1f} МБ "
+          f"(~{(rss_after - rss_before) * 1024 / max(peak_size, 1):.0f} байт на запись)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Размер сообщений протоколов и стоимость их разбора в JSON и MessagePack.
+
+    python benchmarks/bench_wire.py --algorithm rsa --batch 100
+
+Для каждого сообщения выводится размер тела и время кодирования и разбора,
+включая получение двоичных полей (base64 подписи в JSON, DER ключа в MessagePack),
+т.е. работу, которую выполняют обработчики сервера.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common import wire
+from common.signatures import ALGORITHMS, export_public_der, export_public_pem, get_algorithm
+
+
+def build_messages(algorithm, batch):
+    """Сообщения протоколов для каждого формата: {имя: (тело, поля подписи)}"""
+    key = algorithm.generate()
+    signer = algorithm.signer(key)
+    timestamp = int(time.time())
+    client_id = "device-000123"
+    signature = signer.sign(f"{client_id}:{timestamp}".encode())
+
+    messages = {
+        "register": {"client_id": client_id, "algorithm": algorithm.name},
+        "auth_timestamp": {"client_id": client_id, "timestamp": timestamp, "signature": signature},
+        "auth_challenge_verify": {"client_id": client_id, "signature": signature},
+        "auth_mutual_response": {"status": "success", "server_nonce": 771204, "signature": signature},
+        "auth_success": {"status": "success", "message": "Аутентификация успешна",
+                         "session_token": "ZGV2aWNlLTAwMDEyM3wxNzAwMDAwMDAw.AAAAAAAAAAAAAAAAAAAAAA",
+                         "expires_in": 900},
+        f"auth_batch_{batch}": {"entries": [
+            {"client_id": f"device-{i:06d}", "timestamp": timestamp, "signature": signature}
+            for i in range(batch)
+        ]},
+    }
+    public_keys = {wire.JSON: export_public_pem(key), wire.MSGPACK: export_public_der(key)}
+    return messages, public_keys
+
+
+def read_fields(data):
+    """Извлечение двоичных полей так же, как это делают обработчики сервера"""
+    if "signature" in data:
+        wire.as_bytes(data["signature"])
+    if "public_key" in data:
+        wire.as_public_key_pem(data["public_key"])
+    for entry in data.get("entries", ()):
+        wire.as_bytes(entry["signature"], validate=True)
+
+
+def measure(fn, min_time):
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return elapsed / number
+        number *= 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algorithm", default="rsa", choices=list(ALGORITHMS))
+    parser.add_argument("--batch", type=int, default=100, help="число записей пакетного сообщения")
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность замера, с")
+    args = parser.parse_args()
+
+    if wire.MSGPACK not in wire.MIMETYPES:
+        sys.exit("Для сравнения нужен пакет msgpack: pip install msgpack")
+
+    messages, public_keys = build_messages(get_algorithm(args.algorithm), args.batch)
+
+    print(f"Алгоритм: {args.algorithm}")
+    print(f"{'сообщение':<24} {'формат':<8} {'размер, Б':>10} {'кодирование, мкс':>17} {'разбор, мкс':>12}")
+    for name, message in messages.items():
+        sizes = {}
+        for label, mimetype in (("json", wire.JSON), ("msgpack", wire.MSGPACK)):
+            if name == "register":
+                message = {**message, "public_key": public_keys[mimetype]}
+            body = wire.encode(message, mimetype)
+            sizes[label] = len(body)
+            encode_time = measure(lambda: wire.encode(message, mimetype), args.min_time)
+            decode_time = measure(lambda: read_fields(wire.decode(body, mimetype)), args.min_time)
+            print(f"{name:<24} {label:<8} {len(body):>10} {encode_time * 1e6:>17.2f} {decode_time * 1e6:>12.2f}")
+        print(f"{'':<24} {'экономия':<8} {1 - sizes['msgpack'] / sizes['json']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
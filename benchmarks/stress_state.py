@@ -0,0 +1,212 @@
+"""Нагрузочная проверка состояния сервера при параллельных запросах.
+
+    python benchmarks/stress_state.py --threads 16 --clients 200 --rounds 20
+
+Три части:
+
+1. Хранилище nonce: потоки одновременно гасят одни и те же nonce; каждый
+   nonce должен быть погашен ровно одним потоком.
+2. Обработчики сервера (без HTTP, реестр в памяти): для каждого клиента
+   параллельно выполняются запрос-ответ и взаимная аутентификация, а
+   подтверждения отправляются несколькими потоками одновременно. Оба
+   протокола должны завершаться успешно, а каждое подтверждение - приниматься
+   ровно один раз.
+3. Пропускная способность выдачи и погашения nonce разными клиентами при
+   одной общей блокировке (--shards 1) и при разделении на сегменты.
+
+С флагом --shared части 1 и 3 выполняются для общего хранилища nonce в SQLite
+(многопроцессный режим prefork.py). При нарушении инварианта скрипт
+завершается с ненулевым кодом.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from nonce_store import NonceStore
+from shared_state import SharedNonceStore, StateDatabase
+
+
+def run_threads(threads, target):
+    """Одновременный запуск target(index) в threads потоках"""
+    barrier = threading.Barrier(threads)
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def make_store(args, capacity, shards):
+    if args.shared:
+        path = os.path.join(tempfile.mkdtemp(), "shared_state.db")
+        return SharedNonceStore(StateDatabase(path), capacity=capacity)
+    return NonceStore(capacity=capacity, shards=shards)
+
+
+def check_consume(args):
+    store = make_store(args, args.clients * 4, 64)
+    keys = [(f"client-{i}", "challenge") for i in range(args.clients)]
+    failures = 0
+
+    for round_number in range(args.rounds):
+        for key in keys:
+            store[key] = round_number
+        consumed = [0] * len(keys)
+        lock = threading.Lock()
+
+        def consume(_):
+            for i, key in enumerate(keys):
+                if store.consume(key, round_number):
+                    with lock:
+                        consumed[i] += 1
+
+        run_threads(args.threads, consume)
+        failures += sum(1 for count in consumed if count != 1)
+
+    print(f"1. Погашение nonce: {args.rounds * len(keys)} nonce, {args.threads} потоков, "
+          f"нарушений: {failures}")
+    return failures == 0
+
+
+def check_handlers(args):
+    os.environ["REGISTRY_PATH"] = ""
+    # Подтверждения одного клиента отправляются чаще любого разумного предела частоты
+    os.environ["ADMISSION_CLIENT_RATE"] = "0"
+    os.environ.setdefault("SERVER_KEY_ALGORITHM", "ed25519")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import server
+    from common.signatures import export_public_pem, get_algorithm
+
+    server.generate_server_keys()
+    server.server_keys.load()
+
+    algorithm = get_algorithm("ed25519")
+    signers = {}
+    for i in range(args.clients):
+        client_id = f"stress-{i}"
+        key = algorithm.generate()
+        body, status = server.handle_register({
+            "client_id": client_id, "public_key": export_public_pem(key), "algorithm": algorithm.name
+        })
+        assert status == 200, body
+        signers[client_id] = algorithm.signer(key)
+
+    submissions = 3
+    stats = {"challenge": [0, 0], "mutual": [0, 0], "duplicates": 0}
+    lock = threading.Lock()
+
+    def record(protocol, ok):
+        with lock:
+            stats[protocol][0 if ok else 1] += 1
+
+    def challenge(client_id):
+        body, _ = server.handle_auth_challenge({"client_id": client_id})
+        signature = signers[client_id].sign(str(body["nonce"]).encode())
+        return lambda: server.handle_auth_challenge_verify({"client_id": client_id, "signature": signature})
+
+    def mutual(client_id):
+        body, _ = server.handle_auth_mutual({"client_id": client_id, "client_nonce": 42})
+        message = f"{client_id}:42:{body['server_nonce']}".encode()
+        signature = signers[client_id].sign(message)
+        return lambda: server.handle_auth_mutual_verify({"client_id": client_id, "signature": signature})
+
+    def session(client_id, protocol):
+        # Одно и то же подтверждение отправляется несколькими потоками одновременно
+        start = challenge if protocol == "challenge" else mutual
+        verify = start(client_id)
+        with ThreadPoolExecutor(submissions) as executor:
+            results = list(executor.map(lambda _: verify()[1] == 200, range(submissions)))
+        record(protocol, results.count(True) == 1)
+        if results.count(True) > 1:
+            with lock:
+                stats["duplicates"] += results.count(True) - 1
+
+    def worker(index):
+        for round_number in range(args.rounds):
+            for i in range(index, args.clients, args.threads):
+                client_id = f"stress-{i}"
+                # Оба протокола одного клиента выполняются одновременно
+                both = [
+                    threading.Thread(target=session, args=(client_id, "challenge")),
+                    threading.Thread(target=session, args=(client_id, "mutual"))
+                ]
+                for thread in both:
+                    thread.start()
+                for thread in both:
+                    thread.join()
+
+    start = time.perf_counter()
+    run_threads(args.threads, worker)
+    elapsed = time.perf_counter() - start
+
+    total = args.rounds * args.clients
+    print(f"2. Обработчики: {total} пар сессий за {elapsed:.1f} с; "
+          f"запрос-ответ успешно/ошибок: {stats['challenge'][0]}/{stats['challenge'][1]}, "
+          f"взаимная: {stats['mutual'][0]}/{stats['mutual'][1]}, "
+          f"повторно принятых подтверждений: {stats['duplicates']}")
+    return stats["challenge"][1] == 0 and stats["mutual"][1] == 0 and stats["duplicates"] == 0
+
+
+def measure_throughput(args):
+    print(f"3. Выдача и погашение nonce, {args.threads} потоков:")
+    per_thread = max(1, args.ops // args.threads)
+    for shards in [0] if args.shared else args.shards:
+        store = make_store(args, args.ops * 2, shards)
+
+        def worker(index):
+            for i in range(per_thread):
+                key = (f"client-{index}-{i}", "challenge")
+                store[key] = i
+                store.consume(key, i)
+
+        start = time.perf_counter()
+        run_threads(args.threads, worker)
+        elapsed = time.perf_counter() - start
+        label = "общая база" if args.shared else f"сегментов {shards:>3}"
+        print(f"   {label}: {per_thread * args.threads / elapsed:>10,.0f} пар операций/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16, help="число параллельных потоков")
+    parser.add_argument("--clients", type=int, default=200, help="число клиентов")
+    parser.add_argument("--rounds", type=int, default=20, help="число повторов")
+    parser.add_argument("--ops", type=int, default=200000, help="число операций при измерении скорости")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 64], help="числа сегментов для сравнения")
+    parser.add_argument("--shared", action="store_true", help="общее хранилище nonce в SQLite")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        ok = check_consume(args)
+        ok = check_handlers(args) and ok
+        os.chdir(ROOT)
+    measure_throughput(args)
+
+    if not ok:
+        print("Обнаружены нарушения")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
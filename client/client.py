@@ -1,280 +1,816 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import functools
 import time
 import os
+import sys
 import random
-from Crypto.PublicKey import RSA
-from Crypto.Signature import pkcs1_15
-from Crypto.Hash import SHA256
-import base64
+import secrets
+import threading
+
+# Общие модули клиента и сервера находятся в каталоге common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.signatures import (
+    ALGORITHMS, DEFAULT_ALGORITHM, get_algorithm, algorithm_for_key,
+    import_key, import_own_private_key, export_private_pem, export_public_pem, export_public_der,
+    public_key_of, public_key_fingerprint
+)
+from common import wire
+from endpoints import FAILOVER_STATUSES, EndpointPool, endpoint_url
 
 # Пути к ключам
 CLIENT_PRIVATE_KEY_PATH = "client_private_key.pem"
 CLIENT_PUBLIC_KEY_PATH = "client_public_key.pem"
 SERVER_PUBLIC_KEY_PATH = "server_public_key.pem"
 
+
+def client_key_paths(algorithm_name):
+    """Пути к ключам клиента для алгоритма (ключи RSA хранятся по прежним путям)"""
+    if algorithm_name == DEFAULT_ALGORITHM:
+        return CLIENT_PRIVATE_KEY_PATH, CLIENT_PUBLIC_KEY_PATH
+    return f"client_private_key_{algorithm_name}.pem", f"client_public_key_{algorithm_name}.pem"
+
+# За сколько секунд до истечения токена сессии он продлевается
+SESSION_REFRESH_MARGIN = 60
+
+# Параметры HTTP-соединений по умолчанию: таймауты (подключение, ответ) в секундах
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3
+
+# Формат сообщений по умолчанию (json или msgpack)
+DEFAULT_WIRE_FORMAT = "json"
+
+# Размер частей, которыми читается ответ /message/stream
+MESSAGE_STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Период (в секундах) активной проверки серверов, если их несколько
+DEFAULT_PROBE_INTERVAL = 10
+
+
+def failover(operation):
+    """Выполнение операции клиента на выбранном сервере с переходом на другой при отказе"""
+    @functools.wraps(operation)
+    def wrapper(self, *args, **kwargs):
+        return self.run_with_failover(operation, self, *args, **kwargs)
+    return wrapper
+
 class Client:
-    def __init__(self, client_id, server_ip="127.0.0.1", server_port=8080):
+    def __init__(self, client_id, server_ip="127.0.0.1", server_port=8080, algorithm=DEFAULT_ALGORITHM,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF, wire_format=DEFAULT_WIRE_FORMAT, verbose=True,
+                 handshake=False, keystore=None, servers=None, probe_interval=DEFAULT_PROBE_INTERVAL):
         self.client_id = client_id
-        self.server_url = f"http://{server_ip}:{server_port}"
+        self.verbose = verbose
+        # Серверы ("host", "host:port" или URL); без списка - один сервер server_ip:server_port
+        self.endpoints = EndpointPool([endpoint_url(server, server_port) for server in servers or [server_ip]])
+        self.endpoint = self.endpoints.select()
+        # Отказал ли сервер во время операции и глубина вложенных операций (см. run_with_failover)
+        self.endpoint_failed = False
+        self.operation_depth = 0
+        self.handshake = handshake
+        self.algorithm = get_algorithm(algorithm)
+        self.private_key_path, self.public_key_path = client_key_paths(self.algorithm.name)
+        # Хранилище ключей по client_id (keystore.KeyStore); без него используется
+        # общая для рабочего каталога пара ключей
+        self.keystore = keystore
+        self.private_key = None
+        self.signer = None
         self.server_public_key = None
+        self.server_algorithm = None
+        self.server_verifier = None
+        self.server_key_fingerprint = None
+        self.timeout = timeout
+        self.session = self.create_session(pool_size, retries, backoff_factor)
+        # Формат тел запросов и ответов: json или компактный двоичный msgpack
+        self.wire_mimetype = wire.get_mimetype(wire_format)
+        self.session.headers["Accept"] = self.wire_mimetype
+        if len(self.endpoints) > 1 and probe_interval:
+            self.endpoints.start_probing(probe_interval, timeout)
+        self.server_public_key_etag = None
         self.is_authenticated = False
-        self.generate_keys()
-        self.fetch_server_public_key()
-        self.register()
+        self.session_token = None
+        self.session_expires_at = 0
+        self.last_auth_method = None
+        # Последняя метка времени, подписанная для входа (см. next_timestamp)
+        self.last_timestamp = None
+        self.timestamp_lock = threading.Lock()
+        # Серверы, на которых подтверждена регистрация ключа клиента (см. registered)
+        self.registered_urls = set()
+        if keystore is not None:
+            self.load_keys_from_keystore()
+        else:
+            self.generate_keys()
+            self.load_keys()
+        if handshake:
+            # Без запросов при создании: ключ сервера берётся из прошлого запуска, а
+            # регистрация выполняется вместе с первым входом (authenticate_handshake)
+            self.load_server_public_key()
+        else:
+            self.fetch_server_public_key()
+            self.register()
+    
+    def log(self, *args):
+        """Вывод сообщения о ходе работы (отключается параметром verbose=False)"""
+        if self.verbose:
+            print(*args)
+    
+    @staticmethod
+    def create_session(pool_size, retries, backoff_factor):
+        """HTTP-сессия с пулом keep-alive соединений и повторами с экспоненциальной задержкой.
+        
+        Ошибки подключения повторяются для всех запросов (запрос ещё не отправлен),
+        ответы 502/503/504 - только для GET, так как POST аутентификации меняют
+        состояние сервера.
+        """
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    @property
+    def server_url(self):
+        """URL текущего сервера"""
+        return self.endpoint.url
+    
+    @property
+    def registered(self):
+        """Подтверждена ли регистрация ключа клиента на текущем сервере"""
+        return self.endpoint.url in self.registered_urls
+    
+    @registered.setter
+    def registered(self, value):
+        if value:
+            self.registered_urls.add(self.endpoint.url)
+        else:
+            self.registered_urls.discard(self.endpoint.url)
+    
+    def request(self, method, path, **kwargs):
+        """HTTP-запрос к текущему серверу с учётом времени ответа и отказов сервера"""
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = self.endpoint
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{endpoint.url}{path}", **kwargs)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            # Соединение разорвано до получения ответа целиком - сервер считается отказавшим
+            self.endpoints.record_failure(endpoint)
+            self.endpoint_failed = True
+            raise
+        if response.status_code in FAILOVER_STATUSES:
+            self.endpoints.record_failure(endpoint)
+            self.endpoint_failed = True
+        else:
+            self.endpoints.record(endpoint, path, time.perf_counter() - start)
+        return response
+    
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+    
+    def post(self, path, body=None, **kwargs):
+        """POST-запрос; тело body кодируется в выбранном формате сообщений"""
+        if body is not None:
+            kwargs["data"] = wire.encode(body, self.wire_mimetype)
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Content-Type": self.wire_mimetype}
+        return self.request("POST", path, **kwargs)
+    
+    def run_with_failover(self, operation, *args, retry=True, **kwargs):
+        """Выполнение операции на выбранном сервере; при отказе сервера во время
+        операции она повторяется на следующем (каждый сервер - не больше раза).
+        
+        Многошаговые входы (запрос-ответ) хранят состояние на сервере, поэтому
+        повторяется вся операция, а не отдельный запрос. Вложенные операции
+        (например, повторный вход при отправке сообщения) выполняются на сервере
+        внешней операции. С retry=False операция не повторяется, но следующая
+        уже выполняется на другом сервере.
+        """
+        if self.operation_depth:
+            return operation(*args, **kwargs)
+        
+        self.operation_depth += 1
+        try:
+            self.use_endpoint(self.endpoints.select(self.endpoint))
+            for _ in range(len(self.endpoints) if retry else 1):
+                self.endpoint_failed = False
+                result = operation(*args, **kwargs)
+                if not self.endpoint_failed:
+                    break
+                failed = self.endpoint
+                self.use_endpoint(self.endpoints.select(failed))
+                if self.endpoint is failed or not retry:
+                    break
+                self.log(f"Сервер {failed.url} недоступен, переход на {self.endpoint.url}")
+            return result
+        finally:
+            self.operation_depth -= 1
+    
+    def use_endpoint(self, endpoint):
+        """Переход на другой сервер"""
+        if endpoint is self.endpoint:
+            return
+        self.endpoint = endpoint
+        # Ключ и реестр клиентов у серверов могут быть разными: клиент без рукопожатия
+        # перепроверяет ключ по ETag и регистрируется на новом сервере, а рукопожатие
+        # само получает ключ по отпечатку и передаёт ключ клиента. Токен сессии
+        # сохраняется: серверы с общим SESSION_SECRET его примут, а иначе клиент войдёт
+        # заново при ответе 401 (reauthenticate)
+        if not self.handshake:
+            if self.server_public_key is not None:
+                self.fetch_server_public_key()
+            if self.registered_urls and not self.registered:
+                self.register()
+    
+    @staticmethod
+    def read(response):
+        """Разбор тела ответа в формате из заголовка Content-Type"""
+        mimetype = response.headers.get("Content-Type", "").split(";")[0].strip()
+        return wire.decode(response.content, wire.MSGPACK if mimetype == wire.MSGPACK else wire.JSON)
+    
+    def close(self):
+        """Закрытие соединений с сервером"""
+        self.endpoints.stop_probing()
+        self.session.close()
     
     def generate_keys(self):
         """Генерация ключевой пары клиента, если она не существует"""
-        if not os.path.exists(CLIENT_PRIVATE_KEY_PATH):
-            print("Генерация ключей RSA для клиента...")
-            key = RSA.generate(2048)
+        if not os.path.exists(self.private_key_path):
+            self.log(f"Генерация ключей {self.algorithm.name} для клиента...")
+            key = self.algorithm.generate()
             
             # Сохранение приватного ключа
-            with open(CLIENT_PRIVATE_KEY_PATH, "wb") as f:
-                f.write(key.export_key())
+            with open(self.private_key_path, "w") as f:
+                f.write(export_private_pem(key))
             
             # Сохранение публичного ключа
-            with open(CLIENT_PUBLIC_KEY_PATH, "wb") as f:
-                f.write(key.publickey().export_key())
+            with open(self.public_key_path, "w") as f:
+                f.write(export_public_pem(key))
             
-            print("Ключи клиента сгенерированы и сохранены")
+            self.log("Ключи клиента сгенерированы и сохранены")
     
     def load_private_key(self):
-        """Загрузка приватного ключа клиента"""
-        with open(CLIENT_PRIVATE_KEY_PATH, "rb") as f:
-            return RSA.import_key(f.read())
+        """Загрузка приватного ключа клиента (собственный ключ разбирается без долгой проверки)"""
+        with open(self.private_key_path, "rb") as f:
+            return import_own_private_key(f.read())
     
     def load_public_key(self):
         """Загрузка публичного ключа клиента"""
-        with open(CLIENT_PUBLIC_KEY_PATH, "rb") as f:
-            return RSA.import_key(f.read())
+        if self.keystore is not None:
+            return public_key_of(self.private_key)
+        with open(self.public_key_path, "rb") as f:
+            return import_key(f.read())
     
+    def export_public_key(self, public_key):
+        """Публичный ключ для отправки: DER в двоичном формате, PEM в JSON"""
+        if self.wire_mimetype == wire.MSGPACK:
+            return export_public_der(public_key)
+        return export_public_pem(public_key)
+    
+    def load_keys(self):
+        """Однократная загрузка ключа клиента и подготовка объекта подписи"""
+        self.private_key = self.load_private_key()
+        self.signer = self.algorithm.signer(self.private_key)
+    
+    def load_keys_from_keystore(self):
+        """Ключ клиента из хранилища; новый ключ берётся из запаса хранилища"""
+        self.private_key, created = self.keystore.get_or_create(self.client_id, self.algorithm.name)
+        self.signer = self.algorithm.signer(self.private_key)
+        if created:
+            self.log(f"Ключ {self.algorithm.name} клиента {self.client_id} создан в хранилище")
+    
+    def sign(self, message):
+        """Подпись сообщения приватным ключом клиента"""
+        return self.signer.sign(message)
+    
+    def set_server_public_key(self, public_key, etag=None):
+        """Установка ключа сервера и подготовка объекта проверки его подписей"""
+        self.server_public_key = public_key
+        self.server_algorithm = algorithm_for_key(public_key)
+        self.server_verifier = self.server_algorithm.verifier(public_key)
+        self.server_key_fingerprint = public_key_fingerprint(public_key)
+        self.server_public_key_etag = etag
+    
+    def save_server_public_key(self):
+        """Сохранение публичного ключа сервера"""
+        with open(SERVER_PUBLIC_KEY_PATH, "w") as f:
+            f.write(export_public_pem(self.server_public_key))
+    
+    def load_server_public_key(self):
+        """Загрузка сохранённого ранее публичного ключа сервера, если он есть"""
+        try:
+            with open(SERVER_PUBLIC_KEY_PATH, "rb") as f:
+                self.set_server_public_key(import_key(f.read()))
+        except FileNotFoundError:
+            pass
+        except (ValueError, IndexError, TypeError) as e:
+            self.log(f"Ошибка чтения сохранённого ключа сервера: {e}")
+    
+    @failover
     def fetch_server_public_key(self):
         """Получение публичного ключа сервера"""
         try:
-            response = requests.get(f"{self.server_url}/get_server_public_key")
-            if response.status_code == 200:
-                server_public_key_str = response.json()["public_key"]
-                self.server_public_key = RSA.import_key(server_public_key_str)
-                
-                # Сохранение публичного ключа сервера
-                with open(SERVER_PUBLIC_KEY_PATH, "wb") as f:
-                    f.write(self.server_public_key.export_key())
+            # Повторная проверка уже полученного ключа по ETag
+            headers = {}
+            if self.server_public_key is not None and self.server_public_key_etag:
+                headers["If-None-Match"] = self.server_public_key_etag
+            
+            response = self.get("/get_server_public_key", headers=headers)
+            if response.status_code == 304:
+                self.log("Публичный ключ сервера не изменился")
+            elif response.status_code == 200:
+                # Ключ приходит в PEM (JSON) или в DER (MessagePack)
+                self.set_server_public_key(
+                    import_key(self.read(response)["public_key"]),
+                    response.headers.get("ETag")
+                )
+                self.save_server_public_key()
                 
-                print("Публичный ключ сервера получен и сохранен")
+                self.log("Публичный ключ сервера получен и сохранен")
             else:
-                print(f"Ошибка получения ключа сервера: {response.json()}")
+                self.log(f"Ошибка получения ключа сервера: {self.read(response)}")
         except Exception as e:
-            print(f"Ошибка при получении публичного ключа сервера: {e}")
+            self.log(f"Ошибка при получении публичного ключа сервера: {e}")
     
+    @failover
     def register(self):
         """Регистрация клиента на сервере"""
         try:
             public_key = self.load_public_key()
             
-            response = requests.post(
-                f"{self.server_url}/register",
-                json={
+            response = self.post(
+                "/register",
+                {
                     "client_id": self.client_id,
-                    "public_key": public_key.export_key().decode()
+                    "public_key": self.export_public_key(public_key),
+                    "algorithm": self.algorithm.name
                 }
             )
             
             if response.status_code == 200:
-                print("Клиент успешно зарегистрирован на сервере")
+                self.registered = True
+                self.log("Клиент успешно зарегистрирован на сервере")
             else:
-                print(f"Ошибка регистрации: {response.json()}")
+                self.log(f"Ошибка регистрации: {self.read(response)}")
         except Exception as e:
-            print(f"Ошибка при регистрации клиента: {e}")
+            self.log(f"Ошибка при регистрации клиента: {e}")
+    
+    def timestamp_delay(self):
+        """Время (в секундах) до метки, с которой клиент может снова войти по протоколу 1"""
+        if self.last_timestamp is None:
+            return 0.0
+        return max(0.0, self.last_timestamp + 1 - time.time())
+    
+    def next_timestamp(self):
+        """Метка времени для входа по протоколу 1.
+        
+        Сервер принимает от клиента один вход на метку, то есть не больше
+        одного входа в секунду; повторный вход в ту же секунду (например,
+        после перехода на другой сервер) ждёт следующей секунды."""
+        with self.timestamp_lock:
+            time.sleep(self.timestamp_delay())
+            timestamp = int(time.time())
+            if self.last_timestamp is not None:
+                timestamp = max(timestamp, self.last_timestamp + 1)
+            self.last_timestamp = timestamp
+            return timestamp
+    
+    def make_timestamp_entry(self):
+        """Формирование подписанной записи для аутентификации с меткой времени"""
+        # Текущее время, но не та же секунда, что у предыдущего входа
+        timestamp = self.next_timestamp()
+        
+        # Формирование сообщения
+        message = f"{self.client_id}:{timestamp}".encode()
+        
+        # Подписание сообщения приватным ключом
+        signature = self.sign(message)
+        
+        return {
+            "client_id": self.client_id,
+            "timestamp": timestamp,
+            "signature": signature
+        }
+    
+    def make_challenge_entry(self, nonce):
+        """Формирование подписанной записи для ответа на nonce сервера"""
+        signature = self.sign(str(nonce).encode())
+        
+        return {
+            "client_id": self.client_id,
+            "nonce": nonce,
+            "signature": signature
+        }
+    
+    def make_handshake_entry(self):
+        """Формирование подписанного запроса рукопожатия (/auth/handshake)"""
+        timestamp = int(time.time())
+        client_nonce = secrets.token_hex(16)
+        entry = {
+            "client_id": self.client_id,
+            "timestamp": timestamp,
+            "client_nonce": client_nonce,
+            "signature": self.sign(f"handshake:{self.client_id}:{timestamp}:{client_nonce}".encode())
+        }
+        
+        # Пока регистрация не подтверждена, ключ клиента передаётся вместе со входом
+        if not self.registered:
+            entry["public_key"] = self.export_public_key(self.load_public_key())
+            entry["algorithm"] = self.algorithm.name
+        
+        # Сервер пришлёт свой ключ, только если отпечаток не совпадает с текущим
+        if self.server_key_fingerprint is not None:
+            entry["server_key_fingerprint"] = self.server_key_fingerprint
+        return entry
+    
+    def store_session(self, data):
+        """Сохранение токена сессии из ответа сервера на успешную аутентификацию"""
+        self.session_token = data["session_token"]
+        self.session_expires_at = time.time() + data["expires_in"]
+        self.is_authenticated = True
+    
+    def refresh_session(self):
+        """Продление токена сессии; при неудаче выполняется повторная аутентификация"""
+        if self.session_token and time.time() < self.session_expires_at:
+            try:
+                response = self.post(
+                    "/auth/refresh",
+                    headers={"Authorization": f"Bearer {self.session_token}"}
+                )
+                if response.status_code == 200:
+                    self.store_session(self.read(response))
+                    return True
+            except Exception as e:
+                self.log(f"Ошибка при продлении сессии: {e}")
+        
+        # Токен истёк или не принят - повторяем последний способ аутентификации
+        return self.reauthenticate()
+    
+    def reauthenticate(self):
+        """Повторная аутентификация последним способом, например на другом сервере,
+        который не принимает токен сессии"""
+        self.is_authenticated = False
+        if self.last_auth_method is None:
+            return False
+        if self.last_auth_method():
+            return True
+        # На другом сервере клиент может быть не зарегистрирован (рукопожатие
+        # в этом случае само передаёт ключ клиента)
+        if self.last_auth_method == self.authenticate_handshake:
+            return False
+        self.register()
+        return self.registered and self.last_auth_method()
     
+    @failover
     def authenticate_with_timestamp(self):
         """Аутентификация с использованием метки времени"""
         try:
-            # Получение текущего времени
-            timestamp = int(time.time())
-            
-            # Формирование сообщения
-            message = f"{self.client_id}:{timestamp}".encode()
-            
-            # Хеширование сообщения
-            h = SHA256.new(message)
-            
-            # Подписание хеша приватным ключом
-            private_key = self.load_private_key()
-            signature = pkcs1_15.new(private_key).sign(h)
-            
-            # Кодирование подписи в base64
-            signature_b64 = base64.b64encode(signature).decode()
-            
-            # Отправка запроса на сервер
-            response = requests.post(
-                f"{self.server_url}/auth/timestamp",
-                json={
-                    "client_id": self.client_id,
-                    "timestamp": timestamp,
-                    "signature": signature_b64
-                }
+            # Отправка подписанной метки времени на сервер
+            response = self.post(
+                "/auth/timestamp",
+                self.make_timestamp_entry()
             )
             
             if response.status_code == 200:
-                print("Аутентификация по метке времени успешна")
-                self.is_authenticated = True
+                self.log("Аутентификация по метке времени успешна")
+                self.store_session(self.read(response))
+                self.last_auth_method = self.authenticate_with_timestamp
                 return True
             else:
-                print(f"Ошибка аутентификации: {response.json()}")
+                self.log(f"Ошибка аутентификации: {self.read(response)}")
                 return False
         except Exception as e:
-            print(f"Ошибка при аутентификации с меткой времени: {e}")
+            self.log(f"Ошибка при аутентификации с меткой времени: {e}")
             return False
     
+    @failover
     def authenticate_with_challenge(self):
         """Аутентификация с использованием случайных чисел (запрос-ответ)"""
         try:
             # Запрос случайного числа от сервера
-            response = requests.post(
-                f"{self.server_url}/auth/challenge",
-                json={"client_id": self.client_id}
+            response = self.post(
+                "/auth/challenge",
+                {"client_id": self.client_id}
             )
             
             if response.status_code != 200:
-                print(f"Ошибка при запросе nonce: {response.json()}")
+                self.log(f"Ошибка при запросе nonce: {self.read(response)}")
                 return False
             
             # Получение nonce
-            nonce = response.json()["nonce"]
-            print(f"Получен nonce от сервера: {nonce}")
+            nonce = self.read(response)["nonce"]
+            self.log(f"Получен nonce от сервера: {nonce}")
             
             # Формирование сообщения
             message = str(nonce).encode()
             
-            # Хеширование сообщения
-            h = SHA256.new(message)
-            
-            # Подписание хеша приватным ключом
-            private_key = self.load_private_key()
-            signature = pkcs1_15.new(private_key).sign(h)
-            
-            # Кодирование подписи в base64
-            signature_b64 = base64.b64encode(signature).decode()
+            # Подписание сообщения приватным ключом
+            signature = self.sign(message)
             
             # Отправка подписанного nonce на сервер
-            verify_response = requests.post(
-                f"{self.server_url}/auth/challenge/verify",
-                json={
+            verify_response = self.post(
+                "/auth/challenge/verify",
+                {
                     "client_id": self.client_id,
-                    "signature": signature_b64
+                    "signature": signature
                 }
             )
             
             if verify_response.status_code == 200:
-                print("Аутентификация по случайному числу успешна")
-                self.is_authenticated = True
+                self.log("Аутентификация по случайному числу успешна")
+                self.store_session(self.read(verify_response))
+                self.last_auth_method = self.authenticate_with_challenge
                 return True
             else:
-                print(f"Ошибка аутентификации: {verify_response.json()}")
+                self.log(f"Ошибка аутентификации: {self.read(verify_response)}")
                 return False
         except Exception as e:
-            print(f"Ошибка при аутентификации с случайным числом: {e}")
+            self.log(f"Ошибка при аутентификации с случайным числом: {e}")
             return False
     
+    @failover
     def authenticate_mutual(self):
         """Взаимная аутентификация с использованием случайных чисел"""
         try:
             # Генерация случайного числа клиента
             client_nonce = random.randint(100000, 999999)
-            print(f"Сгенерирован nonce клиента: {client_nonce}")
+            self.log(f"Сгенерирован nonce клиента: {client_nonce}")
             
             # Отправка ID клиента и его nonce на сервер
-            response = requests.post(
-                f"{self.server_url}/auth/mutual",
-                json={
+            response = self.post(
+                "/auth/mutual",
+                {
                     "client_id": self.client_id,
                     "client_nonce": client_nonce
                 }
             )
             
             if response.status_code != 200:
-                print(f"Ошибка при инициализации взаимной аутентификации: {response.json()}")
+                self.log(f"Ошибка при инициализации взаимной аутентификации: {self.read(response)}")
                 return False
             
             # Получение nonce сервера и его подписи
-            server_nonce = response.json()["server_nonce"]
-            server_signature_b64 = response.json()["signature"]
+            data = self.read(response)
+            server_nonce = data["server_nonce"]
             
-            print(f"Получен nonce сервера: {server_nonce}")
+            self.log(f"Получен nonce сервера: {server_nonce}")
             
             # Проверка подписи сервера
             message = f"{self.client_id}:{client_nonce}:{server_nonce}".encode()
-            h = SHA256.new(message)
             
             try:
-                # Декодирование подписи из base64
-                server_signature = base64.b64decode(server_signature_b64)
+                # Подпись приходит в base64 (JSON) или как есть (MessagePack)
+                server_signature = wire.as_bytes(data["signature"])
                 
-                # Проверка подписи сервера
-                pkcs1_15.new(self.server_public_key).verify(h, server_signature)
-                print("Подпись сервера верифицирована")
+                # Проверка подписи сервера алгоритмом его ключа
+                self.server_verifier.verify(message, server_signature)
+                self.log("Подпись сервера верифицирована")
             except (ValueError, TypeError):
-                print("Ошибка: неверная подпись сервера")
+                self.log("Ошибка: неверная подпись сервера")
                 return False
             
-            # Формирование сообщения для ответной подписи
-            message = f"{self.client_id}:{client_nonce}:{server_nonce}".encode()
-            h = SHA256.new(message)
-            
-            # Подписание хеша приватным ключом клиента
-            private_key = self.load_private_key()
-            signature = pkcs1_15.new(private_key).sign(h)
-            
-            # Кодирование подписи в base64
-            signature_b64 = base64.b64encode(signature).decode()
+            # Подписание того же сообщения приватным ключом клиента
+            signature = self.sign(message)
             
             # Отправка подписи на сервер
-            verify_response = requests.post(
-                f"{self.server_url}/auth/mutual/verify",
-                json={
+            verify_response = self.post(
+                "/auth/mutual/verify",
+                {
                     "client_id": self.client_id,
-                    "signature": signature_b64
+                    "signature": signature
                 }
             )
             
             if verify_response.status_code == 200:
-                print("Взаимная аутентификация успешна")
-                self.is_authenticated = True
+                self.log("Взаимная аутентификация успешна")
+                self.store_session(self.read(verify_response))
+                self.last_auth_method = self.authenticate_mutual
                 return True
             else:
-                print(f"Ошибка взаимной аутентификации: {verify_response.json()}")
+                self.log(f"Ошибка взаимной аутентификации: {self.read(verify_response)}")
                 return False
         except Exception as e:
-            print(f"Ошибка при взаимной аутентификации: {e}")
+            self.log(f"Ошибка при взаимной аутентификации: {e}")
             return False
     
+    @failover
+    def authenticate_handshake(self):
+        """Регистрация (при необходимости) и взаимная аутентификация одним запросом.
+        
+        В отличие от authenticate_mutual, которой вместе с получением ключа сервера
+        и регистрацией нужно четыре запроса, здесь нужен один: клиент подписывает
+        метку времени и своё случайное число, а сервер в ответе подписывает те же
+        данные и сразу выдаёт токен сессии.
+        """
+        try:
+            entry = self.make_handshake_entry()
+            response = self.post("/auth/handshake", entry)
+            
+            if response.status_code == 401 and self.registered:
+                # Сервер мог потерять регистрацию (например, реестр в памяти) - повтор с ключом
+                self.registered = False
+                entry = self.make_handshake_entry()
+                response = self.post("/auth/handshake", entry)
+            
+            if response.status_code != 200:
+                self.log(f"Ошибка рукопожатия: {self.read(response)}")
+                return False
+            
+            data = self.read(response)
+            if "server_public_key" in data:
+                self.set_server_public_key(import_key(data["server_public_key"]))
+                self.save_server_public_key()
+                self.log("Публичный ключ сервера получен и сохранен")
+            if self.server_verifier is None:
+                self.log("Ошибка: нет публичного ключа сервера")
+                return False
+            
+            # Проверка подписи сервера над ID, меткой времени и nonce клиента
+            message = f"handshake-server:{self.client_id}:{entry['timestamp']}:{entry['client_nonce']}".encode()
+            try:
+                self.server_verifier.verify(message, wire.as_bytes(data["signature"]))
+            except (ValueError, TypeError):
+                self.log("Ошибка: неверная подпись сервера")
+                return False
+            
+            self.registered = True
+            self.log("Взаимная аутентификация (рукопожатие) успешна")
+            self.store_session(data)
+            self.last_auth_method = self.authenticate_handshake
+            return True
+        except Exception as e:
+            self.log(f"Ошибка при рукопожатии: {e}")
+            return False
+    
+    @failover
+    def authenticate_batch(self, entries):
+        """Пакетная аутентификация записей нескольких клиентов одним запросом.
+        
+        entries - записи, полученные от make_timestamp_entry/make_challenge_entry
+        разных клиентов. Возвращает список результатов в порядке записей
+        или None при ошибке запроса.
+        """
+        try:
+            response = self.post(
+                "/auth/batch",
+                {"entries": list(entries)}
+            )
+            
+            if response.status_code != 200:
+                self.log(f"Ошибка пакетной аутентификации: {self.read(response)}")
+                return None
+            
+            data = self.read(response)
+            self.log(f"Пакетная аутентификация: успешно {data['authenticated']} из {len(data['results'])}")
+            
+            for result in data["results"]:
+                if result.get("client_id") == self.client_id and result.get("status") == "success":
+                    self.store_session(result)
+            return data["results"]
+        except Exception as e:
+            self.log(f"Ошибка при пакетной аутентификации: {e}")
+            return None
+    
+    def post_authorized(self, path, body=None, **kwargs):
+        """POST-запрос с токеном сессии. Если токен не принят (например, другим
+        сервером с другим секретом), клиент входит заново и повторяет запрос."""
+        headers = kwargs.pop("headers", {})
+        response = self.post(path, body, headers={**headers, "Authorization": f"Bearer {self.session_token}"},
+                             **kwargs)
+        if response.status_code == 401 and self.reauthenticate():
+            response.close()
+            response = self.post(path, body, headers={**headers, "Authorization": f"Bearer {self.session_token}"},
+                                 **kwargs)
+        return response
+    
+    def ensure_session(self):
+        """Проверка, что клиент аутентифицирован, с продлением токена сессии заранее, до его истечения"""
+        if not self.is_authenticated:
+            self.log("Ошибка: клиент не аутентифицирован")
+            return False
+        
+        if time.time() > self.session_expires_at - SESSION_REFRESH_MARGIN:
+            if not self.refresh_session():
+                self.log("Ошибка: не удалось продлить сессию")
+                return False
+        return True
+    
+    @failover
     def send_message(self, message):
         """Отправка сообщения на сервер"""
-        if not self.is_authenticated:
-            print("Ошибка: клиент не аутентифицирован")
+        if not self.ensure_session():
             return False
         
         try:
-            response = requests.post(
-                f"{self.server_url}/message",
-                json={
+            # Исходное сообщение есть у клиента, поэтому сервер его не возвращает
+            response = self.post_authorized(
+                "/message",
+                {
                     "client_id": self.client_id,
-                    "message": message
+                    "message": message,
+                    "echo": False
                 }
             )
             
             if response.status_code == 200:
-                data = response.json()
-                print(f"\nОтправлено: {data['original_message']}")
-                print(f"Получено (перевёрнутое): {data['reversed_message']}")
+                data = self.read(response)
+                self.log(f"\nОтправлено: {message}")
+                self.log(f"Получено (перевёрнутое): {data['reversed_message']}")
                 return True
             else:
-                print(f"Ошибка отправки сообщения: {response.json()}")
+                self.log(f"Ошибка отправки сообщения: {self.read(response)}")
                 return False
         except Exception as e:
-            print(f"Ошибка при отправке сообщения: {e}")
+            self.log(f"Ошибка при отправке сообщения: {e}")
             return False
+    
+    @failover
+    def send_messages(self, messages):
+        """Отправка нескольких сообщений одним запросом; возвращает список перевёрнутых
+        сообщений в том же порядке или None при ошибке"""
+        if not self.ensure_session():
+            return None
+        
+        try:
+            response = self.post_authorized(
+                "/message",
+                {
+                    "client_id": self.client_id,
+                    "messages": list(messages)
+                }
+            )
+            
+            if response.status_code == 200:
+                reversed_messages = self.read(response)["reversed_messages"]
+                self.log(f"\nОтправлено сообщений: {len(reversed_messages)}")
+                return reversed_messages
+            else:
+                self.log(f"Ошибка отправки сообщений: {self.read(response)}")
+                return None
+        except Exception as e:
+            self.log(f"Ошибка при отправке сообщений: {e}")
+            return None
+    
+    def send_message_stream(self, source, output=None, chunk_size=MESSAGE_STREAM_CHUNK_SIZE):
+        """Отправка большого сообщения по частям (/message/stream).
+        
+        source - строка, байты UTF-8, файл, открытый в двоичном режиме, или
+        итератор частей (строк или байтов). Перевёрнутый текст записывается
+        частями в двоичный файл output, а без него возвращается строкой.
+        Возвращает число байт ответа (при output) или строку; None при ошибке.
+        Файл и итератор читаются один раз, поэтому при отказе сервера отправка
+        не повторяется на другом.
+        """
+        if isinstance(source, str):
+            source = source.encode()
+        return self.run_with_failover(
+            self.stream_message, source, output, chunk_size, retry=isinstance(source, bytes)
+        )
+    
+    def stream_message(self, source, output, chunk_size):
+        if not self.ensure_session():
+            return None
+        
+        if not isinstance(source, bytes) and not hasattr(source, "read"):
+            # Итератор частей отправляется с Transfer-Encoding: chunked
+            source = (chunk.encode() if isinstance(chunk, str) else chunk for chunk in source)
+        
+        try:
+            # Повторный вход и повтор запроса при ответе 401 - только для байтов
+            post = self.post_authorized if isinstance(source, bytes) else self.post
+            with post(
+                "/message/stream",
+                data=source,
+                headers={
+                    "Content-Type": "text/plain; charset=utf-8",
+                    "Authorization": f"Bearer {self.session_token}"
+                },
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    self.log(f"Ошибка отправки сообщения: {self.read(response)}")
+                    return None
+                
+                if output is None:
+                    return response.content.decode()
+                size = 0
+                for chunk in response.iter_content(chunk_size):
+                    output.write(chunk)
+                    size += len(chunk)
+                self.log(f"\nПолучено (перевёрнутое): {size} байт")
+                return size
+        except Exception as e:
+            self.log(f"Ошибка при отправке сообщения: {e}")
+            return None
 
 def print_menu():
     print("\n=== Меню ===")
@@ -282,15 +818,21 @@ def print_menu():
     print("2. Односторонняя аутентификация с использованием случайных чисел")
     print("3. Взаимная аутентификация с использованием случайных чисел")
     print("4. Отправить сообщение")
+    print("5. Взаимная аутентификация одним запросом (рукопожатие)")
     print("0. Выход")
     choice = input("Выберите действие: ")
     return choice
 
 def main():
     client_id = input("Введите ID клиента: ")
-    server_ip = input("Введите IP-адрес сервера (по умолчанию 127.0.0.1): ") or "127.0.0.1"
+    servers = input(
+        "Введите IP-адреса серверов через запятую (host или host:port; по умолчанию 127.0.0.1): "
+    ) or "127.0.0.1"
+    algorithm = input(
+        f"Алгоритм подписи ({', '.join(ALGORITHMS)}; по умолчанию {DEFAULT_ALGORITHM}): "
+    ) or DEFAULT_ALGORITHM
     
-    client = Client(client_id, server_ip)
+    client = Client(client_id, servers=[server.strip() for server in servers.split(",")], algorithm=algorithm)
     
     while True:
         choice = print_menu()
@@ -307,8 +849,11 @@ def main():
                 continue
             message = input("Введите сообщение для отправки: ")
             client.send_message(message)
+        elif choice == "5":
+            client.authenticate_handshake()
         elif choice == "0":
             print("Выход из программы")
+            client.close()
             break
         else:
             print("Неверный выбор, пожалуйста, попробуйте снова")
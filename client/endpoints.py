@@ -0,0 +1,174 @@
+"""Выбор сервера из нескольких по задержке и доступности.
+
+Для каждого сервера хранится экспоненциально сглаженное среднее (EWMA)
+времени ответа, отдельно по маршрутам: вход с проверкой подписи дольше
+получения ключа сервера, и сравнивать их между собой нельзя. Задержки
+измеряются пассивно - по обычным запросам клиента, и активно - периодическими
+запросами GET /get_server_public_key ко всем серверам, так что у каждого
+сервера есть задержка хотя бы по этому маршруту.
+
+Сервер, который не ответил или ответил 502/503/504, считается недоступным на
+cooldown секунд, а при отказах подряд - на вдвое большее время, но не больше
+max_cooldown. Ответ на пробу или на обычный запрос возвращает его в работу.
+"""
+import math
+import threading
+import time
+
+import requests
+
+# Маршрут активной проверки серверов: отвечает без криптографии и обращения к реестру
+PROBE_PATH = "/get_server_public_key"
+
+# Ответы, после которых сервер считается недоступным
+FAILOVER_STATUSES = frozenset({502, 503, 504})
+
+
+def endpoint_url(server, default_port):
+    """URL сервера из "host", "host:port" или "http://host:port" """
+    if "://" in server:
+        return server.rstrip("/")
+    host, sep, port = server.rpartition(":")
+    # Адрес IPv6 без порта содержит двоеточия, но не заканчивается на "]:порт"
+    if not sep or not port.isdigit() or (":" in host and not host.endswith("]")):
+        return f"http://{server}:{default_port}"
+    return f"http://{server}"
+
+
+class Endpoint:
+    """Адрес сервера, задержки по маршрутам и состояние после отказов"""
+
+    def __init__(self, url):
+        self.url = url
+        # Маршрут -> EWMA времени ответа в секундах и число измерений
+        self.latency = {}
+        self.samples = {}
+        # Отказов подряд и до какого момента (time.monotonic) сервер не используется
+        self.failures = 0
+        self.down_until = 0.0
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r})"
+
+
+class EndpointPool:
+    """Серверы клиента: учёт задержек и отказов и выбор сервера для операции.
+
+    Пока текущий сервер доступен, он меняется на другой, только если тот
+    быстрее в switch_ratio раз по общему маршруту, - иначе близкие по задержке
+    серверы чередовались бы, и клиенту приходилось бы входить заново.
+    """
+
+    def __init__(self, urls, alpha=0.3, cooldown=5.0, max_cooldown=60.0, switch_ratio=1.5):
+        if not urls:
+            raise ValueError("Не задан ни один сервер")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.switch_ratio = switch_ratio
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def record(self, endpoint, path, elapsed):
+        """Успешный ответ сервера за elapsed секунд"""
+        with self._lock:
+            previous = endpoint.latency.get(path)
+            endpoint.latency[path] = (
+                elapsed if previous is None else self.alpha * elapsed + (1 - self.alpha) * previous
+            )
+            endpoint.samples[path] = endpoint.samples.get(path, 0) + 1
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+
+    def record_failure(self, endpoint):
+        """Отказ сервера: нет ответа или ответ из FAILOVER_STATUSES"""
+        with self._lock:
+            endpoint.failures += 1
+            pause = min(self.cooldown * 2 ** (endpoint.failures - 1), self.max_cooldown)
+            endpoint.down_until = time.monotonic() + pause
+
+    def ordered(self):
+        """Серверы по предпочтению: доступные по задержке пробы, затем недоступные по сроку возврата"""
+        now = time.monotonic()
+        with self._lock:
+            # Без измерений сохраняется порядок, в котором серверы заданы
+            healthy = sorted(
+                (endpoint for endpoint in self.endpoints if endpoint.healthy(now)),
+                key=lambda endpoint: endpoint.latency.get(PROBE_PATH, math.inf)
+            )
+            down = sorted(
+                (endpoint for endpoint in self.endpoints if not endpoint.healthy(now)),
+                key=lambda endpoint: endpoint.down_until
+            )
+        return healthy + down
+
+    def _speedup(self, candidate, current):
+        """Во сколько раз candidate быстрее current по маршруту, чаще всего используемому на current"""
+        paths = [path for path in current.latency if path in candidate.latency]
+        if not paths:
+            return 1.0
+        path = max(paths, key=current.samples.get)
+        return current.latency[path] / max(candidate.latency[path], 1e-9)
+
+    def select(self, current=None):
+        """Сервер для следующей операции"""
+        best = self.ordered()[0]
+        if current is None or best is current:
+            return best
+        with self._lock:
+            if current.healthy(time.monotonic()) and self._speedup(best, current) < self.switch_ratio:
+                return current
+        return best
+
+    def probe(self, session, timeout):
+        """Запрос PROBE_PATH к каждому серверу с учётом задержки или отказа"""
+        for endpoint in self.endpoints:
+            start = time.perf_counter()
+            try:
+                response = session.get(f"{endpoint.url}{PROBE_PATH}", timeout=timeout)
+            except requests.RequestException:
+                self.record_failure(endpoint)
+                continue
+            if response.status_code in FAILOVER_STATUSES:
+                self.record_failure(endpoint)
+            else:
+                self.record(endpoint, PROBE_PATH, time.perf_counter() - start)
+
+    def start_probing(self, interval, timeout):
+        """Проверка серверов в фоновом потоке сразу и затем каждые interval секунд"""
+        def run():
+            # Отдельная сессия без повторов: проба не должна ждать недоступный сервер дольше timeout
+            with requests.Session() as session:
+                while True:
+                    self.probe(session, timeout)
+                    if self._stop.wait(interval):
+                        break
+
+        self._thread = threading.Thread(target=run, name="endpoint-probe", daemon=True)
+        self._thread.start()
+
+    def stop_probing(self):
+        # Поток не ожидается: текущая проба завершится не позже своего таймаута
+        self._stop.set()
+
+    def stats(self):
+        """Состояние серверов: задержки по маршрутам в мс и отказы подряд"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.healthy(now),
+                    "failures": endpoint.failures,
+                    "latency_ms": {path: round(value * 1000, 3) for path, value in endpoint.latency.items()}
+                }
+                for endpoint in self.endpoints
+            ]
@@ -0,0 +1,178 @@
+"""Хранилище ключей клиентов по client_id и запас заранее сгенерированных ключей.
+
+Каждому клиенту соответствует свой файл приватного ключа в каталоге
+<directory>/<алгоритм>/, так что клиенты с разными ID в одном рабочем каталоге
+не делят одну пару ключей. Генерация ключа RSA-2048 занимает сотни
+миллисекунд, поэтому новые ключи берутся из KeyPool: его процессы генерируют
+ключи заранее, и создание клиента не ждёт генерации.
+"""
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from urllib.parse import quote
+
+# Общие модули клиента и сервера находятся в каталоге common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.signatures import DEFAULT_ALGORITHM, export_private_pem, get_algorithm, import_own_private_key
+
+logger = logging.getLogger(__name__)
+
+# Каталог хранилища ключей по умолчанию
+DEFAULT_KEYSTORE_DIR = "keys"
+
+
+def generate_private_pem(algorithm_name):
+    """Генерация приватного ключа в PEM (выполняется в процессах KeyPool)"""
+    return export_private_pem(get_algorithm(algorithm_name).generate())
+
+
+class KeyPool:
+    """Запас готовых приватных ключей одного алгоритма.
+
+    Процессы пула поддерживают в запасе size ключей: каждый взятый ключ сразу
+    заказывается заново. Если запас исчерпан, take ждёт ближайший ключ. Когда
+    число нужных ключей известно заранее, limit ограничивает число
+    сгенерированных ключей, чтобы пул не работал впустую в конце.
+    """
+
+    def __init__(self, algorithm=DEFAULT_ALGORITHM, size=16, workers=None, limit=None):
+        self.algorithm = get_algorithm(algorithm)
+        self.size = size
+        self.limit = limit
+        self._ready = queue.Queue()
+        self._pending = 0
+        self._submitted = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+        self._refill()
+
+    def _refill(self):
+        futures = []
+        with self._lock:
+            while not self._closed and self._ready.qsize() + self._pending < self.size:
+                if self.limit is not None and self._submitted >= self.limit:
+                    break
+                try:
+                    futures.append(self._executor.submit(generate_private_pem, self.algorithm.name))
+                except RuntimeError:
+                    # Пул процессов уже остановлен
+                    break
+                self._pending += 1
+                self._submitted += 1
+        # Для уже завершённой задачи обработчик вызывается сразу, поэтому он
+        # добавляется после освобождения блокировки
+        for future in futures:
+            future.add_done_callback(self._generated)
+
+    def _generated(self, future):
+        try:
+            private_pem = future.result()
+        except CancelledError:
+            return
+        except Exception:
+            logger.exception("Ошибка генерации ключа %s", self.algorithm.name)
+            # Ключ не получен и не учитывается в limit
+            with self._lock:
+                self._pending -= 1
+                self._submitted -= 1
+            return
+        with self._lock:
+            self._pending -= 1
+        self._ready.put(private_pem)
+        self._refill()
+
+    def take(self, timeout=None):
+        """Приватный ключ в PEM; при пустом запасе ждёт не дольше timeout секунд"""
+        private_pem = self._ready.get(timeout=timeout)
+        self._refill()
+        return private_pem
+
+    def put(self, private_pem):
+        """Возврат неиспользованного ключа в запас"""
+        self._ready.put(private_pem)
+
+    def __len__(self):
+        return self._ready.qsize()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class KeyStore:
+    """Приватные ключи клиентов в файлах, по одному на client_id и алгоритм.
+
+    Отсутствующий ключ создаётся при первом обращении: берётся из pool, если
+    алгоритм совпадает, иначе генерируется на месте. Файл появляется атомарно,
+    и при одновременном создании ключа одного клиента в нескольких процессах
+    все они получают один и тот же ключ.
+    """
+
+    def __init__(self, directory=DEFAULT_KEYSTORE_DIR, pool=None):
+        self.directory = directory
+        self.pool = pool
+
+    def path(self, client_id, algorithm=DEFAULT_ALGORITHM):
+        # ID клиента может содержать любые символы, поэтому имя файла экранируется
+        return os.path.join(self.directory, get_algorithm(algorithm).name, quote(client_id, safe="") + ".pem")
+
+    def load(self, client_id, algorithm=DEFAULT_ALGORITHM):
+        """Приватный ключ клиента или None, если его нет в хранилище"""
+        try:
+            with open(self.path(client_id, algorithm), "rb") as f:
+                return import_own_private_key(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, client_id, private_pem, algorithm=DEFAULT_ALGORITHM):
+        """Сохранение ключа, если у клиента его ещё нет; возвращает True, если ключ сохранён"""
+        path = self.path(client_id, algorithm)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Ключ записывается во временный файл с правами только для владельца и
+        # появляется под своим именем целиком; существующий ключ не заменяется
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(private_pem)
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.unlink(temp_path)
+
+    def _pool_for(self, algorithm):
+        if self.pool is not None and self.pool.algorithm.name == get_algorithm(algorithm).name:
+            return self.pool
+        return None
+
+    def get_or_create(self, client_id, algorithm=DEFAULT_ALGORITHM):
+        """Приватный ключ клиента; при отсутствии создаётся и сохраняется.
+
+        Возвращает пару (ключ, создан ли он этим вызовом).
+        """
+        key = self.load(client_id, algorithm)
+        if key is not None:
+            return key, False
+
+        pool = self._pool_for(algorithm)
+        private_pem = pool.take() if pool is not None else generate_private_pem(algorithm)
+        if not self.save(client_id, private_pem, algorithm):
+            # Ключ успел создать другой поток или процесс; новый ключ пригодится другому клиенту
+            if pool is not None:
+                pool.put(private_pem)
+            return self.load(client_id, algorithm), False
+        return import_own_private_key(private_pem), True
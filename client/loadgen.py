@@ -0,0 +1,264 @@
+"""Генератор нагрузки: N виртуальных клиентов, выполняющих протоколы аутентификации.
+
+Каждый виртуальный клиент - экземпляр Client со своим ID. Клиенты параллельно
+выполняют случайную смесь операций с заданными весами и в конце выводят
+отчёт JSON с пропускной способностью, задержками p50/p95/p99 и долей ошибок
+по каждому маршруту сервера и по каждой операции:
+
+    python loadgen.py --server 127.0.0.1 --clients 1000 --duration 60 --rate 2 \\
+        --mix timestamp=4,challenge=2,mutual=1,message=3 --output run.json
+
+Каждый клиент выполняет не больше --rate операций в секунду (по умолчанию
+укладываясь в предел частоты допуска сервера ADMISSION_CLIENT_RATE) и не
+больше одного входа по метке времени в секунду: сервер принимает от клиента
+один вход на метку, и ожидание следующей секунды не входит в задержку.
+Отказы допуска (429) и отклонённые повторы (401 "Повторное использование
+подписи") учитываются отдельно от ошибок: throttled и replays.
+
+Все виртуальные клиенты одного запуска используют общую пару ключей из
+рабочего каталога (см. --algorithm), так что запуск не ждёт генерации ключей.
+С параметром --keystore у каждого клиента свой ключ из хранилища; недостающие
+ключи берутся из запаса, который пополняют фоновые процессы (см. provision.py).
+С параметром --servers клиенты распределяются по нескольким серверам: каждый
+выбирает самый быстрый доступный и переходит на другой при отказе.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from client import Client, DEFAULT_ALGORITHM, DEFAULT_WIRE_FORMAT
+from keystore import KeyPool, KeyStore
+
+# Ответ сервера на вход, уже принятый с той же меткой времени
+REPLAY_ERROR = "Повторное использование подписи"
+
+# Маршруты, на которых сервер отклоняет повторы ответом 401
+REPLAY_ROUTES = frozenset({"/auth/timestamp", "/auth/handshake"})
+
+# Операции смеси нагрузки и соответствующие методы Client
+OPERATIONS = {
+    "timestamp": lambda client: client.authenticate_with_timestamp(),
+    "challenge": lambda client: client.authenticate_with_challenge(),
+    "mutual": lambda client: client.authenticate_mutual(),
+    "handshake": lambda client: client.authenticate_handshake(),
+    "message": lambda client: client.send_message("load test message"),
+}
+
+
+def parse_mix(text):
+    """Разбор смеси вида "timestamp=4,challenge=2" в словарь весов"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"неизвестная операция: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def classify(response):
+    """Категория неуспешного ответа: throttled, replays или errors"""
+    if response.status_code == 429:
+        return "throttled"
+    if response.status_code == 401 and urlsplit(response.request.url).path in REPLAY_ROUTES:
+        try:
+            if Client.read(response).get("error") == REPLAY_ERROR:
+                return "replays"
+        except (ValueError, AttributeError):
+            pass
+    return "errors"
+
+
+class LatencyRecorder:
+    """Потокобезопасный сбор задержек и неудач по именованным группам.
+
+    Неудачи делятся на категории: errors - ошибки, throttled - отказы допуска
+    (429), replays - повторы, отклонённые кэшем повторов.
+    """
+
+    CATEGORIES = ("errors", "throttled", "replays")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._failures = {}
+
+    def record(self, name, seconds, ok, category="errors"):
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+            if not ok:
+                failures = self._failures.setdefault(name, dict.fromkeys(self.CATEGORIES, 0))
+                failures[category] += 1
+
+    def summary(self, duration):
+        with self._lock:
+            result = {}
+            for name, samples in sorted(self._samples.items()):
+                samples = sorted(samples)
+                failures = self._failures.get(name, dict.fromkeys(self.CATEGORIES, 0))
+                result[name] = {
+                    "count": len(samples),
+                    "throughput": round(len(samples) / duration, 2),
+                    "errors": failures["errors"],
+                    "error_rate": round(failures["errors"] / len(samples), 4),
+                    "throttled": failures["throttled"],
+                    "replays": failures["replays"],
+                    "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+                    "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+                    "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+                    "max_ms": round(samples[-1] * 1000, 3)
+                }
+            return result
+
+
+def create_client(index, args, keystore=None):
+    return Client(
+        f"{args.prefix}-{index}", args.server, args.port, algorithm=args.algorithm,
+        pool_size=1, timeout=args.timeout, retries=0, wire_format=args.wire_format, verbose=False,
+        keystore=keystore, servers=args.servers, probe_interval=args.probe_interval
+    )
+
+
+def record_routes(client, routes, failures):
+    """Учёт каждого HTTP-ответа клиента по маршруту запроса; категории неудачных
+    ответов текущей операции добавляются в список failures"""
+    def on_response(response, *hook_args, **hook_kwargs):
+        route = urlsplit(response.request.url).path
+        ok = response.status_code < 400
+        category = "errors" if ok else classify(response)
+        if not ok:
+            failures.append(category)
+        routes.record(route, response.elapsed.total_seconds(), ok, category)
+
+    client.session.hooks["response"].append(on_response)
+
+
+def run_virtual_client(client, args, operations, weights, deadline, results, failures):
+    rng = random.Random()
+    interval = 1 / args.rate if args.rate else 0
+    next_start = time.monotonic()
+    while time.monotonic() < deadline:
+        name = rng.choices(operations, weights)[0]
+        if name == "message" and not client.is_authenticated:
+            name = "timestamp"
+
+        # Ожидание следующей секунды для входа по метке не входит в задержку операции
+        delay = max(next_start - time.monotonic(), client.timestamp_delay() if name == "timestamp" else 0)
+        if time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
+
+        failures.clear()
+        start = time.perf_counter()
+        try:
+            ok = bool(OPERATIONS[name](client))
+        except Exception:
+            ok = False
+        # Неудача операции относится к отказу допуска или повтору, если он был среди её ответов
+        category = next((c for c in ("throttled", "replays") if c in failures), "errors")
+        results.record(name, time.perf_counter() - start, ok, category)
+
+        # Расписание не накапливает долг: после медленной операции следующая начинается сразу
+        next_start = max(next_start + interval, time.monotonic())
+        if args.think_time:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", default="127.0.0.1", help="IP-адрес сервера")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--servers", nargs="+", help="несколько серверов (host:port) вместо --server и --port")
+    parser.add_argument("--probe-interval", type=float, default=10, help="период проверки серверов, с")
+    parser.add_argument("--clients", type=int, default=100, help="число виртуальных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="длительность нагрузки в секундах")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("timestamp=1,challenge=1,mutual=1,message=1"),
+                        help="веса операций, например timestamp=4,challenge=2,mutual=1,message=3")
+    parser.add_argument("--algorithm", default=DEFAULT_ALGORITHM, help="алгоритм подписи клиентов")
+    parser.add_argument("--wire-format", default=DEFAULT_WIRE_FORMAT, choices=["json", "msgpack"],
+                        help="формат сообщений клиентов")
+    parser.add_argument("--prefix", default="load", help="префикс ID виртуальных клиентов")
+    parser.add_argument("--rate", type=float, default=2,
+                        help="операций в секунду на клиента (0 - без ограничения); по умолчанию "
+                             "не больше предела частоты допуска сервера")
+    parser.add_argument("--think-time", type=float, default=0, help="средняя пауза между операциями, с")
+    parser.add_argument("--timeout", type=float, default=30, help="таймаут HTTP-запроса, с")
+    parser.add_argument("--setup-concurrency", type=int, default=32, help="параллелизм регистрации клиентов")
+    parser.add_argument("--keystore", help="каталог хранилища ключей: свой ключ у каждого клиента")
+    parser.add_argument("--output", help="файл для отчёта JSON (по умолчанию - стандартный вывод)")
+    args = parser.parse_args()
+
+    routes = LatencyRecorder()
+    operations = LatencyRecorder()
+
+    # Создание клиентов: общая пара ключей генерируется один раз, до параллельной регистрации
+    setup_start = time.perf_counter()
+    if args.keystore:
+        with KeyPool(args.algorithm, size=64, limit=args.clients) as pool:
+            keystore = KeyStore(args.keystore, pool)
+            with ThreadPoolExecutor(max_workers=args.setup_concurrency) as executor:
+                clients = list(executor.map(lambda i: create_client(i, args, keystore), range(args.clients)))
+    else:
+        first = create_client(0, args)
+        with ThreadPoolExecutor(max_workers=args.setup_concurrency) as executor:
+            clients = [first] + list(executor.map(lambda i: create_client(i, args), range(1, args.clients)))
+    setup_time = time.perf_counter() - setup_start
+    print(f"Зарегистрировано клиентов: {len(clients)} за {setup_time:.1f} с", file=sys.stderr)
+
+    # Маршруты этапа регистрации не входят в замер нагрузки
+    failures = [[] for _ in clients]
+    for client, client_failures in zip(clients, failures):
+        record_routes(client, routes, client_failures)
+
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    start = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        for client, client_failures in zip(clients, failures):
+            executor.submit(run_virtual_client, client, args, names, weights, deadline, operations, client_failures)
+    duration = time.perf_counter() - start
+
+    for client in clients:
+        client.close()
+
+    report = {
+        "config": {
+            "server": args.servers or f"{args.server}:{args.port}",
+            "clients": args.clients,
+            "duration": args.duration,
+            "mix": args.mix,
+            "algorithm": args.algorithm,
+            "wire_format": args.wire_format,
+            "rate": args.rate,
+            "think_time": args.think_time
+        },
+        "setup_seconds": round(setup_time, 3),
+        "elapsed_seconds": round(duration, 3),
+        "routes": routes.summary(duration),
+        "operations": operations.summary(duration)
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
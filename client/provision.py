@@ -0,0 +1,121 @@
+"""Массовое создание клиентов: ключи в хранилище и регистрация на сервере.
+
+    python provision.py --count 5000 --prefix device --algorithm ed25519 \\
+        --server 127.0.0.1 --keystore keys --workers 4 --threads 32
+
+Ключи генерируются процессами KeyPool и сохраняются в хранилище KeyStore
+(по файлу на клиента), а публичные ключи регистрируются на сервере запросами
+/register в --threads потоков через общий пул соединений. Клиенты, у которых
+ключ уже есть в хранилище, получают прежний ключ, поэтому прерванный запуск
+можно повторить. Ответы 429 и 503 сервера повторяются после паузы из
+Retry-After. С флагом --no-register только создаются ключи.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from client import Client, DEFAULT_ALGORITHM, DEFAULT_WIRE_FORMAT
+from keystore import DEFAULT_KEYSTORE_DIR, KeyPool, KeyStore
+from common import wire
+from common.signatures import export_public_der, export_public_pem
+
+# Число повторов регистрации при ответах 429/503
+REGISTER_RETRIES = 5
+
+
+class Provisioner:
+    """Создание ключей и регистрация клиентов с подсчётом результатов"""
+
+    def __init__(self, keystore, args):
+        self.keystore = keystore
+        self.args = args
+        self.server_url = f"http://{args.server}:{args.port}"
+        self.mimetype = wire.get_mimetype(args.wire_format)
+        self.session = Client.create_session(args.threads, retries=3, backoff_factor=0.3)
+        self.counts = {"created": 0, "existing": 0, "registered": 0, "failed": 0}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def register(self, client_id, private_key):
+        public_key = (
+            export_public_der(private_key) if self.mimetype == wire.MSGPACK else export_public_pem(private_key)
+        )
+        body = wire.encode({
+            "client_id": client_id,
+            "public_key": public_key,
+            "algorithm": self.args.algorithm
+        }, self.mimetype)
+        for _ in range(REGISTER_RETRIES + 1):
+            response = self.session.post(
+                f"{self.server_url}/register", data=body, timeout=self.args.timeout,
+                headers={"Content-Type": self.mimetype, "Accept": self.mimetype}
+            )
+            if response.status_code not in (429, 503):
+                break
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+        if response.status_code != 200:
+            raise RuntimeError(f"ответ {response.status_code}: {response.text[:200]}")
+
+    def provision(self, client_id):
+        try:
+            private_key, created = self.keystore.get_or_create(client_id, self.args.algorithm)
+            self.count("created" if created else "existing")
+            if not self.args.no_register:
+                self.register(client_id, private_key)
+                self.count("registered")
+        except Exception as e:
+            self.count("failed")
+            with self._lock:
+                if len(self.errors) < 10:
+                    self.errors.append(f"{client_id}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, required=True, help="число клиентов")
+    parser.add_argument("--prefix", default="device", help="префикс ID клиентов (ID: <префикс>-<номер>)")
+    parser.add_argument("--start", type=int, default=0, help="номер первого клиента")
+    parser.add_argument("--algorithm", default=DEFAULT_ALGORITHM, help="алгоритм подписи клиентов")
+    parser.add_argument("--keystore", default=DEFAULT_KEYSTORE_DIR, help="каталог хранилища ключей")
+    parser.add_argument("--workers", type=int, default=0, help="процессы генерации ключей (по умолчанию - по числу ядер)")
+    parser.add_argument("--pool-size", type=int, default=64, help="запас заранее сгенерированных ключей")
+    parser.add_argument("--threads", type=int, default=32, help="параллельные запросы регистрации")
+    parser.add_argument("--server", default="127.0.0.1", help="IP-адрес сервера")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--wire-format", default=DEFAULT_WIRE_FORMAT, choices=["json", "msgpack"],
+                        help="формат сообщений")
+    parser.add_argument("--timeout", type=float, default=30, help="таймаут HTTP-запроса, с")
+    parser.add_argument("--no-register", action="store_true", help="только создать ключи, без регистрации")
+    args = parser.parse_args()
+
+    client_ids = [f"{args.prefix}-{i}" for i in range(args.start, args.start + args.count)]
+    start = time.perf_counter()
+    with KeyPool(args.algorithm, size=args.pool_size, workers=args.workers or None,
+                 limit=args.count) as pool:
+        provisioner = Provisioner(KeyStore(args.keystore, pool), args)
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(provisioner.provision, client_ids))
+        provisioner.session.close()
+    elapsed = time.perf_counter() - start
+
+    for error in provisioner.errors:
+        print(f"Ошибка: {error}", file=sys.stderr)
+    print(json.dumps({
+        "clients": len(client_ids),
+        **provisioner.counts,
+        "elapsed_seconds": round(elapsed, 3),
+        "clients_per_second": round(len(client_ids) / elapsed, 1) if elapsed else None
+    }, ensure_ascii=False, indent=2))
+    if provisioner.counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
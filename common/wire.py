@@ -0,0 +1,77 @@
+"""Форматы тела запросов и ответов, общие для клиента и сервера.
+
+По умолчанию используется JSON, в котором подписи передаются в base64, а ключи
+в PEM. Компактный двоичный формат MessagePack (необязательная зависимость
+msgpack) передаёт подписи и ключи (DER) как есть. Формат тела запроса задаётся
+заголовком Content-Type, формат ответа - заголовком Accept.
+
+В словарях сообщений подписи хранятся в виде bytes: при кодировании в JSON они
+преобразуются в base64, а при разборе поля подписи нужно пропускать через
+as_bytes, так как из JSON приходит строка.
+"""
+import base64
+import json
+
+from Crypto.IO import PEM
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Имена форматов для настроек клиента и соответствующие типы содержимого
+FORMATS = {"json": JSON, "msgpack": MSGPACK}
+
+# Типы содержимого, которые можно закодировать в этом окружении (JSON - первым)
+MIMETYPES = [JSON] + ([MSGPACK] if msgpack is not None else [])
+
+
+def get_mimetype(name):
+    """Тип содержимого по имени формата; ValueError для неизвестного или недоступного формата"""
+    mimetype = FORMATS.get(name or "json")
+    if mimetype is None:
+        raise ValueError(f"Неизвестный формат сообщений: {name}")
+    if mimetype not in MIMETYPES:
+        raise ValueError(f"Для формата {name} требуется пакет msgpack")
+    return mimetype
+
+
+def json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def encode(obj, mimetype=JSON):
+    if mimetype == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, default=json_default, ensure_ascii=False).encode()
+
+
+def decode(data, mimetype=JSON):
+    """Разбор тела сообщения; ValueError, если тело не соответствует формату"""
+    if mimetype == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Формат MessagePack недоступен: не установлен пакет msgpack")
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f"Неверное тело MessagePack: {e}")
+    return json.loads(data)
+
+
+def as_bytes(value, validate=False):
+    """Двоичное поле сообщения: bytes из MessagePack или строка base64 из JSON"""
+    if isinstance(value, bytes):
+        return value
+    return base64.b64decode(value, validate=validate)
+
+
+def as_public_key_pem(value):
+    """PEM публичного ключа из поля сообщения (DER из MessagePack или PEM из JSON)"""
+    if isinstance(value, bytes):
+        return PEM.encode(value, "PUBLIC KEY")
+    return value
@@ -0,0 +1,179 @@
+"""Допуск запросов к криптографическим операциям и сброс избыточной нагрузки.
+
+Проверка подписи RSA на порядки дороже разбора запроса, поэтому каждый запрос,
+дошедший до неё, сначала списывает жетон из корзины своего клиента и из общей
+корзины сервера. Пустая корзина означает ответ 429 с заголовком Retry-After,
+так что поток неверных подписей от одного клиента не вытесняет остальных.
+Число одновременно обрабатываемых запросов с криптографией ограничено: сверх
+предела сервер сразу отвечает 503, а не накапливает очередь.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from striped import DEFAULT_SHARDS
+
+
+class AdmissionRejected(Exception):
+    """Запрос отклонён до криптографических операций"""
+
+    def __init__(self, status, message, retry_after=1.0):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    """Корзина жетонов: rate жетонов в секунду, не больше burst сразу"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self, cost=1):
+        """0, если жетоны списаны, иначе время (с) до их появления.
+
+        Стоимость больше burst списывается как burst, иначе такой запрос
+        (например, большой пакет) не был бы допущен никогда.
+        """
+        cost = min(cost, self.burst)
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0.0
+            return (cost - self.tokens) / self.rate
+
+
+class _ClientBuckets:
+    """Корзины клиентов в сегментах с отдельными блокировками.
+
+    Состояние корзины - [жетоны, время пополнения]. Число корзин ограничено:
+    при заполнении сегмента вытесняется корзина давно не обращавшегося клиента,
+    и при следующем запросе такой клиент снова получает полную корзину.
+    """
+
+    def __init__(self, rate, burst, max_clients, clock, shards):
+        shards = max(1, min(shards, max_clients))
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.shard_size = -(-max_clients // shards)
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+
+    def take(self, client_id, cost=1):
+        buckets, lock = self._shards[hash(client_id) % len(self._shards)]
+        now = self.clock()
+        with lock:
+            bucket = buckets.get(client_id)
+            if bucket is None:
+                bucket = buckets[client_id] = [self.burst, now]
+                while len(buckets) > self.shard_size:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(client_id)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate
+
+    def __len__(self):
+        return sum(len(buckets) for buckets, _ in self._shards)
+
+
+class AdmissionController:
+    """Ограничение частоты по клиентам и в целом и числа запросов в обработке.
+
+    Нулевые значения rate и max_in_flight отключают соответствующее ограничение.
+    """
+
+    def __init__(self, client_rate=10.0, client_burst=None, global_rate=0.0, global_burst=None,
+                 max_in_flight=64, max_clients=100000, clock=time.monotonic, shards=DEFAULT_SHARDS):
+        self.client_rate = client_rate
+        self.global_rate = global_rate
+        self.max_in_flight = max_in_flight
+        self._clients = (
+            _ClientBuckets(client_rate, client_burst or max(client_rate * 2, 1.0), max_clients, clock, shards)
+            if client_rate > 0 else None
+        )
+        self._global = TokenBucket(global_rate, global_burst, clock) if global_rate > 0 else None
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._in_flight_lock = threading.Lock()
+        self.in_flight = 0
+        # Счётчики отказов обновляются без блокировки и приблизительны
+        self.rejected_client = 0
+        self.rejected_global = 0
+        self.rejected_in_flight = 0
+
+    def try_client(self, client_id, cost=1):
+        """Списание жетонов клиента; 0 при успехе, иначе время (с) до повторной попытки"""
+        if self._clients is None:
+            return 0.0
+        retry_after = self._clients.take(client_id, cost)
+        if retry_after:
+            self.rejected_client += 1
+        return retry_after
+
+    def try_global(self, cost=1):
+        """Списание жетонов общей корзины; 0 при успехе, иначе время (с) до повторной попытки"""
+        if self._global is None:
+            return 0.0
+        retry_after = self._global.take(cost)
+        if retry_after:
+            self.rejected_global += 1
+        return retry_after
+
+    def admit(self, client_id, cost=1):
+        """Допуск запроса клиента к криптографии; при отказе выбрасывает AdmissionRejected (429)"""
+        retry_after = self.try_client(client_id, cost)
+        if retry_after:
+            raise AdmissionRejected(429, "Слишком много запросов клиента, повторите попытку позже", retry_after)
+        self.admit_global(cost)
+
+    def admit_global(self, cost=1):
+        retry_after = self.try_global(cost)
+        if retry_after:
+            raise AdmissionRejected(429, "Слишком много запросов, повторите попытку позже", retry_after)
+
+    def enter(self):
+        """Занятие места для запроса в обработке; при отсутствии мест выбрасывает AdmissionRejected (503)"""
+        if self._slots is None:
+            return
+        if not self._slots.acquire(blocking=False):
+            self.rejected_in_flight += 1
+            raise AdmissionRejected(503, "Сервер перегружен, повторите попытку позже")
+        with self._in_flight_lock:
+            self.in_flight += 1
+
+    def leave(self):
+        if self._slots is None:
+            return
+        with self._in_flight_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {
+            "client_rate": self.client_rate,
+            "global_rate": self.global_rate,
+            "tracked_clients": len(self._clients) if self._clients is not None else 0,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rejected_client": self.rejected_client,
+            "rejected_global": self.rejected_global,
+            "rejected_in_flight": self.rejected_in_flight
+        }
@@ -0,0 +1,337 @@
+"""Асинхронный режим сервера (ASGI) с теми же маршрутами, что и приложение Flask.
+
+Запуск из каталога server под любым ASGI-сервером, например uvicorn:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+
+Соединения, чтение тел запросов и отправку ответов обслуживает цикл событий,
+поэтому медленные и простаивающие клиенты не занимают потоков. Обработчики
+маршрутов общие с server.py; те из них, что выполняют криптографические
+операции или обращаются к реестру клиентов, запускаются в пуле потоков
+(ASGI_EXECUTOR_THREADS), а при CRYPTO_WORKERS > 0 передают подпись и проверку
+дальше в пул процессов. Проверка токена сессии выполняется прямо в цикле событий.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags
+
+import server
+from common import wire
+from crypto_pool import CryptoPoolBusy
+from replay_cache import ReplayCacheFull
+from admission import AdmissionRejected
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+logger = logging.getLogger("server.asgi")
+
+# Число потоков для обработчиков с криптографическими операциями
+ASGI_EXECUTOR_THREADS = int(os.environ.get("ASGI_EXECUTOR_THREADS", 32))
+
+# Максимальный размер тела запроса в байтах
+ASGI_MAX_BODY_SIZE = int(os.environ.get("ASGI_MAX_BODY_SIZE", 4 * 1024 * 1024))
+
+
+def _without_token(handler):
+    return lambda data, authorization: handler(data)
+
+
+# POST-маршруты: путь -> (обработчик(data, authorization), выполнять ли в пуле потоков)
+POST_ROUTES = {
+    "/register": (_without_token(server.handle_register), True),
+    "/auth/timestamp": (_without_token(server.handle_auth_timestamp), True),
+    "/auth/challenge": (_without_token(server.handle_auth_challenge), True),
+    "/auth/challenge/verify": (_without_token(server.handle_auth_challenge_verify), True),
+    "/auth/mutual": (_without_token(server.handle_auth_mutual), True),
+    "/auth/mutual/verify": (_without_token(server.handle_auth_mutual_verify), True),
+    "/auth/handshake": (_without_token(server.handle_auth_handshake), True),
+    "/auth/batch": (_without_token(server.handle_auth_batch), True),
+    "/auth/refresh": (server.handle_auth_refresh, False),
+    "/message": (server.handle_message, False),
+    "/admin/profile": (server.handle_admin_profile, True),
+}
+
+GET_ROUTES = {"/get_server_public_key", "/stats", "/metrics", "/admin/profile"}
+
+# POST-маршруты с телом в виде текста, которое читается и отправляется по частям
+STREAM_ROUTES = {"/message/stream"}
+
+# Маршруты, допускающие пустое или неразобранное тело запроса
+SILENT_PAYLOAD_ROUTES = {"/auth/refresh", "/admin/profile"}
+
+
+class HTTPError(Exception):
+    """Ошибка запроса с кодом ответа HTTP (неверное тело, неизвестный маршрут и т.п.)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    """Заголовки и тело HTTP-запроса ASGI"""
+
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        self.body = body
+
+    @property
+    def mimetype(self):
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def response_mimetype(self):
+        """Формат ответа по заголовку Accept (по умолчанию JSON), как в server.respond"""
+        accept = parse_accept_header(self.headers.get("accept"), MIMEAccept)
+        return accept.best_match(wire.MIMETYPES, default=wire.JSON)
+
+    def payload(self, silent=False):
+        """Разбор тела запроса по Content-Type, как в server.read_payload"""
+        with server.OPERATION_SECONDS.time("payload_decode"):
+            return self._decode(silent)
+
+    def _decode(self, silent):
+        mimetype = self.mimetype
+        if mimetype == wire.MSGPACK and wire.MSGPACK not in wire.MIMETYPES:
+            raise HTTPError(415, "Формат MessagePack не поддерживается сервером")
+        if mimetype != wire.MSGPACK and mimetype != wire.JSON and not mimetype.endswith("+json"):
+            if silent:
+                return None
+            raise HTTPError(415, "Ожидалось тело запроса в JSON или MessagePack")
+        try:
+            return wire.decode(self.body, mimetype if mimetype == wire.MSGPACK else wire.JSON)
+        except ValueError:
+            if silent:
+                return None
+            raise HTTPError(400, "Неверное тело запроса")
+
+
+async def read_body(scope, receive):
+    """Чтение тела запроса целиком с ограничением размера"""
+    length = dict(scope["headers"]).get(b"content-length")
+    if length is not None and length.isdigit() and int(length) > ASGI_MAX_BODY_SIZE:
+        raise HTTPError(413, "Слишком большое тело запроса")
+
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > ASGI_MAX_BODY_SIZE:
+            raise HTTPError(413, "Слишком большое тело запроса")
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def send_response(send, status, body=b"", mimetype=None, headers=()):
+    response_headers = [(b"content-length", str(len(body)).encode())]
+    if mimetype:
+        response_headers.append((b"content-type", mimetype.encode()))
+    response_headers.extend((name.encode(), value.encode()) for name, value in headers)
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def respond(send, request, body, status=200, headers=()):
+    mimetype = request.response_mimetype()
+    with server.OPERATION_SECONDS.time("payload_encode"):
+        encoded = wire.encode(body, mimetype)
+    await send_response(send, status, encoded, mimetype, headers)
+
+
+async def get_server_public_key(send, request):
+    snapshot = server.server_keys.current()
+    mimetype = request.response_mimetype()
+    body, etag = snapshot.public_key_bodies[mimetype]
+    headers = [("etag", f'"{etag}"'), ("cache-control", "no-cache"), ("vary", "Accept")]
+
+    # Клиент может перепроверить закэшированный ключ по ETag
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        await send_response(send, 304, headers=headers)
+    else:
+        await send_response(send, 200, body, mimetype, headers)
+
+
+async def message_stream(receive, send, request, executor):
+    """Переворот текста UTF-8 по частям (/message/stream), как в server.process_message_stream.
+
+    Запись во временный файл и чтение из него выполняются в пуле потоков, чтобы
+    не останавливать цикл событий на дисковых операциях.
+    """
+    length = request.headers.get("content-length")
+    spool, error = server.open_message_stream(
+        request.headers.get("authorization"), int(length) if length and length.isdigit() else None
+    )
+    if error is not None:
+        await respond(send, request, *error)
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                spool.close()
+                return
+            chunk = message.get("body", b"")
+            if chunk:
+                await loop.run_in_executor(executor, spool.write, chunk)
+            if not message.get("more_body", False):
+                break
+        spool.finish()
+    except (server.MessageTooLarge, ValueError) as e:
+        spool.close()
+        await respond(send, request, *server.message_stream_error(e))
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-length", str(spool.size).encode()), (b"content-type", b"text/plain; charset=utf-8")]
+    })
+    chunks = spool.reversed_chunks()
+    try:
+        while (chunk := await loop.run_in_executor(executor, next, chunks, None)) is not None:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        chunks.close()
+        spool.close()
+
+
+class ServerApp:
+    """Приложение ASGI, вызывающее общие обработчики маршрутов server.py"""
+
+    def __init__(self, executor_threads=ASGI_EXECUTOR_THREADS):
+        self.executor_threads = executor_threads
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, receive, send)
+
+    def startup(self):
+        # Та же подготовка, что и при запуске server.py
+        server.generate_server_keys()
+        server.server_keys.load()
+        server.start_crypto_pool()
+        server.start_profiler()
+        server.server_keys.start_watching(server.SERVER_KEY_RELOAD_INTERVAL)
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_threads, thread_name_prefix="asgi-handler")
+
+    def shutdown(self):
+        server.server_keys.stop_watching()
+        server.profiler.stop()
+        if server.crypto_pool is not None:
+            server.crypto_pool.shutdown()
+        self.executor.shutdown(wait=False)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                logger.info("Сервер ASGI запущен: потоков обработчиков %d", self.executor_threads)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive, send):
+        """Обработка запроса с учётом числа и длительности запросов по маршрутам"""
+        started = time.perf_counter()
+        status = 500
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        await self.dispatch(scope, receive, send_and_record)
+
+        path = scope["path"]
+        route = path if path in POST_ROUTES or path in GET_ROUTES or path in STREAM_ROUTES else "unmatched"
+        server.REQUEST_SECONDS.observe(time.perf_counter() - started, route)
+        server.REQUESTS_TOTAL.inc(route, scope["method"], str(status))
+
+    async def dispatch(self, scope, receive, send):
+        request = Request(scope, b"")
+        try:
+            if scope["method"] == "GET" and request.path in GET_ROUTES:
+                if request.path == "/get_server_public_key":
+                    await get_server_public_key(send, request)
+                elif request.path == "/metrics":
+                    await send_response(send, 200, server.metrics.render().encode(), METRICS_CONTENT_TYPE)
+                elif request.path == "/admin/profile":
+                    await respond(send, request, *server.handle_admin_profile(None, request.headers.get("authorization")))
+                else:
+                    await respond(send, request, *server.handle_stats())
+                return
+
+            if request.path in STREAM_ROUTES and scope["method"] == "POST":
+                await message_stream(receive, send, request, self.executor)
+                return
+
+            if request.path not in POST_ROUTES:
+                if request.path in GET_ROUTES or request.path in STREAM_ROUTES:
+                    raise HTTPError(405, "Метод не поддерживается")
+                raise HTTPError(404, "Маршрут не найден")
+            if scope["method"] != "POST":
+                raise HTTPError(405, "Метод не поддерживается")
+
+            request.body = await read_body(scope, receive)
+            if request.body is None:
+                return
+
+            handler, offload = POST_ROUTES[request.path]
+            data = request.payload(silent=request.path in SILENT_PAYLOAD_ROUTES)
+            authorization = request.headers.get("authorization")
+            # Место занимается уже после чтения тела, чтобы медленные клиенты его не удерживали,
+            # и до постановки в очередь пула потоков, чтобы очередь не росла сверх предела
+            admitted = request.path in server.CRYPTO_ROUTES
+            if admitted:
+                server.admission.enter()
+            try:
+                # Обработчик профилируется в том потоке, где выполняется
+                if offload:
+                    loop = asyncio.get_running_loop()
+                    body, status = await loop.run_in_executor(
+                        self.executor, server.profiler.run, request.path, handler, data, authorization
+                    )
+                else:
+                    body, status = server.profiler.run(request.path, handler, data, authorization)
+            finally:
+                if admitted:
+                    server.admission.leave()
+            await respond(send, request, body, status)
+        except HTTPError as e:
+            await respond(send, request, {"error": e.message}, e.status)
+        except AdmissionRejected as e:
+            await respond(send, request, {"error": e.message}, e.status, e.headers.items())
+        except (CryptoPoolBusy, ReplayCacheFull):
+            # Перегрузка - быстро отвечаем, не накапливая запросы (как обработчики ошибок Flask)
+            await respond(send, request, {"error": "Сервер перегружен, повторите попытку позже"}, 503)
+        except Exception:
+            logger.exception("Ошибка обработки запроса %s", request.path)
+            await respond(send, request, {"error": "Внутренняя ошибка сервера"}, 500)
+
+
+app = ServerApp()
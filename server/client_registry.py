@@ -0,0 +1,299 @@
+"""Постоянный реестр зарегистрированных клиентов на SQLite.
+
+Импорт заранее подготовленных публичных ключей из файла JSON Lines
+(по одному объекту {"client_id": ..., "public_key": ...} в строке):
+
+    python client_registry.py import clients.jsonl --db clients.db
+
+Каждый ключ по умолчанию разбирается и проверяется; для заведомо
+корректных файлов проверку можно отключить флагом --no-validate.
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from striped import ShardedLRU
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    client_id TEXT PRIMARY KEY,
+    public_key TEXT NOT NULL,
+    registered_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Строка таблицы meta с числом клиентов
+CLIENT_COUNT = "client_count"
+
+
+class ClientRegistry:
+    """Реестр клиентов с ленивой загрузкой и групповой записью.
+
+    При запуске открывается только соединение с базой, поэтому время старта
+    не зависит от числа клиентов: запись читается при первом обращении и
+    остаётся в ограниченном LRU-кэше. Регистрации сразу видны чтению, а в
+    базу их записывает фоновый поток одной транзакцией раз в commit_interval
+    секунд, поэтому запрос /register не ждёт записи на диск. Кэш разделён
+    на сегменты с отдельными блокировками, так что чтения записей разных
+    клиентов не ждут друг друга.
+
+    Если базу используют несколько процессов сервера (synchronous=True),
+    регистрация записывается сразу, чтобы другие процессы видели клиента
+    уже в следующем запросе.
+
+    Число клиентов (len) хранится в таблице meta и увеличивается в той же
+    транзакции, что записывает новых клиентов, поэтому его чтение - одна
+    строка по ключу, без ожидания записи и просмотра таблицы, и в нём учтены
+    клиенты всех процессов. Регистрации из очереди на запись в нём появятся
+    после записи в базу.
+
+    Поддерживает операции словаря, которые использует сервер:
+    client_id in registry, registry[client_id], registry[client_id] = record.
+    """
+
+    def __init__(self, path, commit_interval=0.05, max_batch=1000, cache_size=100000, synchronous=False):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.synchronous = synchronous
+        self._cache = ShardedLRU(cache_size)
+        self.commits = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # В базе прежней версии счётчика нет: клиенты считаются один раз. Одна
+        # инструкция выполняется атомарно относительно записи других процессов
+        if conn.execute("SELECT 1 FROM meta WHERE name = ?", (CLIENT_COUNT,)).fetchone() is None:
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO meta (name, value) SELECT ?, COUNT(*) FROM clients", (CLIENT_COUNT,)
+                )
+        conn.close()
+
+        self._start_writer()
+        atexit.register(self.close)
+
+    def _start_writer(self):
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._pending_changed = threading.Condition(self._pending_lock)
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="client-registry-writer", daemon=True)
+        self._writer.start()
+
+    def after_fork(self):
+        """Перезапуск потока записи и соединений в дочернем процессе после fork"""
+        self._start_writer()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # У каждого потока своё соединение для чтения
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _write(self, conn, rows):
+        """Запись строк (client_id, public_key, registered_at) с учётом новых клиентов в
+        счётчике; вызывается внутри транзакции"""
+        added = conn.executemany(
+            "INSERT OR IGNORE INTO clients (client_id, public_key, registered_at) VALUES (?, ?, ?)", rows
+        ).rowcount
+        # Строки уже зарегистрированных клиентов заменяются; только что вставленные не меняются
+        if added < len(rows):
+            conn.executemany(
+                "UPDATE clients SET public_key = ?, registered_at = ? WHERE client_id = ?",
+                [(public_key, registered_at, client_id) for client_id, public_key, registered_at in rows]
+            )
+        if added:
+            conn.execute("UPDATE meta SET value = value + ? WHERE name = ?", (added, CLIENT_COUNT))
+
+    def get(self, client_id, default=None):
+        # Запись попадает в кэш после очереди на запись, поэтому при промахе
+        # кэша ещё не записанная регистрация находится в очереди
+        record = self._cache.get(client_id)
+        if record is not None:
+            return record
+
+        with self._pending_lock:
+            record = self._pending.get(client_id)
+        if record is not None:
+            return record
+
+        row = self._reader().execute(
+            "SELECT public_key FROM clients WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        if row is None:
+            return default
+
+        record = {"public_key": row[0]}
+        self._cache.put(client_id, record)
+        return record
+
+    def reload(self, client_id):
+        """Перечитывание записи из базы; True, если ключ клиента в базе изменился"""
+        self.flush()
+        row = self._reader().execute(
+            "SELECT public_key FROM clients WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        cached = self._cache.get(client_id)
+        if row is None or (cached is not None and cached["public_key"] == row[0]):
+            return False
+        self._cache.put(client_id, {"public_key": row[0]})
+        return True
+
+    def __contains__(self, client_id):
+        return self.get(client_id) is not None
+
+    def __getitem__(self, client_id):
+        record = self.get(client_id)
+        if record is None:
+            raise KeyError(client_id)
+        return record
+
+    def __setitem__(self, client_id, record):
+        if self.synchronous:
+            conn = self._reader()
+            with conn:
+                self._write(conn, [(client_id, record["public_key"], int(time.time()))])
+            self._cache.put(client_id, record)
+            return
+
+        with self._pending_lock:
+            self._pending[client_id] = record
+            self._pending_changed.notify_all()
+        self._cache.put(client_id, record)
+
+    def __len__(self):
+        return self._reader().execute("SELECT value FROM meta WHERE name = ?", (CLIENT_COUNT,)).fetchone()[0]
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._closed:
+                    self._pending_changed.wait()
+                if not self._pending and self._closed:
+                    break
+
+            # Ожидание, пока накопятся другие регистрации для общей транзакции
+            time.sleep(self.commit_interval)
+
+            with self._pending_lock:
+                batch = list(self._pending.items())[:self.max_batch]
+
+            now = int(time.time())
+            with conn:
+                self._write(conn, [(client_id, record["public_key"], now) for client_id, record in batch])
+            self.commits += 1
+
+            with self._pending_lock:
+                for client_id, record in batch:
+                    # Запись могла быть заменена повторной регистрацией во время транзакции
+                    if self._pending.get(client_id) is record:
+                        del self._pending[client_id]
+                self._pending_changed.notify_all()
+        conn.close()
+
+    def flush(self):
+        """Ожидание записи в базу всех принятых регистраций"""
+        with self._pending_lock:
+            while self._pending and self._writer.is_alive():
+                self._pending_changed.wait(timeout=1)
+
+    def close(self):
+        with self._pending_lock:
+            self._closed = True
+            self._pending_changed.notify_all()
+        self._writer.join()
+
+    def bulk_import(self, records, validate=None, chunk_size=10000):
+        """Импорт пар (client_id, public_key) пакетами транзакций.
+
+        validate - необязательная функция проверки ключа; записи, для которых
+        она выбрасывает исключение, пропускаются. Возвращает (импортировано, пропущено).
+        """
+        imported = skipped = 0
+        now = int(time.time())
+        chunk = []
+
+        conn = self._connect()
+
+        def write(rows):
+            with conn:
+                self._write(conn, rows)
+
+        try:
+            for client_id, public_key in records:
+                if validate is not None:
+                    try:
+                        validate(public_key)
+                    except (ValueError, IndexError, TypeError):
+                        skipped += 1
+                        continue
+                chunk.append((client_id, public_key, now))
+                if len(chunk) >= chunk_size:
+                    write(chunk)
+                    imported += len(chunk)
+                    chunk = []
+
+            if chunk:
+                write(chunk)
+                imported += len(chunk)
+        finally:
+            conn.close()
+
+        # Импортированные записи могли заменить ключи, уже загруженные в кэш
+        self._cache.clear()
+        return imported, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Управление реестром клиентов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="импорт публичных ключей из файла JSON Lines")
+    import_parser.add_argument("path", help="файл с записями {\"client_id\": ..., \"public_key\": ...}")
+    import_parser.add_argument("--db", default="clients.db", help="путь к базе реестра")
+    import_parser.add_argument("--no-validate", action="store_true",
+                               help="не разбирать ключи при импорте (для проверенных файлов)")
+    args = parser.parse_args()
+
+    # Общие модули клиента и сервера находятся в каталоге common
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from key_cache import build_verifier
+
+    def read_records(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["client_id"], record["public_key"]
+
+    registry = ClientRegistry(args.db)
+    start = time.perf_counter()
+    imported, skipped = registry.bulk_import(
+        read_records(args.path),
+        validate=None if args.no_validate else build_verifier
+    )
+    print(f"Импортировано клиентов: {imported}, пропущено с неверным ключом: {skipped} "
+          f"({time.perf_counter() - start:.1f} с)")
+
+
+if __name__ == "__main__":
+    main()
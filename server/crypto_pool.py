@@ -0,0 +1,158 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from common.signatures import algorithm_for_key, import_key
+from key_cache import build_verifier
+
+logger = logging.getLogger(__name__)
+
+# Состояние процесса-обработчика: приватный ключ сервера загружается один раз
+_worker_signer = None
+
+
+def _init_worker(private_key_pem):
+    global _worker_signer
+    private_key = import_key(private_key_pem)
+    _worker_signer = algorithm_for_key(private_key).signer(private_key)
+
+
+@lru_cache(maxsize=4096)
+def _worker_verifier(public_key_pem):
+    return build_verifier(public_key_pem)
+
+
+def _sign(message):
+    return _worker_signer.sign(message)
+
+
+def _verify(public_key_pem, message, signature):
+    try:
+        _worker_verifier(public_key_pem).verify(message, signature)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+def _verify_many(items):
+    return [_verify(public_key_pem, message, signature) for public_key_pem, message, signature in items]
+
+
+class CryptoPoolBusy(Exception):
+    """Очередь криптографических задач переполнена или операция не выполнена вовремя"""
+
+
+class CryptoPool:
+    """Пул процессов для подписи и проверки подписей.
+
+    Каждый процесс получает приватный ключ сервера при запуске, поэтому
+    задачи передают только сообщение, подпись и PEM ключа клиента.
+    Число задач в очереди ограничено max_pending: при переполнении
+    выбрасывается CryptoPoolBusy, и запрос можно сразу отклонить. Так же
+    отклоняется задача, не выполненная за timeout секунд. Если процесс пула
+    завершился аварийно (например, убит при нехватке памяти), пул
+    пересоздаётся и задача один раз повторяется на новых процессах.
+    """
+
+    def __init__(self, workers, private_key_pem, max_pending=None, queue_timeout=1.0, timeout=10.0):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 64
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._private_key_pem = private_key_pem
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor_lock = threading.Lock()
+        self._executor = self._create_executor(private_key_pem)
+        self.rejected = 0
+        self.timeouts = 0
+        self.rebuilds = 0
+
+    def _create_executor(self, private_key_pem):
+        # spawn не копирует потоки и блокировки родительского процесса
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(private_key_pem,)
+        )
+
+    def _start(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise CryptoPoolBusy("Очередь криптографических операций переполнена")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _rebuild(self, broken):
+        """Замена пула, процессы которого завершились аварийно"""
+        with self._executor_lock:
+            # Пул мог уже пересоздать другой поток, получивший ту же ошибку
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor(self._private_key_pem)
+            self.rebuilds += 1
+        logger.error("Процесс пула криптографических операций завершился аварийно, пул пересоздан")
+        broken.shutdown(wait=False)
+
+    def _run(self, operation):
+        """Выполнение operation() с переводом отказов пула в CryptoPoolBusy"""
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                return operation()
+            except FutureTimeoutError:
+                self.timeouts += 1
+                raise CryptoPoolBusy("Криптографическая операция не выполнена вовремя")
+            except BrokenProcessPool:
+                self._rebuild(executor)
+        raise CryptoPoolBusy("Процессы пула криптографических операций завершились аварийно")
+
+    def _submit(self, fn, *args):
+        return self._run(lambda: self._start(fn, *args).result(timeout=self.timeout))
+
+    def sign(self, message):
+        """Подпись сообщения приватным ключом сервера"""
+        return self._submit(_sign, message)
+
+    def verify(self, public_key_pem, message, signature):
+        """Проверка подписи клиента; возвращает True, если подпись верна"""
+        return self._submit(_verify, public_key_pem, message, signature)
+
+    def verify_many(self, items):
+        """Проверка набора подписей (public_key_pem, message, signature).
+
+        Набор делится на части по числу процессов, чтобы пакет
+        проверялся параллельно и занимал в очереди не больше workers мест.
+        """
+        items = list(items)
+        chunk_size = max(1, -(-len(items) // self.workers))
+
+        def run():
+            futures = [
+                self._start(_verify_many, items[i:i + chunk_size])
+                for i in range(0, len(items), chunk_size)
+            ]
+            results = []
+            for future in futures:
+                results.extend(future.result(timeout=self.timeout))
+            return results
+
+        return self._run(run)
+
+    def restart(self, private_key_pem):
+        """Замена процессов после ротации ключа сервера"""
+        with self._executor_lock:
+            old_executor = self._executor
+            self._private_key_pem = private_key_pem
+            self._executor = self._create_executor(private_key_pem)
+        old_executor.shutdown(wait=False)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,63 @@
+from common.signatures import algorithm_for_key, import_key
+from striped import DEFAULT_SHARDS, ShardedLRU
+
+
+def build_verifier(public_key_pem, algorithm=None):
+    """Разбор PEM публичного ключа клиента и создание объекта проверки подписи.
+
+    Алгоритм подписи определяется по типу ключа; если передано имя алгоритма,
+    оно должно ему соответствовать. Выбрасывает ValueError, если ключ не удаётся
+    разобрать, он не публичный или не поддерживается.
+    """
+    key = import_key(public_key_pem)
+    if key.has_private():
+        raise ValueError("Ожидался публичный ключ")
+    key_algorithm = algorithm_for_key(key)
+    if algorithm is not None and algorithm != key_algorithm.name:
+        raise ValueError("Ключ не соответствует алгоритму подписи")
+    return key_algorithm.verifier(key)
+
+
+class ClientKeyCache:
+    """Ограниченный LRU-кэш готовых объектов проверки подписи по client_id.
+
+    loader(client_id) должен возвращать PEM публичного ключа клиента;
+    он вызывается при промахе, когда запись была вытеснена из кэша, а
+    builder(pem) создаёт из него объект проверки. Кэш разделён на сегменты
+    с отдельными блокировками, поэтому проверки подписей разных клиентов
+    не ждут друг друга.
+    """
+
+    def __init__(self, loader, max_size=10000, builder=build_verifier, shards=DEFAULT_SHARDS):
+        self.loader = loader
+        self.builder = builder
+        self.max_size = max_size
+        self._entries = ShardedLRU(max_size, shards)
+
+    def put(self, client_id, verifier):
+        """Сохранение готового объекта проверки (например, при регистрации)"""
+        self._entries.put(client_id, verifier)
+
+    def get(self, client_id):
+        """Получение объекта проверки подписи; при промахе ключ разбирается заново"""
+        verifier = self._entries.get(client_id)
+        if verifier is not None:
+            return verifier
+
+        # Разбор PEM выполняется вне блокировки, чтобы не задерживать другие запросы
+        verifier = self.builder(self.loader(client_id))
+        self.put(client_id, verifier)
+        return verifier
+
+    def invalidate(self, client_id):
+        self._entries.pop(client_id)
+
+    def stats(self):
+        hits, misses, evictions = self._entries.counters()
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions
+        }
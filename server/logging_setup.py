@@ -0,0 +1,95 @@
+"""Журналирование сервера: уровни, ограничение частоты и запись в фоновом потоке.
+
+Обработчики запросов только кладут запись в ограниченную очередь; вывод в
+stderr выполняет отдельный поток, поэтому медленный терминал или перенаправленный
+вывод не задерживают ответы. Частота одинаковых сообщений ограничивается для
+каждого шаблона отдельно, а число пропущенных записей добавляется к следующей
+пропущенной записи того же шаблона.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Число разных шаблонов сообщений, для которых хранится состояние ограничения
+MAX_TRACKED_TEMPLATES = 1000
+
+
+class RateLimitFilter(logging.Filter):
+    """Не больше rate записей в секунду (с запасом burst) для каждого шаблона сообщения"""
+
+    def __init__(self, rate=10.0, burst=None, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.clock = clock
+        # (логгер, шаблон) -> [доступные записи, время пополнения, пропущено]
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        if self.rate <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_TEMPLATES:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.burst, now, 0]
+
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+
+            bucket[0] -= 1
+            skipped, bucket[2] = bucket[2], 0
+
+        if skipped:
+            record.msg = f"{record.msg} (пропущено похожих сообщений: {skipped})"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Постановка записи в очередь без ожидания: при переполнении запись отбрасывается"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level="INFO", rate=10.0, queue_size=10000):
+    """Настройка корневого логгера; возвращает фильтр ограничения частоты"""
+    log_queue = queue.Queue(maxsize=queue_size)
+    rate_limit = RateLimitFilter(rate)
+
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(rate_limit)
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    return rate_limit
@@ -0,0 +1,70 @@
+"""Потоковая обработка больших сообщений: переворот текста UTF-8 по частям.
+
+Тело запроса по мере поступления проверяется на корректность UTF-8 и
+записывается во временный файл (до memory_limit байт - в памяти). Ответ
+формируется чтением файла с конца блоками, выровненными по границам символов,
+поэтому в памяти одновременно находится один блок, а не исходная строка, её
+перевёрнутая копия и тело ответа JSON с обеими. Перевёрнутый текст занимает
+в UTF-8 ровно столько же байт, сколько исходный, так что длина ответа известна
+до его отправки.
+"""
+import codecs
+import tempfile
+
+# Размер блока, которым перевёрнутый текст читается из файла и отправляется клиенту
+CHUNK_SIZE = 1024 * 1024
+
+
+class MessageTooLarge(Exception):
+    """Тело сообщения превышает допустимый размер"""
+
+
+class Utf8Spool:
+    """Тело сообщения во временном файле с проверкой UTF-8 по частям"""
+
+    def __init__(self, max_size, memory_limit=CHUNK_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=memory_limit)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def write(self, chunk):
+        """Добавление части тела; ValueError при неверном UTF-8, MessageTooLarge сверх max_size"""
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise MessageTooLarge(f"Сообщение больше {self.max_size} байт")
+        # Символ на границе частей декодер запоминает до следующей части
+        self._decoder.decode(chunk)
+        self._file.write(chunk)
+
+    def finish(self):
+        """Проверка, что тело не обрывается посреди символа"""
+        self._decoder.decode(b"", final=True)
+
+    def reversed_chunks(self, chunk_size=CHUNK_SIZE):
+        """Текст, перевёрнутый по символам (как str[::-1]), блоками UTF-8.
+
+        Файл закрывается, когда блоки закончились или генератор закрыт.
+        """
+        # Символ UTF-8 занимает не больше 4 байт, поэтому в блоке такого размера
+        # всегда есть начало символа
+        chunk_size = max(chunk_size, 4)
+        try:
+            position = self.size
+            while position > 0:
+                start = max(0, position - chunk_size)
+                self._file.seek(start)
+                block = self._file.read(position - start)
+                # Начало блока сдвигается вперёд до первого байта символа, а пропущенные
+                # байты продолжения попадают в следующий блок
+                skip = 0
+                if start > 0:
+                    while block[skip] & 0xC0 == 0x80:
+                        skip += 1
+                yield block[skip:].decode()[::-1].encode()
+                position = start + skip
+        finally:
+            self.close()
+
+    def close(self):
+        self._file.close()
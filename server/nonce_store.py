@@ -0,0 +1,154 @@
+from collections import OrderedDict
+import threading
+import time
+
+from striped import DEFAULT_SHARDS
+
+
+class _NonceShard:
+    """Один сегмент хранилища nonce со своей блокировкой.
+
+    Записи хранятся в порядке выдачи, а время жизни у всех одинаковое,
+    поэтому самые старые (и первыми истекающие) записи всегда в начале.
+    Устаревшие записи удаляются лениво: каждая операция просматривает
+    не больше sweep_batch записей из начала, так что очистка никогда
+    не задерживает запрос. При заполнении вытесняется самая старая запись.
+    """
+
+    def __init__(self, ttl, capacity, sweep_batch, clock):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.sweep_batch = sweep_batch
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _sweep(self, now):
+        for _ in range(self.sweep_batch):
+            if not self._entries:
+                return
+            client_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                return
+            del self._entries[client_id]
+            self.expirations += 1
+
+    def __setitem__(self, client_id, value):
+        with self._lock:
+            now = self.clock()
+            self._sweep(now)
+            # Повторная выдача переносит запись в конец с новым сроком жизни
+            self._entries.pop(client_id, None)
+            self._entries[client_id] = (now + self.ttl, value)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, client_id, default=None):
+        """Значение nonce клиента или default, если nonce не выдан или истёк"""
+        with self._lock:
+            now = self.clock()
+            self._sweep(now)
+            entry = self._entries.get(client_id)
+            if entry is None:
+                return default
+            if entry[0] <= now:
+                del self._entries[client_id]
+                self.expirations += 1
+                return default
+            return entry[1]
+
+    def pop(self, client_id, default=None):
+        """Удаление nonce клиента с возвратом его значения"""
+        with self._lock:
+            entry = self._entries.pop(client_id, None)
+            if entry is None or entry[0] <= self.clock():
+                return default
+            return entry[1]
+
+    def consume(self, client_id, expected):
+        """Удаление nonce, только если он действителен и равен expected"""
+        with self._lock:
+            entry = self._entries.get(client_id)
+            if entry is None or entry[1] != expected:
+                return False
+            del self._entries[client_id]
+            if entry[0] <= self.clock():
+                self.expirations += 1
+                return False
+            return True
+
+    def __delitem__(self, client_id):
+        with self._lock:
+            del self._entries[client_id]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NonceStore:
+    """Хранилище выданных nonce с ограниченным временем жизни и ёмкостью.
+
+    Ключ - пара (client_id, протокол), чтобы запросы разных протоколов
+    одного клиента не перезаписывали nonce друг друга. Записи распределены
+    по shards сегментам с отдельными блокировками, так что запросы разных
+    клиентов не ждут друг друга; ёмкость делится между сегментами поровну,
+    и при заполнении сегмента вытесняется его самая старая запись.
+    """
+
+    def __init__(self, ttl=120, capacity=100000, sweep_batch=32, clock=time.monotonic, shards=DEFAULT_SHARDS):
+        shards = max(1, min(shards, capacity))
+        self.ttl = ttl
+        self.capacity = capacity
+        self._shards = [
+            _NonceShard(ttl, -(-capacity // shards), sweep_batch, clock) for _ in range(shards)
+        ]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def __setitem__(self, key, value):
+        self._shard(key)[key] = value
+
+    def get(self, key, default=None):
+        """Значение nonce или default, если nonce не выдан или истёк"""
+        return self._shard(key).get(key, default)
+
+    def pop(self, key, default=None):
+        """Удаление nonce с возвратом его значения"""
+        return self._shard(key).pop(key, default)
+
+    def consume(self, key, expected):
+        """Атомарная проверка и погашение nonce.
+
+        Возвращает True, если nonce был действителен и равен expected; из
+        нескольких параллельных запросов с одним nonce True получит только один.
+        """
+        return self._shard(key).consume(key, expected)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key):
+        del self._shard(key)[key]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "capacity": self.capacity,
+            "ttl": self.ttl,
+            "shards": len(self._shards),
+            "evictions": sum(shard.evictions for shard in self._shards),
+            "expirations": sum(shard.expirations for shard in self._shards)
+        }
@@ -0,0 +1,111 @@
+"""Многопроцессный режим сервера: несколько рабочих процессов на одном порту.
+
+    cd server
+    python prefork.py --workers 8 --port 8080
+
+Родительский процесс создаёт и загружает ключи сервера, открывает слушающий
+сокет и запускает рабочие процессы через fork, так что ключ разбирается один
+раз. Каждый рабочий процесс принимает соединения с общего сокета и обслуживает
+их сервером werkzeug в потоках.
+
+Nonce и кэш повторов хранятся в общей базе SQLite (SHARED_STATE_PATH, по
+умолчанию shared_state.db), клиенты - в реестре REGISTRY_PATH, а токены сессии
+подписываются общим секретом, поэтому nonce, выданный одним процессом,
+проверяется любым другим. Кэши ключей, /stats и /metrics у каждого процесса
+свои. Завершившиеся рабочие процессы перезапускаются; SIGTERM или SIGINT
+останавливают все процессы. Требуется fork (Linux, macOS).
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+os.environ.setdefault("SHARED_STATE_PATH", "shared_state.db")
+
+import server
+from werkzeug.serving import make_server
+
+logger = logging.getLogger("prefork")
+
+# Минимальное время работы процесса, после которого он перезапускается без задержки
+RESTART_BACKOFF = 1.0
+
+
+def run_worker(listener, host, port):
+    # Останавливает рабочие процессы родитель, а Ctrl+C в терминале получают все процессы группы
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server.after_fork()
+    httpd = make_server(host, port, server.app, threaded=True, fd=listener.fileno())
+    logger.info("Рабочий процесс %d принимает соединения", os.getpid())
+    httpd.serve_forever()
+
+
+def spawn_worker(listener, host, port):
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 0
+    try:
+        run_worker(listener, host, port)
+    except BaseException:
+        logger.exception("Рабочий процесс %d завершился с ошибкой", os.getpid())
+        code = 1
+    finally:
+        # Обработчики atexit и блоки finally родителя в дочернем процессе не выполняются
+        os._exit(code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Многопроцессный режим сервера")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число рабочих процессов")
+    parser.add_argument("--host", default="0.0.0.0", help="адрес для прослушивания")
+    parser.add_argument("--port", type=int, default=8080, help="порт")
+    parser.add_argument("--backlog", type=int, default=1024, help="длина очереди входящих соединений")
+    args = parser.parse_args()
+
+    if not server.REGISTRY_PATH:
+        sys.exit("Реестр клиентов в памяти не может быть общим: задайте REGISTRY_PATH")
+
+    server.generate_server_keys()
+    server.server_keys.load()
+
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+    # Соединение может принять другой процесс; тогда accept не ждёт следующего
+    listener.setblocking(False)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    workers = {}
+    try:
+        for _ in range(args.workers):
+            workers[spawn_worker(listener, args.host, args.port)] = time.monotonic()
+        logger.info("Сервер запущен на %s:%d, рабочих процессов: %d, общее состояние: %s",
+                    args.host, args.port, args.workers, server.SHARED_STATE_PATH)
+
+        while True:
+            pid, status = os.wait()
+            started_at = workers.pop(pid, None)
+            if started_at is None:
+                continue
+            logger.warning("Рабочий процесс %d завершился (код %d), перезапуск",
+                           pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started_at < RESTART_BACKOFF:
+                time.sleep(RESTART_BACKOFF)
+            workers[spawn_worker(listener, args.host, args.port)] = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+        for pid in workers:
+            os.waitpid(pid, 0)
+        logger.info("Сервер остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Выборочное профилирование запросов работающего сервера.
+
+Профилирование включается переменными окружения при запуске или через
+административный маршрут и профилирует заданную долю запросов с помощью
+cProfile. Профили накапливаются по маршрутам и записываются в каталог сессии:
+
+    profiles/20250101-120000/auth_timestamp.pstats   - для pstats и snakeviz
+    profiles/20250101-120000/auth_timestamp.txt      - функции по суммарному времени
+
+Ожидание блокировок видно в профиле как время в методе acquire. Пока
+профилирование выключено, каждый запрос проверяет только один атрибут.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Число функций в текстовом отчёте по маршруту
+REPORT_LIMIT = 40
+
+
+def _route_filename(route):
+    name = "".join(c if c.isalnum() else "_" for c in route.strip("/"))
+    return name or "root"
+
+
+class RequestProfiler:
+    """Профилирование доли sample_rate запросов в течение duration секунд (0 - без ограничения)"""
+
+    def __init__(self, output_dir="profiles", clock=time.time):
+        self.output_dir = output_dir
+        self.clock = clock
+        self.active = False
+        self.sample_rate = 0.0
+        self.started_at = None
+        self.until = None
+        self.session_dir = None
+        self._stats = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def start(self, sample_rate=1.0, duration=0):
+        """Начало новой сессии профилирования; прежняя сессия завершается и сохраняется"""
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Доля профилируемых запросов должна быть в интервале (0, 1]")
+        self.stop()
+
+        with self._lock:
+            self.started_at = self.clock()
+            self.session_dir = os.path.join(
+                self.output_dir, time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+            )
+            self._stats = {}
+            self._counts = {}
+            self.sample_rate = sample_rate
+            self.until = self.started_at + duration if duration else None
+            self.active = True
+
+        if duration:
+            self._timer = threading.Timer(duration, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        logger.info("Профилирование включено: доля запросов %.3f, длительность %s, каталог %s",
+                    sample_rate, f"{duration:g} с" if duration else "не ограничена", self.session_dir)
+
+    def stop(self):
+        """Завершение сессии и запись профилей; возвращает каталог сессии или None"""
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            if self._timer is not None and self._timer is not threading.current_thread():
+                self._timer.cancel()
+            self._timer = None
+        self.dump()
+        logger.info("Профилирование выключено, профили записаны в %s", self.session_dir)
+        return self.session_dir
+
+    def begin(self):
+        """Профиль для текущего запроса или None, если запрос не попал в выборку"""
+        if not self.active or random.random() >= self.sample_rate:
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # В этом потоке уже работает другой профилировщик
+            return None
+        return profile
+
+    def end(self, profile, route):
+        """Завершение профиля запроса и добавление его к профилю маршрута"""
+        if profile is None:
+            return
+        profile.disable()
+
+        with self._lock:
+            if not self.active:
+                return
+            stats = self._stats.get(route)
+            if stats is None:
+                self._stats[route] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._counts[route] = self._counts.get(route, 0) + 1
+
+    def run(self, route, function, *args):
+        """Вызов function(*args) с профилированием, если запрос попал в выборку"""
+        profile = self.begin()
+        try:
+            return function(*args)
+        finally:
+            self.end(profile, route)
+
+    def dump(self):
+        """Запись накопленных профилей маршрутов в каталог сессии"""
+        with self._lock:
+            routes = list(self._stats.items())
+            counts = dict(self._counts)
+            if not routes:
+                return
+            os.makedirs(self.session_dir, exist_ok=True)
+            for route, stats in routes:
+                path = os.path.join(self.session_dir, _route_filename(route))
+                stats.dump_stats(path + ".pstats")
+
+                report = io.StringIO()
+                report.write(f"Маршрут {route}, профилей запросов: {counts[route]}\n")
+                pstats.Stats(path + ".pstats", stream=report).sort_stats("cumulative").print_stats(REPORT_LIMIT)
+                with open(path + ".txt", "w", encoding="utf-8") as f:
+                    f.write(report.getvalue())
+
+    def status(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "sample_rate": self.sample_rate if self.active else 0.0,
+                "remaining": max(0.0, round(self.until - self.clock(), 1)) if self.active and self.until else None,
+                "directory": self.session_dir,
+                "profiled": dict(self._counts)
+            }
@@ -0,0 +1,101 @@
+import threading
+import time
+
+# Частота входов (в секунду), на которую по умолчанию рассчитан предел кэша
+DEFAULT_RATE = 10000
+
+
+def capacity_for_rate(rate, window, bucket_width=10):
+    """Предел числа записей, при котором кэш не заполняется при rate входах в секунду.
+
+    Сервер принимает метки от now - window до now + window, а корзина удаляется
+    после выхода из окна всех её меток, поэтому запись живёт не дольше
+    2 * window + bucket_width секунд.
+    """
+    return rate * (2 * window + bucket_width)
+
+
+class ReplayCacheFull(Exception):
+    """Достигнут предел памяти кэша повторов"""
+
+
+class ReplayCache:
+    """Точный кэш уже принятых входов протокола с меткой времени.
+
+    Запись - ID клиента и метка времени (в рукопожатии - ещё и nonce клиента),
+    а не подпись: подпись ECDSA (r, s) без ключа меняется на (r, n - s) и
+    остаётся верной, так что кэш по подписи пропустил бы такую копию как
+    новый вход. Подписи клиентов детерминированы, поэтому честный клиент и
+    раньше не мог войти дважды с одной меткой.
+
+    Записи разложены по корзинам по значению метки времени
+    (timestamp // bucket_width), поэтому проверка - один поиск в множестве
+    одной корзины. Подпись с меткой,
+    вышедшей за окно допустимого расхождения, сервер отклонит и без кэша,
+    поэтому корзины старше окна удаляются целиком. Число записей ограничено
+    max_entries: при заполнении новые входы отклоняются (ReplayCacheFull),
+    а не вытесняют записи, которые ещё могут быть воспроизведены; предел
+    для ожидаемой частоты входов даёт capacity_for_rate().
+    """
+
+    def __init__(self, window=300, bucket_width=10, max_entries=1000000, clock=time.time):
+        self.window = window
+        self.bucket_width = bucket_width
+        self.max_entries = max_entries
+        self.clock = clock
+        self._buckets = {}
+        self._size = 0
+        self._purged_before = None
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.rejected_full = 0
+
+    @staticmethod
+    def _key(client_id, timestamp, nonce):
+        return hash((client_id, timestamp, nonce))
+
+    def _purge(self, now):
+        # Корзины, все метки которых старше now - window, больше не нужны
+        oldest = int(now - self.window) // self.bucket_width
+        if self._purged_before == oldest:
+            return
+        for index in [index for index in self._buckets if index < oldest]:
+            self._size -= len(self._buckets.pop(index))
+        self._purged_before = oldest
+
+    def seen(self, client_id, timestamp, nonce=None):
+        """True, если вход клиента с этой меткой времени (и nonce) уже был принят"""
+        bucket = self._buckets.get(timestamp // self.bucket_width)
+        if bucket is not None and self._key(client_id, timestamp, nonce) in bucket:
+            self.replays += 1
+            return True
+        return False
+
+    def add(self, client_id, timestamp, nonce=None):
+        """Запоминание принятого входа; возвращает False, если он уже был принят"""
+        key = self._key(client_id, timestamp, nonce)
+        with self._lock:
+            self._purge(self.clock())
+            bucket = self._buckets.setdefault(timestamp // self.bucket_width, set())
+            if key in bucket:
+                self.replays += 1
+                return False
+            if self._size >= self.max_entries:
+                self.rejected_full += 1
+                raise ReplayCacheFull("Превышен предел памяти кэша повторов")
+            bucket.add(key)
+            self._size += 1
+            return True
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        return {
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "window": self.window,
+            "buckets": len(self._buckets),
+            "replays": self.replays,
+            "rejected_full": self.rejected_full
+        }
@@ -1,279 +1,1049 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest, UnsupportedMediaType
 import json
+import logging
 import time
 import os
-from Crypto.PublicKey import RSA
-from Crypto.Signature import pkcs1_15
-from Crypto.Hash import SHA256
-import base64
+import sys
 import random
 import socket
+import hmac
+
+# Общие модули клиента и сервера находятся в каталоге common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.signatures import ALGORITHMS, DEFAULT_ALGORITHM, get_algorithm, export_private_pem, export_public_pem
+from common import wire
+from key_cache import ClientKeyCache, build_verifier
+from server_keys import ServerKeyManager
+from crypto_pool import CryptoPool, CryptoPoolBusy
+from nonce_store import NonceStore
+from client_registry import ClientRegistry
+from striped import StripedDict, StripedSet
+from shared_state import StateDatabase, SharedNonceStore, SharedReplayCache
+from replay_cache import DEFAULT_RATE as REPLAY_CACHE_DEFAULT_RATE, ReplayCache, ReplayCacheFull, capacity_for_rate
+from admission import AdmissionController, AdmissionRejected
+from message_stream import MessageTooLarge, Utf8Spool
+from session_tokens import SessionTokenIssuer, load_or_create_secret
+from metrics import MetricsRegistry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from logging_setup import configure_logging
+from profiler import RequestProfiler
+
+# Уровень журнала и максимальное число одинаковых сообщений в секунду (0 - без ограничения)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", 10))
+configure_logging(LOG_LEVEL, LOG_RATE_LIMIT)
+logger = logging.getLogger("server")
+
+class WireJSONProvider(DefaultJSONProvider):
+    """JSON-ответы Flask, в которых двоичные поля (подписи) передаются в base64"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (bytes, bytearray)):
+            return wire.json_default(o)
+        return DefaultJSONProvider.default(o)
 
 app = Flask(__name__)
+app.json = WireJSONProvider(app)
 
 # Пути к ключам
 SERVER_PRIVATE_KEY_PATH = "server_private_key.pem"
 SERVER_PUBLIC_KEY_PATH = "server_public_key.pem"
 
-# Словарь для хранения зарегистрированных клиентов и их ключей
-registered_clients = {}
+# Алгоритм подписи, с которым генерируются ключи сервера (rsa, ecdsa-p256, ed25519)
+SERVER_KEY_ALGORITHM = os.environ.get("SERVER_KEY_ALGORITHM", DEFAULT_ALGORITHM)
+
+# Период проверки PEM-файлов на изменение (0 - не следить за файлами)
+SERVER_KEY_RELOAD_INTERVAL = float(os.environ.get("SERVER_KEY_RELOAD_INTERVAL", 5))
+
+# Ключи сервера хранятся в памяти и перезагружаются при ротации файлов
+server_keys = ServerKeyManager(SERVER_PRIVATE_KEY_PATH, SERVER_PUBLIC_KEY_PATH)
+
+# Допустимое расхождение (в секундах) метки времени с часами сервера
+TIMESTAMP_WINDOW = int(os.environ.get("TIMESTAMP_WINDOW", 300))
+
+# Путь к базе реестра клиентов (пустая строка - хранить клиентов только в памяти)
+REGISTRY_PATH = os.environ.get("REGISTRY_PATH", "clients.db")
+
+# Путь к базе состояния, общего для рабочих процессов (nonce и кэш повторов);
+# пустая строка - состояние хранится в памяти процесса
+SHARED_STATE_PATH = os.environ.get("SHARED_STATE_PATH", "")
+state_database = StateDatabase(SHARED_STATE_PATH) if SHARED_STATE_PATH else None
+
+# Реестр зарегистрированных клиентов и их ключей, сохраняемый между перезапусками.
+# При общем состоянии регистрации записываются сразу, чтобы их видели все процессы
+registered_clients = (
+    ClientRegistry(REGISTRY_PATH, synchronous=state_database is not None) if REGISTRY_PATH
+    else StripedDict()
+)
+
+# Кэш разобранных публичных ключей клиентов (размер задаётся переменной окружения)
+KEY_CACHE_SIZE = int(os.environ.get("KEY_CACHE_SIZE", 10000))
+client_key_cache = ClientKeyCache(
+    lambda client_id: registered_clients[client_id]['public_key'],
+    max_size=KEY_CACHE_SIZE,
+    builder=lambda public_key_pem: timed_build_verifier(public_key_pem)
+)
+
+# Время жизни выданного nonce (в секундах) и максимальное число хранимых nonce
+NONCE_TTL = float(os.environ.get("NONCE_TTL", 120))
+NONCE_STORE_CAPACITY = int(os.environ.get("NONCE_STORE_CAPACITY", 100000))
+
+# Число сегментов с отдельными блокировками в хранилище nonce
+NONCE_STORE_SHARDS = int(os.environ.get("NONCE_STORE_SHARDS", 64))
+
+# Хранилище временных случайных чисел (nonce) сессий с истечением срока и вытеснением.
+# Ключ - (client_id, протокол), чтобы запрос-ответ и взаимная аутентификация
+# одного клиента не перезаписывали nonce друг друга
+if state_database is not None:
+    client_nonces = SharedNonceStore(state_database, ttl=NONCE_TTL, capacity=NONCE_STORE_CAPACITY)
+else:
+    client_nonces = NonceStore(ttl=NONCE_TTL, capacity=NONCE_STORE_CAPACITY, shards=NONCE_STORE_SHARDS)
+NONCE_CHALLENGE = "challenge"
+NONCE_MUTUAL = "mutual"
+
+# Множество аутентифицированных клиентов
+authenticated_clients = StripedSet()
+
+# Кэш принятых входов протокола с меткой времени для защиты от повторов.
+# Предел числа записей (0 - рассчитать по ожидаемой частоте входов REPLAY_CACHE_RATE)
+# задаёт бюджет памяти (около 100 байт на запись); при заполнении входы отклоняются
+REPLAY_CACHE_RATE = int(os.environ.get("REPLAY_CACHE_RATE", REPLAY_CACHE_DEFAULT_RATE))
+REPLAY_CACHE_MAX_ENTRIES = (
+    int(os.environ.get("REPLAY_CACHE_MAX_ENTRIES", 0))
+    or capacity_for_rate(REPLAY_CACHE_RATE, TIMESTAMP_WINDOW)
+)
+if state_database is not None:
+    replay_cache = SharedReplayCache(state_database, window=TIMESTAMP_WINDOW, max_entries=REPLAY_CACHE_MAX_ENTRIES)
+else:
+    replay_cache = ReplayCache(window=TIMESTAMP_WINDOW, max_entries=REPLAY_CACHE_MAX_ENTRIES)
+
+# Секрет для подписи токенов сессии: из переменной окружения или из общего файла,
+# чтобы токены переживали перезапуск и принимались всеми процессами сервера
+SESSION_SECRET_PATH = "session_secret.key"
+SESSION_TOKEN_TTL = int(os.environ.get("SESSION_TOKEN_TTL", 900))
+# Время (в секундах) от входа с проверкой подписи, после которого токен не продлевается
+SESSION_MAX_LIFETIME = int(os.environ.get("SESSION_MAX_LIFETIME", 43200))
+session_tokens = SessionTokenIssuer(
+    os.environ["SESSION_SECRET"].encode() if os.environ.get("SESSION_SECRET")
+    else load_or_create_secret(SESSION_SECRET_PATH),
+    ttl=SESSION_TOKEN_TTL,
+    max_lifetime=SESSION_MAX_LIFETIME
+)
+
+# Число процессов для операций подписи (0 - операции выполняются в потоке запроса).
+# Пул ускоряет подпись только на нескольких ядрах: на одном он лишь добавляет передачу
+# задач между процессами, поэтому там операции всегда выполняются в потоке запроса
+CRYPTO_WORKERS = int(os.environ.get("CRYPTO_WORKERS", 0))
+# Максимальное число задач в очереди пула (0 - по 64 задачи на процесс)
+CRYPTO_QUEUE_SIZE = int(os.environ.get("CRYPTO_QUEUE_SIZE", 0))
+
+crypto_pool = None
+
+# Максимальное число записей в одном запросе /auth/batch
+AUTH_BATCH_MAX_SIZE = int(os.environ.get("AUTH_BATCH_MAX_SIZE", 1000))
+
+# Максимальная длина случайного числа клиента в /auth/handshake
+HANDSHAKE_NONCE_MAX_LENGTH = 128
 
-# Словарь для хранения временных случайных чисел (nonce) сессий
-client_nonces = {}
+# Максимальное число сообщений в одном запросе /message
+MESSAGE_BATCH_MAX_SIZE = int(os.environ.get("MESSAGE_BATCH_MAX_SIZE", 1000))
+# Максимальный размер (в байтах) сообщения /message/stream и объём, до которого оно
+# хранится в памяти, а не во временном файле
+MESSAGE_STREAM_MAX_SIZE = int(os.environ.get("MESSAGE_STREAM_MAX_SIZE", 1024 * 1024 * 1024))
+MESSAGE_STREAM_MEMORY = int(os.environ.get("MESSAGE_STREAM_MEMORY", 1024 * 1024))
 
-# Словарь для хранения аутентифицированных клиентов
-authenticated_clients = set()
+# Допуск к криптографическим операциям: проверок подписи в секунду на клиента и
+# на сервер (0 - без ограничения), запас корзин и число запросов с криптографией
+# в обработке одновременно (0 - без ограничения)
+ADMISSION_CLIENT_RATE = float(os.environ.get("ADMISSION_CLIENT_RATE", 10))
+ADMISSION_CLIENT_BURST = float(os.environ.get("ADMISSION_CLIENT_BURST", 0)) or None
+ADMISSION_GLOBAL_RATE = float(os.environ.get("ADMISSION_GLOBAL_RATE", 0))
+ADMISSION_GLOBAL_BURST = float(os.environ.get("ADMISSION_GLOBAL_BURST", 0)) or None
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", 64))
+admission = AdmissionController(
+    client_rate=ADMISSION_CLIENT_RATE, client_burst=ADMISSION_CLIENT_BURST,
+    global_rate=ADMISSION_GLOBAL_RATE, global_burst=ADMISSION_GLOBAL_BURST,
+    max_in_flight=MAX_IN_FLIGHT
+)
 
-# Генерация ключей RSA для сервера, если они не существуют
+# Маршруты с подписью или проверкой подписей, на которые действует предел MAX_IN_FLIGHT
+CRYPTO_ROUTES = {
+    "/register", "/auth/timestamp", "/auth/challenge/verify",
+    "/auth/mutual", "/auth/mutual/verify", "/auth/handshake", "/auth/batch"
+}
+
+# Метрики сервера в формате Prometheus, доступные по адресу /metrics
+metrics = MetricsRegistry()
+REQUESTS_TOTAL = metrics.counter(
+    "auth_http_requests_total", "Число обработанных запросов", ("route", "method", "status")
+)
+REQUEST_SECONDS = metrics.histogram(
+    "auth_http_request_duration_seconds", "Время обработки запроса", ("route",)
+)
+# Операции: key_import, sign, verify, verify_batch, payload_decode, payload_encode
+OPERATION_SECONDS = metrics.histogram(
+    "auth_operation_duration_seconds", "Время криптографических операций и разбора тел сообщений", ("operation",)
+)
+metrics.gauge("auth_registered_clients", "Число зарегистрированных клиентов", lambda: len(registered_clients))
+metrics.gauge("auth_pending_nonces", "Число выданных и ещё не использованных nonce", lambda: len(client_nonces))
+metrics.gauge("auth_authenticated_clients", "Число клиентов, прошедших аутентификацию", lambda: len(authenticated_clients))
+metrics.gauge("auth_replay_cache_entries", "Число записей кэша повторов", lambda: len(replay_cache))
+metrics.gauge("auth_crypto_requests_in_flight", "Число запросов с криптографией в обработке", lambda: admission.in_flight)
+
+# Выборочное профилирование запросов: доля запросов (0 - выключено), длительность
+# в секундах (0 - до выключения) и каталог для профилей
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DURATION = float(os.environ.get("PROFILE_DURATION", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+profiler = RequestProfiler(PROFILE_DIR)
+
+# Токен для административных маршрутов (пустая строка - маршруты отключены)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Генерация ключей сервера, если они не существуют
 def generate_server_keys():
     if not os.path.exists(SERVER_PRIVATE_KEY_PATH):
-        print("Генерация ключей RSA для сервера...")
-        key = RSA.generate(2048)
+        algorithm = get_algorithm(SERVER_KEY_ALGORITHM)
+        logger.info("Генерация ключей %s для сервера...", algorithm.name)
+        key = algorithm.generate()
         
         # Сохранение приватного ключа
-        with open(SERVER_PRIVATE_KEY_PATH, "wb") as f:
-            f.write(key.export_key())
+        with open(SERVER_PRIVATE_KEY_PATH, "w") as f:
+            f.write(export_private_pem(key))
         
         # Сохранение публичного ключа
-        with open(SERVER_PUBLIC_KEY_PATH, "wb") as f:
-            f.write(key.publickey().export_key())
+        with open(SERVER_PUBLIC_KEY_PATH, "w") as f:
+            f.write(export_public_pem(key))
         
-        print("Ключи сгенерированы и сохранены")
+        logger.info("Ключи сгенерированы и сохранены")
+
+# Запуск пула процессов для подписи и проверки подписей
+def start_crypto_pool():
+    global crypto_pool
+    if CRYPTO_WORKERS <= 0:
+        return
+    if os.cpu_count() == 1:
+        logger.warning("CRYPTO_WORKERS=%d не используется: на одном ядре операции выполняются в потоке запроса",
+                       CRYPTO_WORKERS)
+        return
+    
+    crypto_pool = CryptoPool(
+        CRYPTO_WORKERS,
+        server_keys.current().private_key_pem,
+        max_pending=CRYPTO_QUEUE_SIZE or None
+    )
+    # После ротации ключей процессы пула перезапускаются с новым ключом
+    server_keys.add_listener(lambda snapshot: crypto_pool.restart(snapshot.private_key_pem))
+    logger.info("Запущен пул криптографических операций: %d процессов", CRYPTO_WORKERS)
+
+# Разбор публичного ключа клиента с учётом времени в метриках
+def timed_build_verifier(public_key_pem, algorithm=None):
+    with OPERATION_SECONDS.time("key_import"):
+        return build_verifier(public_key_pem, algorithm)
+
+# Включение профилирования при запуске, если оно задано переменными окружения
+def start_profiler():
+    if PROFILE_SAMPLE_RATE > 0:
+        profiler.start(PROFILE_SAMPLE_RATE, PROFILE_DURATION)
+
+# Подготовка рабочего процесса после fork: фоновые потоки родителя в нём не работают,
+# а ключи сервера уже загружены родителем
+def after_fork():
+    configure_logging(LOG_LEVEL, LOG_RATE_LIMIT)
+    if isinstance(registered_clients, ClientRegistry):
+        registered_clients.after_fork()
+    start_crypto_pool()
+    start_profiler()
+    server_keys.start_watching(SERVER_KEY_RELOAD_INTERVAL)
+
+# Подпись сообщения приватным ключом сервера
+def sign_server_message(message):
+    with OPERATION_SECONDS.time("sign"):
+        if crypto_pool is not None:
+            return crypto_pool.sign(message)
+        return server_keys.current().signer.sign(message)
+
+# Проверка подписи клиента; возвращает True, если подпись верна
+def verify_client_signature(client_id, message, signature_bytes):
+    if check_client_signature(client_id, message, signature_bytes):
+        return True
+    
+    # При общем состоянии клиент мог заново зарегистрироваться с другим ключом
+    # в другом процессе; тогда ключ в кэшах этого процесса устарел
+    if refresh_client_key(client_id):
+        return check_client_signature(client_id, message, signature_bytes)
+    return False
 
-# Загрузка ключей сервера
-def load_server_keys():
-    with open(SERVER_PRIVATE_KEY_PATH, "rb") as f:
-        private_key = RSA.import_key(f.read())
+def check_client_signature(client_id, message, signature_bytes):
+    if crypto_pool is not None:
+        public_key_pem = registered_clients[client_id]['public_key']
+        with OPERATION_SECONDS.time("verify"):
+            return crypto_pool.verify(public_key_pem, message, signature_bytes)
     
-    with open(SERVER_PUBLIC_KEY_PATH, "rb") as f:
-        public_key = RSA.import_key(f.read())
+    # Объект проверки берётся из кэша ключей; разбор ключа при промахе учитывается отдельно
+    verifier = client_key_cache.get(client_id)
+    try:
+        with OPERATION_SECONDS.time("verify"):
+            verifier.verify(message, signature_bytes)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+# Проверка набора подписей (client_id, message, signature_bytes); возвращает список результатов
+def verify_client_signatures(items):
+    if crypto_pool is not None:
+        items = [
+            (registered_clients[client_id]['public_key'], message, signature_bytes)
+            for client_id, message, signature_bytes in items
+        ]
+        with OPERATION_SECONDS.time("verify_batch"):
+            return crypto_pool.verify_many(items)
     
-    return private_key, public_key
+    # Объект проверки берётся из кэша один раз для каждого клиента пакета
+    verifiers = {}
+    results = []
+    for client_id, message, signature_bytes in items:
+        if client_id not in verifiers:
+            verifiers[client_id] = client_key_cache.get(client_id)
+        try:
+            verifiers[client_id].verify(message, signature_bytes)
+            results.append(True)
+        except (ValueError, TypeError):
+            results.append(False)
+    return results
+
+# Дешёвые проверки подписи до криптографии: корректный base64 и длина, которую даёт
+# ключ клиента. Возвращает подпись в виде bytes или None, если она заведомо неверна
+def decode_client_signature(client_id, signature):
+    try:
+        signature_bytes = wire.as_bytes(signature, validate=True)
+    except (ValueError, TypeError):
+        return None
+    
+    if len(signature_bytes) != client_key_cache.get(client_id).signature_size:
+        # Ключ мог быть заменён повторной регистрацией в другом процессе
+        if not refresh_client_key(client_id) or \
+                len(signature_bytes) != client_key_cache.get(client_id).signature_size:
+            return None
+    return signature_bytes
+
+# Сброс ключа клиента в кэшах процесса, если при общем состоянии он изменился в реестре
+def refresh_client_key(client_id):
+    if state_database is None or not isinstance(registered_clients, ClientRegistry):
+        return False
+    if not registered_clients.reload(client_id):
+        return False
+    client_key_cache.invalidate(client_id)
+    return True
+
+# Разбор тела запроса в формате из заголовка Content-Type (по умолчанию JSON)
+def read_payload(silent=False):
+    with OPERATION_SECONDS.time("payload_decode"):
+        if request.mimetype != wire.MSGPACK:
+            return request.get_json(silent=silent)
+        
+        if wire.MSGPACK not in wire.MIMETYPES:
+            raise UnsupportedMediaType("Формат MessagePack не поддерживается сервером")
+        try:
+            return wire.decode(request.get_data(), wire.MSGPACK)
+        except ValueError:
+            if silent:
+                return None
+            raise BadRequest("Неверное тело запроса MessagePack")
+
+# Ответ в формате, запрошенном заголовком Accept (по умолчанию JSON)
+def respond(body, status=200):
+    mimetype = request.accept_mimetypes.best_match(wire.MIMETYPES, default=wire.JSON)
+    with OPERATION_SECONDS.time("payload_encode"):
+        if mimetype == wire.JSON:
+            response = jsonify(body)
+        else:
+            response = app.response_class(wire.encode(body, mimetype), mimetype=mimetype)
+    response.status_code = status
+    return response
+
+# Учёт числа и длительности запросов по маршрутам и выборочное профилирование
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = profiler.begin()
+
+# Ограничение числа запросов с криптографией в обработке: сверх предела - сразу 503.
+# Тело читается до занятия места, чтобы медленные клиенты его не удерживали
+@app.before_request
+def enter_crypto_route():
+    if request.path in CRYPTO_ROUTES:
+        request.get_data()
+        admission.enter()
+        g.admitted = True
+
+@app.teardown_request
+def leave_crypto_route(exc):
+    if g.pop("admitted", False):
+        admission.leave()
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+# Профиль и метрики запроса завершаются и при необработанном исключении: в режиме
+# отладки оно передаётся дальше, и after_request не вызывается
+@app.teardown_request
+def observe_request(exc):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    profiler.end(g.pop("profile", None), route)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route)
+    status = 500 if exc is not None else g.get("response_status", 500)
+    REQUESTS_TOTAL.inc(route, request.method, str(status))
+
+# Очередь пула переполнена - быстро отвечаем, не накапливая запросы
+@app.errorhandler(CryptoPoolBusy)
+def crypto_pool_busy(e):
+    return respond({"error": "Сервер перегружен, повторите попытку позже"}, 503)
+
+# Превышен предел частоты или числа запросов в обработке - ответ до криптографии
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = respond({"error": e.message}, e.status)
+    response.headers.update(e.headers)
+    return response
+
+# Кэш повторов заполнен - новые входы по метке времени временно отклоняются
+@app.errorhandler(ReplayCacheFull)
+def replay_cache_full(e):
+    return respond({"error": "Сервер перегружен, повторите попытку позже"}, 503)
 
 # Маршрут для получения публичного ключа сервера
 @app.route('/get_server_public_key', methods=['GET'])
 def get_server_public_key():
-    _, public_key = load_server_keys()
-    return jsonify({
-        "public_key": public_key.export_key().decode()
-    })
+    snapshot = server_keys.current()
+    mimetype = request.accept_mimetypes.best_match(wire.MIMETYPES, default=wire.JSON)
+    body, etag = snapshot.public_key_bodies[mimetype]
+    
+    # Клиент может перепроверить закэшированный ключ по ETag
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype=mimetype)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
 
 # Маршрут для регистрации клиента
-@app.route('/register', methods=['POST'])
-def register_client():
-    data = request.json
+def handle_register(data):
     client_id = data.get('client_id')
-    client_public_key = data.get('public_key')
+    # В MessagePack ключ передаётся в DER; в реестре ключи хранятся в PEM
+    client_public_key = wire.as_public_key_pem(data.get('public_key'))
+    algorithm = data.get('algorithm', DEFAULT_ALGORITHM)
     
     if not client_id or not client_public_key:
-        return jsonify({"error": "Отсутствует ID клиента или публичный ключ"}), 400
+        return {"error": "Отсутствует ID клиента или публичный ключ"}, 400
+    
+    if algorithm not in ALGORITHMS:
+        return {"error": f"Неподдерживаемый алгоритм подписи: {algorithm}"}, 400
+    
+    admission.admit(client_id)
+    
+    # Разбор и проверка ключа выполняются один раз, при регистрации
+    try:
+        verifier = timed_build_verifier(client_public_key, algorithm)
+    except (ValueError, IndexError, TypeError):
+        return {"error": "Неверный формат публичного ключа"}, 400
     
     # Сохранение публичного ключа клиента
     registered_clients[client_id] = {
         "public_key": client_public_key
     }
+    client_key_cache.put(client_id, verifier)
     
-    print(f"Клиент {client_id} зарегистрирован")
-    return jsonify({"status": "success", "message": "Клиент зарегистрирован"})
+    logger.info("Клиент %s зарегистрирован (%s)", client_id, algorithm)
+    return {"status": "success", "message": "Клиент зарегистрирован"}, 200
+
+@app.route('/register', methods=['POST'])
+def register_client():
+    return respond(*handle_register(read_payload()))
 
 # Модифицируем функции аутентификации, чтобы добавлять успешно аутентифицированных клиентов
 def mark_client_authenticated(client_id):
     authenticated_clients.add(client_id)
-    print(f"Клиент {client_id} добавлен в список аутентифицированных")
+    logger.debug("Клиент %s добавлен в список аутентифицированных", client_id)
+    
+    # Выдача токена сессии, который клиент передаёт в /message
+    token, expires_at = session_tokens.issue(client_id)
+    return {"session_token": token, "expires_in": max(0, int(expires_at - time.time()))}
+
+# Получение токена сессии из заголовка Authorization или из тела запроса
+def get_session_token(data, authorization):
+    if authorization and authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+    if isinstance(data, dict):
+        return data.get('session_token')
+    return None
 
 # Модифицируем все функции успешной аутентификации
-@app.route('/auth/timestamp', methods=['POST'])
-def auth_timestamp():
-    data = request.json
+def handle_auth_timestamp(data):
     client_id = data.get('client_id')
     timestamp = data.get('timestamp')
     signature = data.get('signature')
     
     if not client_id or not timestamp or not signature:
-        return jsonify({"error": "Отсутствуют необходимые данные"}), 400
+        return {"error": "Отсутствуют необходимые данные"}, 400
     
     if client_id not in registered_clients:
-        return jsonify({"error": "Клиент не зарегистрирован"}), 401
+        return {"error": "Клиент не зарегистрирован"}, 401
     
-    # Проверка актуальности временной метки (допустимая разница 5 минут)
+    # Проверка актуальности временной метки (по умолчанию допустимая разница 5 минут)
+    try:
+        timestamp = int(timestamp)
+    except (ValueError, TypeError):
+        return {"error": "Неверный формат данных"}, 400
     current_time = int(time.time())
-    if abs(current_time - int(timestamp)) > 300:
-        return jsonify({"error": "Временная метка устарела"}), 401
+    if abs(current_time - timestamp) > TIMESTAMP_WINDOW:
+        return {"error": "Временная метка устарела"}, 401
+    
+    # Подпись передаётся в base64 (JSON) или как есть (MessagePack)
+    signature_bytes = decode_client_signature(client_id, signature)
+    if signature_bytes is None:
+        return {"error": "Неверная подпись"}, 401
+    
+    # Повторный вход с той же меткой отклоняется до проверки подписи
+    if replay_cache.seen(client_id, timestamp):
+        return {"error": "Повторное использование подписи"}, 401
     
-    # Преобразование подписи из base64
-    signature_bytes = base64.b64decode(signature)
+    admission.admit(client_id)
     
     # Подготовка сообщения для проверки подписи
     message = f"{client_id}:{timestamp}".encode()
-    h = SHA256.new(message)
     
-    try:
-        # Загрузка публичного ключа клиента
-        client_public_key = RSA.import_key(registered_clients[client_id]['public_key'])
-        # Проверка подписи
-        pkcs1_15.new(client_public_key).verify(h, signature_bytes)
-        mark_client_authenticated(client_id)
-        return jsonify({"status": "success", "message": "Аутентификация успешна"})
-    except (ValueError, TypeError):
-        return jsonify({"error": "Неверная подпись"}), 401
+    # Проверка подписи
+    if not verify_client_signature(client_id, message, signature_bytes):
+        return {"error": "Неверная подпись"}, 401
+    
+    # Параллельный запрос с той же меткой мог успеть пройти проверку раньше
+    if not replay_cache.add(client_id, timestamp):
+        return {"error": "Повторное использование подписи"}, 401
+    
+    session = mark_client_authenticated(client_id)
+    return {"status": "success", "message": "Аутентификация успешна", **session}, 200
+
+@app.route('/auth/timestamp', methods=['POST'])
+def auth_timestamp():
+    return respond(*handle_auth_timestamp(read_payload()))
 
 # 2. Протокол односторонней аутентификации с использованием случайных чисел
-@app.route('/auth/challenge', methods=['POST'])
-def auth_challenge_request():
-    data = request.json
+def handle_auth_challenge(data):
     client_id = data.get('client_id')
     
     if not client_id:
-        return jsonify({"error": "Отсутствует ID клиента"}), 400
+        return {"error": "Отсутствует ID клиента"}, 400
     
     if client_id not in registered_clients:
-        return jsonify({"error": "Клиент не зарегистрирован"}), 401
+        return {"error": "Клиент не зарегистрирован"}, 401
     
     # Генерация случайного числа
     nonce = random.randint(100000, 999999)
-    client_nonces[client_id] = nonce
+    client_nonces[client_id, NONCE_CHALLENGE] = nonce
     
-    return jsonify({
+    return {
         "status": "success", 
         "nonce": nonce
-    })
+    }, 200
 
-@app.route('/auth/challenge/verify', methods=['POST'])
-def auth_challenge_verify():
-    data = request.json
+@app.route('/auth/challenge', methods=['POST'])
+def auth_challenge_request():
+    return respond(*handle_auth_challenge(read_payload()))
+
+def handle_auth_challenge_verify(data):
     client_id = data.get('client_id')
     signature = data.get('signature')
     
     if not client_id or not signature:
-        return jsonify({"error": "Отсутствуют необходимые данные"}), 400
+        return {"error": "Отсутствуют необходимые данные"}, 400
+    
+    nonce = client_nonces.get((client_id, NONCE_CHALLENGE))
+    if client_id not in registered_clients or nonce is None:
+        return {"error": "Клиент не зарегистрирован или нет активного запроса"}, 401
     
-    if client_id not in registered_clients or client_id not in client_nonces:
-        return jsonify({"error": "Клиент не зарегистрирован или нет активного запроса"}), 401
+    # Подпись передаётся в base64 (JSON) или как есть (MessagePack)
+    signature_bytes = decode_client_signature(client_id, signature)
+    if signature_bytes is None:
+        return {"error": "Неверная подпись"}, 401
     
-    # Преобразование подписи из base64
-    signature_bytes = base64.b64decode(signature)
+    admission.admit(client_id)
     
     # Подготовка сообщения для проверки подписи
-    nonce = client_nonces[client_id]
     message = str(nonce).encode()
-    h = SHA256.new(message)
     
-    try:
-        # Загрузка публичного ключа клиента
-        client_public_key = RSA.import_key(registered_clients[client_id]['public_key'])
-        # Проверка подписи
-        pkcs1_15.new(client_public_key).verify(h, signature_bytes)
-        # Удаление использованного nonce
-        del client_nonces[client_id]
-        mark_client_authenticated(client_id)
-        return jsonify({"status": "success", "message": "Аутентификация успешна"})
-    except (ValueError, TypeError):
-        return jsonify({"error": "Неверная подпись"}), 401
+    # Проверка подписи
+    if not verify_client_signature(client_id, message, signature_bytes):
+        return {"error": "Неверная подпись"}, 401
+    
+    # Nonce гасится атомарно: из параллельных запросов с одной подписью пройдёт
+    # только один, а nonce, заменённый новым запросом, уже не принимается
+    if not client_nonces.consume((client_id, NONCE_CHALLENGE), nonce):
+        return {"error": "Нет активного запроса"}, 401
+    session = mark_client_authenticated(client_id)
+    return {"status": "success", "message": "Аутентификация успешна", **session}, 200
+
+@app.route('/auth/challenge/verify', methods=['POST'])
+def auth_challenge_verify():
+    return respond(*handle_auth_challenge_verify(read_payload()))
 
 # 3. Протокол взаимной аутентификации с использованием случайных чисел
-@app.route('/auth/mutual', methods=['POST'])
-def auth_mutual_init():
-    data = request.json
+def handle_auth_mutual(data):
     client_id = data.get('client_id')
     client_nonce = data.get('client_nonce')
     
     if not client_id or not client_nonce:
-        return jsonify({"error": "Отсутствуют необходимые данные"}), 400
+        return {"error": "Отсутствуют необходимые данные"}, 400
     
     if client_id not in registered_clients:
-        return jsonify({"error": "Клиент не зарегистрирован"}), 401
+        return {"error": "Клиент не зарегистрирован"}, 401
+    
+    # Подпись сервера - криптографическая операция, поэтому запрос проходит допуск
+    admission.admit(client_id)
     
     # Генерация случайного числа сервера
     server_nonce = random.randint(100000, 999999)
     
     # Подготовка сообщения для подписи
     message = f"{client_id}:{client_nonce}:{server_nonce}".encode()
-    h = SHA256.new(message)
     
     # Подписание сообщения приватным ключом сервера
-    private_key, _ = load_server_keys()
-    signature = pkcs1_15.new(private_key).sign(h)
-    signature_b64 = base64.b64encode(signature).decode()
+    signature = sign_server_message(message)
     
     # Сохранение nonce клиента для проверки
-    client_nonces[client_id] = {
+    client_nonces[client_id, NONCE_MUTUAL] = {
         "client_nonce": client_nonce,
         "server_nonce": server_nonce
     }
     
-    return jsonify({
+    return {
         "status": "success",
         "server_nonce": server_nonce,
-        "signature": signature_b64
-    })
+        "signature": signature
+    }, 200
 
-@app.route('/auth/mutual/verify', methods=['POST'])
-def auth_mutual_verify():
-    data = request.json
+@app.route('/auth/mutual', methods=['POST'])
+def auth_mutual_init():
+    return respond(*handle_auth_mutual(read_payload()))
+
+def handle_auth_mutual_verify(data):
     client_id = data.get('client_id')
     signature = data.get('signature')
     
     if not client_id or not signature:
-        return jsonify({"error": "Отсутствуют необходимые данные"}), 400
+        return {"error": "Отсутствуют необходимые данные"}, 400
     
-    if client_id not in registered_clients or client_id not in client_nonces:
-        return jsonify({"error": "Клиент не зарегистрирован или нет активного запроса"}), 401
+    nonces = client_nonces.get((client_id, NONCE_MUTUAL))
+    if client_id not in registered_clients or nonces is None:
+        return {"error": "Клиент не зарегистрирован или нет активного запроса"}, 401
     
-    # Преобразование подписи из base64
-    signature_bytes = base64.b64decode(signature)
+    # Подпись передаётся в base64 (JSON) или как есть (MessagePack)
+    signature_bytes = decode_client_signature(client_id, signature)
+    if signature_bytes is None:
+        return {"error": "Неверная подпись"}, 401
+    
+    admission.admit(client_id)
     
     # Получение nonce клиента и сервера
-    nonces = client_nonces[client_id]
     client_nonce = nonces["client_nonce"]
     server_nonce = nonces["server_nonce"]
     
     # Подготовка сообщения для проверки подписи
     message = f"{client_id}:{client_nonce}:{server_nonce}".encode()
-    h = SHA256.new(message)
+    
+    # Проверка подписи
+    if not verify_client_signature(client_id, message, signature_bytes):
+        return {"error": "Неверная подпись"}, 401
+    
+    # Атомарное погашение использованных nonce
+    if not client_nonces.consume((client_id, NONCE_MUTUAL), nonces):
+        return {"error": "Нет активного запроса"}, 401
+    session = mark_client_authenticated(client_id)
+    return {"status": "success", "message": "Взаимная аутентификация успешна", **session}, 200
+
+@app.route('/auth/mutual/verify', methods=['POST'])
+def auth_mutual_verify():
+    return respond(*handle_auth_mutual_verify(read_payload()))
+
+# 4. Рукопожатие: регистрация (при необходимости) и взаимная аутентификация одним запросом.
+# Клиент подписывает свой ID, метку времени и случайное число, сервер в ответе подписывает
+# те же данные своим ключом; свежесть обеспечивают окно метки времени и кэш повторов
+def handle_auth_handshake(data):
+    client_id = data.get('client_id')
+    timestamp = data.get('timestamp')
+    client_nonce = data.get('client_nonce')
+    signature = data.get('signature')
+    # Публичный ключ передаётся, если клиент не уверен в своей регистрации
+    client_public_key = wire.as_public_key_pem(data.get('public_key'))
+    algorithm = data.get('algorithm', DEFAULT_ALGORITHM)
+    
+    if not client_id or not timestamp or not client_nonce or not signature:
+        return {"error": "Отсутствуют необходимые данные"}, 400
     
     try:
-        # Загрузка публичного ключа клиента
-        client_public_key = RSA.import_key(registered_clients[client_id]['public_key'])
-        # Проверка подписи
-        pkcs1_15.new(client_public_key).verify(h, signature_bytes)
-        # Удаление использованных nonce
-        del client_nonces[client_id]
-        mark_client_authenticated(client_id)
-        return jsonify({"status": "success", "message": "Взаимная аутентификация успешна"})
+        timestamp = int(timestamp)
     except (ValueError, TypeError):
-        return jsonify({"error": "Неверная подпись"}), 401
+        return {"error": "Неверный формат данных"}, 400
+    if len(str(client_nonce)) > HANDSHAKE_NONCE_MAX_LENGTH:
+        return {"error": "Неверный формат данных"}, 400
+    if abs(int(time.time()) - timestamp) > TIMESTAMP_WINDOW:
+        return {"error": "Временная метка устарела"}, 401
+    
+    # Новый или изменившийся ключ разбирается здесь и сохраняется только после проверки
+    # подписи им, то есть регистрация требует владения приватным ключом
+    verifier = None
+    if client_public_key:
+        if algorithm not in ALGORITHMS:
+            return {"error": f"Неподдерживаемый алгоритм подписи: {algorithm}"}, 400
+        stored = registered_clients.get(client_id)
+        if stored is None or stored['public_key'] != client_public_key:
+            admission.admit(client_id)
+            try:
+                verifier = timed_build_verifier(client_public_key, algorithm)
+            except (ValueError, IndexError, TypeError):
+                return {"error": "Неверный формат публичного ключа"}, 400
+    elif client_id not in registered_clients:
+        return {"error": "Клиент не зарегистрирован"}, 401
+    
+    # Подпись передаётся в base64 (JSON) или как есть (MessagePack)
+    if verifier is None:
+        signature_bytes = decode_client_signature(client_id, signature)
+    else:
+        try:
+            signature_bytes = wire.as_bytes(signature, validate=True)
+        except (ValueError, TypeError):
+            signature_bytes = None
+        if signature_bytes is not None and len(signature_bytes) != verifier.signature_size:
+            signature_bytes = None
+    if signature_bytes is None:
+        return {"error": "Неверная подпись"}, 401
+    
+    if replay_cache.seen(client_id, timestamp, str(client_nonce)):
+        return {"error": "Повторное использование подписи"}, 401
+    
+    # Префикс отличает сообщение рукопожатия от сообщений остальных протоколов
+    message = f"handshake:{client_id}:{timestamp}:{client_nonce}".encode()
+    
+    if verifier is None:
+        admission.admit(client_id)
+        valid = verify_client_signature(client_id, message, signature_bytes)
+    else:
+        try:
+            with OPERATION_SECONDS.time("verify"):
+                verifier.verify(message, signature_bytes)
+            valid = True
+        except (ValueError, TypeError):
+            valid = False
+    if not valid:
+        return {"error": "Неверная подпись"}, 401
+    
+    if not replay_cache.add(client_id, timestamp, str(client_nonce)):
+        return {"error": "Повторное использование подписи"}, 401
+    
+    if verifier is not None:
+        registered_clients[client_id] = {
+            "public_key": client_public_key
+        }
+        client_key_cache.put(client_id, verifier)
+        logger.info("Клиент %s зарегистрирован при рукопожатии (%s)", client_id, algorithm)
+    
+    # Подпись сервера над теми же данными подтверждает клиенту подлинность сервера
+    snapshot = server_keys.current()
+    server_signature = sign_server_message(f"handshake-server:{client_id}:{timestamp}:{client_nonce}".encode())
+    
+    session = mark_client_authenticated(client_id)
+    body = {
+        "status": "success",
+        "message": "Взаимная аутентификация успешна",
+        "signature": server_signature,
+        **session
+    }
+    
+    # Ключ сервера отправляется, если у клиента его нет или он устарел (по отпечатку)
+    if data.get('server_key_fingerprint') != snapshot.public_key_fingerprint:
+        body["server_public_key"] = snapshot.public_key_pem
+    return body, 200
+
+@app.route('/auth/handshake', methods=['POST'])
+def auth_handshake():
+    return respond(*handle_auth_handshake(read_payload()))
+
+# Маршрут для получения статистики кэшей сервера
+def handle_stats():
+    return {
+        "key_cache": client_key_cache.stats(),
+        "nonce_store": client_nonces.stats(),
+        "replay_cache": replay_cache.stats(),
+        "admission": admission.stats()
+    }, 200
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return respond(*handle_stats())
+
+# Метрики в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+# Пакетная аутентификация для шлюзов, передающих вход множества клиентов одним запросом
+def handle_auth_batch(data):
+    entries = data.get('entries') if isinstance(data, dict) else None
+    
+    if not isinstance(entries, list) or not entries:
+        return {"error": "Отсутствует список записей"}, 400
+    
+    if len(entries) > AUTH_BATCH_MAX_SIZE:
+        return {"error": f"Слишком много записей (максимум {AUTH_BATCH_MAX_SIZE})"}, 413
+    
+    current_time = int(time.time())
+    results = [None] * len(entries)
+    pending = []
+    
+    # Предварительные проверки без криптографии; подписи проверяются одним набором
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            results[index] = {"error": "Неверный формат записи"}
+            continue
+        
+        client_id = entry.get('client_id')
+        timestamp = entry.get('timestamp')
+        nonce = entry.get('nonce')
+        signature = entry.get('signature')
+        
+        if not client_id or not signature or (timestamp is None) == (nonce is None):
+            results[index] = {"client_id": client_id, "error": "Отсутствуют необходимые данные"}
+            continue
+        
+        if client_id not in registered_clients:
+            results[index] = {"client_id": client_id, "error": "Клиент не зарегистрирован"}
+            continue
+        
+        try:
+            if timestamp is not None:
+                # Протокол с меткой времени
+                if abs(current_time - int(timestamp)) > TIMESTAMP_WINDOW:
+                    results[index] = {"client_id": client_id, "error": "Временная метка устарела"}
+                    continue
+                if replay_cache.seen(client_id, int(timestamp)):
+                    results[index] = {"client_id": client_id, "error": "Повторное использование подписи"}
+                    continue
+                message = f"{client_id}:{timestamp}".encode()
+            else:
+                # Протокол запрос-ответ: nonce должен совпадать с выданным сервером
+                if client_nonces.get((client_id, NONCE_CHALLENGE)) != int(nonce):
+                    results[index] = {"client_id": client_id, "error": "Нет активного запроса"}
+                    continue
+                message = str(nonce).encode()
+        except (ValueError, TypeError):
+            results[index] = {"client_id": client_id, "error": "Неверный формат данных"}
+            continue
+        
+        # Подпись передаётся в base64 (JSON) или как есть (MessagePack)
+        signature_bytes = decode_client_signature(client_id, signature)
+        if signature_bytes is None:
+            results[index] = {"client_id": client_id, "error": "Неверная подпись"}
+            continue
+        
+        # Запись, превысившая предел частоты своего клиента, отклоняется без проверки подписи
+        if admission.try_client(client_id):
+            results[index] = {"client_id": client_id, "error": "Слишком много запросов клиента"}
+            continue
+        
+        pending.append((index, client_id, timestamp, nonce, message, signature_bytes))
+    
+    # Общая корзина списывается сразу за все подписи пакета
+    if pending:
+        admission.admit_global(len(pending))
+    
+    verified = verify_client_signatures(
+        (client_id, message, signature_bytes)
+        for _, client_id, _, _, message, signature_bytes in pending
+    )
+    
+    for (index, client_id, timestamp, nonce, message, signature_bytes), valid in zip(pending, verified):
+        # Как и при одиночном входе: ключ той же длины мог быть заменён в другом процессе
+        if not valid and refresh_client_key(client_id):
+            valid = check_client_signature(client_id, message, signature_bytes)
+        if not valid:
+            results[index] = {"client_id": client_id, "error": "Неверная подпись"}
+            continue
+        
+        if timestamp is not None:
+            # Одна и та же запись могла встретиться в пакете несколько раз
+            try:
+                accepted = replay_cache.add(client_id, int(timestamp))
+            except ReplayCacheFull:
+                results[index] = {"client_id": client_id, "error": "Сервер перегружен, повторите попытку позже"}
+                continue
+            if not accepted:
+                results[index] = {"client_id": client_id, "error": "Повторное использование подписи"}
+                continue
+        else:
+            # Использованный nonce гасится атомарно, повторная запись в пакете будет отклонена
+            if not client_nonces.consume((client_id, NONCE_CHALLENGE), int(nonce)):
+                results[index] = {"client_id": client_id, "error": "Нет активного запроса"}
+                continue
+        
+        session = mark_client_authenticated(client_id)
+        results[index] = {"client_id": client_id, "status": "success", **session}
+    
+    return {
+        "status": "success",
+        "authenticated": sum(1 for result in results if result.get("status") == "success"),
+        "results": results
+    }, 200
+
+@app.route('/auth/batch', methods=['POST'])
+def auth_batch():
+    return respond(*handle_auth_batch(read_payload()))
+
+# Продление сессии: действующий токен обменивается на новый без повторной аутентификации,
+# но не дольше SESSION_MAX_LIFETIME после входа - затем клиент входит заново
+def handle_auth_refresh(data, authorization):
+    refreshed = session_tokens.refresh(get_session_token(data, authorization))
+    
+    if refreshed is None:
+        return {"error": "Токен сессии недействителен или истёк"}, 401
+    
+    token, expires_at = refreshed
+    return {"status": "success", "session_token": token, "expires_in": max(0, int(expires_at - time.time()))}, 200
+
+@app.route('/auth/refresh', methods=['POST'])
+def auth_refresh():
+    return respond(*handle_auth_refresh(read_payload(silent=True), request.headers.get('Authorization')))
 
 # Новый маршрут для обработки сообщений
-@app.route('/message', methods=['POST'])
-def process_message():
-    data = request.json
+def handle_message(data, authorization):
     client_id = data.get('client_id')
     message = data.get('message')
+    # Пакет: список сообщений в одном запросе
+    messages = data.get('messages')
     
-    if not client_id or not message:
-        return jsonify({"error": "Отсутствуют необходимые данные"}), 400
+    if not client_id or (not message and not messages):
+        return {"error": "Отсутствуют необходимые данные"}, 400
     
-    if client_id not in authenticated_clients:
-        return jsonify({"error": "Клиент не аутентифицирован"}), 401
+    # Проверка токена сессии по подписи, без обращения к состоянию сервера
+    if session_tokens.verify(get_session_token(data, authorization)) != client_id:
+        return {"error": "Клиент не аутентифицирован"}, 401
     
-    # Переворачиваем сообщение
-    reversed_message = message[::-1]
+    if messages:
+        if not isinstance(messages, list) or not all(isinstance(item, str) for item in messages):
+            return {"error": "Неверный формат данных"}, 400
+        if len(messages) > MESSAGE_BATCH_MAX_SIZE:
+            return {"error": f"Слишком много сообщений (максимум {MESSAGE_BATCH_MAX_SIZE})"}, 413
+        # Исходные сообщения не возвращаются: они есть у клиента
+        return {
+            "status": "success",
+            "reversed_messages": [item[::-1] for item in messages]
+        }, 200
     
-    return jsonify({
+    # Переворачиваем сообщение
+    body = {
         "status": "success",
-        "original_message": message,
-        "reversed_message": reversed_message
-    })
+        "reversed_message": message[::-1]
+    }
+    # Клиент может отказаться от копии исходного сообщения в ответе (echo: false)
+    if data.get('echo', True):
+        body["original_message"] = message
+    return body, 200
+
+@app.route('/message', methods=['POST'])
+def process_message():
+    return respond(*handle_message(read_payload(), request.headers.get('Authorization')))
+
+# Потоковое сообщение: тело - текст UTF-8 (не JSON), ответ - перевёрнутый текст той же
+# длины в байтах. Проверки до чтения тела; возвращает (Utf8Spool, None) или (None, ответ)
+def open_message_stream(authorization, content_length):
+    if session_tokens.verify(get_session_token(None, authorization)) is None:
+        return None, ({"error": "Клиент не аутентифицирован"}, 401)
+    if content_length is not None and content_length > MESSAGE_STREAM_MAX_SIZE:
+        return None, message_stream_error(MessageTooLarge())
+    return Utf8Spool(MESSAGE_STREAM_MAX_SIZE, MESSAGE_STREAM_MEMORY), None
+
+# Ответ на ошибку при чтении тела потокового сообщения
+def message_stream_error(e):
+    if isinstance(e, MessageTooLarge):
+        return {"error": f"Слишком большое сообщение (максимум {MESSAGE_STREAM_MAX_SIZE} байт)"}, 413
+    return {"error": "Сообщение не в кодировке UTF-8"}, 400
+
+@app.route('/message/stream', methods=['POST'])
+def process_message_stream():
+    spool, error = open_message_stream(request.headers.get('Authorization'), request.content_length)
+    if error is not None:
+        return respond(*error)
+    
+    # Тело читается частями и сразу записывается во временный файл
+    try:
+        while chunk := request.stream.read(MESSAGE_STREAM_MEMORY):
+            spool.write(chunk)
+        spool.finish()
+    except (MessageTooLarge, ValueError) as e:
+        spool.close()
+        return respond(*message_stream_error(e))
+    
+    response = app.response_class(spool.reversed_chunks(), mimetype="text/plain")
+    response.content_length = spool.size
+    return response
+
+# Проверка токена административных маршрутов; возвращает ответ с ошибкой или None
+def check_admin_token(authorization):
+    if not ADMIN_TOKEN:
+        return {"error": "Административные маршруты отключены"}, 404
+    token = authorization[len('Bearer '):] if authorization and authorization.startswith('Bearer ') else ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return {"error": "Неверный токен администратора"}, 403
+    return None
+
+# Управление профилированием: {"action": "start", "sample_rate": 0.1, "duration": 60},
+# {"action": "stop"} или {"action": "dump"}; без тела возвращается состояние
+def handle_admin_profile(data, authorization):
+    error = check_admin_token(authorization)
+    if error is not None:
+        return error
+    
+    action = data.get('action') if isinstance(data, dict) else None
+    try:
+        if action == 'start':
+            profiler.start(float(data.get('sample_rate', 1.0)), float(data.get('duration', 0)))
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'dump':
+            profiler.dump()
+        elif action is not None:
+            return {"error": f"Неизвестное действие: {action}"}, 400
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}, 400
+    
+    return {"status": "success", "profiler": profiler.status()}, 200
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    data = read_payload(silent=True) if request.method == 'POST' else None
+    return respond(*handle_admin_profile(data, request.headers.get('Authorization')))
 
 if __name__ == '__main__':
     # Генерация ключей сервера при первом запуске
     generate_server_keys()
+    server_keys.load()
+    start_crypto_pool()
+    start_profiler()
+    server_keys.start_watching(SERVER_KEY_RELOAD_INTERVAL)
     
     # Получение IP-адреса для информирования пользователя
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
-    print(f"Сервер запущен на {local_ip}:8080")
-    print("Используйте этот адрес при настройке клиентов в локальной сети")
+    logger.info("Сервер запущен на %s:8080", local_ip)
+    logger.info("Используйте этот адрес при настройке клиентов в локальной сети")
     
     # Изменение host с 127.0.0.1 на 0.0.0.0 для прослушивания всех интерфейсов
-    app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
+    # Перезагрузчик отладочного сервера запустил бы второй пул процессов
+    app.run(debug=True, host='0.0.0.0', port=8080, use_reloader=crypto_pool is None) 
\ No newline at end of file
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from common import wire
+from common.signatures import (
+    algorithm_for_key, export_public_der, export_public_pem, import_key, public_key_of,
+    public_key_fingerprint
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ServerKeySnapshot:
+    """Неизменяемый набор ключей сервера и заранее подготовленных данных для ответов"""
+
+    def __init__(self, private_key_pem, private_key, public_key, mtimes):
+        self.private_key_pem = private_key_pem
+        self.private_key = private_key
+        self.public_key = public_key
+        self.algorithm = algorithm_for_key(private_key)
+        self.signer = self.algorithm.signer(private_key)
+        self.public_key_pem = export_public_pem(public_key)
+        # По отпечатку сервер определяет, есть ли у клиента актуальный ключ (/auth/handshake)
+        self.public_key_fingerprint = public_key_fingerprint(public_key)
+        # Готовое тело ответа /get_server_public_key и его ETag
+        self.public_key_body = json.dumps({
+            "public_key": self.public_key_pem,
+            "algorithm": self.algorithm.name
+        }).encode()
+        self.etag = hashlib.sha256(self.public_key_body).hexdigest()[:32]
+        # Тела ответа и ETag по типам содержимого; в двоичном формате ключ передаётся в DER
+        self.public_key_bodies = {wire.JSON: (self.public_key_body, self.etag)}
+        for mimetype in wire.MIMETYPES[1:]:
+            body = wire.encode({
+                "public_key": export_public_der(public_key),
+                "algorithm": self.algorithm.name
+            }, mimetype)
+            self.public_key_bodies[mimetype] = (body, hashlib.sha256(body).hexdigest()[:32])
+        self.mtimes = mtimes
+
+
+class ServerKeyManager:
+    """Хранение пары ключей сервера в памяти с атомарной перезагрузкой при изменении файлов.
+
+    Ключи читаются с диска один раз; фоновый поток следит за временем
+    изменения PEM-файлов и подменяет снимок целиком, поэтому обработчики
+    запросов никогда не видят наполовину обновлённую пару ключей.
+    """
+
+    def __init__(self, private_key_path, public_key_path):
+        self.private_key_path = private_key_path
+        self.public_key_path = public_key_path
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._listeners = []
+        self.reloads = 0
+
+    def add_listener(self, callback):
+        """Регистрация функции, вызываемой с новым снимком после каждой перезагрузки"""
+        self._listeners.append(callback)
+
+    def _mtimes(self):
+        return (
+            os.stat(self.private_key_path).st_mtime_ns,
+            os.stat(self.public_key_path).st_mtime_ns
+        )
+
+    def load(self):
+        """Чтение ключей с диска и атомарная замена текущего снимка"""
+        with self._lock:
+            mtimes = self._mtimes()
+            with open(self.private_key_path, "rb") as f:
+                private_key_pem = f.read()
+            private_key = import_key(private_key_pem)
+            with open(self.public_key_path, "rb") as f:
+                public_key = import_key(f.read())
+
+            if public_key_of(private_key) != public_key:
+                raise ValueError("Публичный ключ сервера не соответствует приватному")
+
+            previous = self._snapshot
+            self._snapshot = ServerKeySnapshot(private_key_pem, private_key, public_key, mtimes)
+            self.reloads += 1
+
+        if previous is not None:
+            for callback in self._listeners:
+                callback(self._snapshot)
+        return self._snapshot
+
+    def current(self):
+        """Текущий снимок ключей (при первом обращении ключи загружаются с диска)"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.load()
+        return snapshot
+
+    def reload_if_changed(self):
+        """Перезагрузка ключей, если PEM-файлы изменились; возвращает True при замене"""
+        try:
+            mtimes = self._mtimes()
+        except OSError:
+            return False
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.mtimes == mtimes:
+            return False
+
+        try:
+            self.load()
+        except (OSError, ValueError, IndexError, TypeError) as e:
+            # Файлы могут быть записаны не полностью - оставляем прежние ключи
+            logger.error("Не удалось перезагрузить ключи сервера: %s", e)
+            return False
+
+        logger.info("Ключи сервера перезагружены")
+        return True
+
+    def start_watching(self, interval=5.0):
+        """Запуск фонового потока, проверяющего PEM-файлы раз в interval секунд"""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        stop = threading.Event()
+
+        def watch():
+            while not stop.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="server-key-watcher", daemon=True)
+        self._watcher.stop = stop
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop.set()
+            self._watcher = None
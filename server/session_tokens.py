@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+# Длина подписи токена в байтах (усечённый HMAC-SHA256)
+TOKEN_MAC_SIZE = 16
+
+# Формат токена, входящий в подпись: токен прежнего формата без времени входа
+# с тем же секретом не разбирается как токен другого клиента
+TOKEN_FORMAT = b"2"
+
+
+def load_or_create_secret(path):
+    """Чтение секрета сессий из файла; при отсутствии файла секрет генерируется.
+
+    Общий файл позволяет токенам переживать перезапуск сервера и
+    проверяться любым процессом, запущенным с тем же секретом.
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    secret = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionTokenIssuer:
+    """Выдача и проверка компактных токенов сессии, подписанных HMAC-SHA256.
+
+    Токен имеет вид base64url("<client_id>|<auth_time>|<expires_at>").base64url(mac)
+    и проверяется без обращения к общему состоянию сервера. auth_time - время
+    входа с проверкой подписи; при продлении оно переносится в новый токен, и
+    сессия не продлевается дольше max_lifetime секунд после входа.
+    """
+
+    def __init__(self, secret, ttl=900, max_lifetime=43200, clock=time.time):
+        self.secret = secret
+        self.ttl = ttl
+        self.max_lifetime = max_lifetime
+        self.clock = clock
+
+    def _mac(self, payload):
+        return hmac.new(self.secret, TOKEN_FORMAT + b"|" + payload, hashlib.sha256).digest()[:TOKEN_MAC_SIZE]
+
+    def issue(self, client_id, auth_time=None):
+        """Выдача токена сессии, начатой входом в auth_time (по умолчанию - сейчас);
+        возвращает пару (токен, время истечения в секундах эпохи)"""
+        now = self.clock()
+        auth_time = int(now if auth_time is None else auth_time)
+        # Токен не действует дольше, чем сессия, к которой он относится
+        expires_at = min(int(now + self.ttl), auth_time + self.max_lifetime)
+        payload = f"{client_id}|{auth_time}|{expires_at}".encode()
+        return f"{_b64encode(payload)}.{_b64encode(self._mac(payload))}", expires_at
+
+    def verify(self, token):
+        """Проверка токена; возвращает client_id или None, если токен неверен или истёк"""
+        session = self.verify_session(token)
+        return session[0] if session is not None else None
+
+    def verify_session(self, token):
+        """Проверка токена; возвращает пару (client_id, время входа) или None"""
+        if not isinstance(token, str) or token.count(".") != 1:
+            return None
+
+        payload_b64, mac_b64 = token.split(".")
+        try:
+            payload = _b64decode(payload_b64)
+            mac = _b64decode(mac_b64)
+        except ValueError:
+            return None
+
+        if not hmac.compare_digest(mac, self._mac(payload)):
+            return None
+
+        client_id, auth_time, expires_at = payload.decode().rsplit("|", 2)
+        if int(expires_at) <= self.clock():
+            return None
+        return client_id, int(auth_time)
+
+    def refresh(self, token):
+        """Обмен действующего токена на новый той же сессии; возвращает пару
+        (токен, время истечения) или None, если токен неверен или сессия закончилась"""
+        session = self.verify_session(token)
+        if session is None:
+            return None
+        client_id, auth_time = session
+        if self.clock() >= auth_time + self.max_lifetime:
+            return None
+        return self.issue(client_id, auth_time)
@@ -0,0 +1,245 @@
+"""Состояние сервера, общее для нескольких рабочих процессов, в локальной базе SQLite.
+
+Используется в многопроцессном режиме (prefork.py): nonce, выданный одним
+процессом, проверяется и гасится любым другим, а подпись, принятая одним
+процессом, отклоняется как повтор во всех. Интерфейсы совпадают с NonceStore
+и ReplayCache, поэтому обработчики запросов не зависят от выбранного хранилища.
+
+База открывается в режиме WAL без синхронной записи на диск: состояние
+временное, а его потеря при сбое питания равносильна истечению nonce. Для
+наименьших задержек файл можно разместить в /dev/shm. У каждого потока своё
+соединение; соединения не переживают fork, поэтому создаются при первом
+обращении уже в рабочем процессе.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from common.wire import json_default
+from replay_cache import ReplayCacheFull
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nonces (
+    client_id TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (client_id, protocol)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nonces_expires_at ON nonces (expires_at);
+CREATE TABLE IF NOT EXISTS replays (
+    key BLOB PRIMARY KEY,
+    timestamp INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS replays_timestamp ON replays (timestamp);
+"""
+
+
+def _encode_value(value):
+    # Одинаковые значения всегда дают одинаковую строку, что нужно для consume
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=json_default)
+
+
+class StateDatabase:
+    """Файл базы общего состояния и соединения с ним по потокам"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+
+class SharedNonceStore:
+    """Хранилище nonce с ограниченным временем жизни в общей базе.
+
+    Ключ - пара (client_id, протокол). Истёкшие записи удаляются не чаще раза
+    в sweep_interval секунд в каждом процессе; тогда же при превышении
+    capacity вытесняются записи, истекающие первыми.
+    """
+
+    def __init__(self, database, ttl=120, capacity=100000, sweep_interval=1.0, clock=time.time):
+        self.database = database
+        self.ttl = ttl
+        self.capacity = capacity
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._next_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _sweep(self, conn, now):
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + self.sweep_interval
+            self.expirations += conn.execute("DELETE FROM nonces WHERE expires_at <= ?", (now,)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM nonces").fetchone()[0] - self.capacity
+            if excess > 0:
+                self.evictions += conn.execute(
+                    "DELETE FROM nonces WHERE (client_id, protocol) IN "
+                    "(SELECT client_id, protocol FROM nonces ORDER BY expires_at LIMIT ?)", (excess,)
+                ).rowcount
+        finally:
+            self._sweep_lock.release()
+
+    def __setitem__(self, key, value):
+        client_id, protocol = key
+        conn = self.database.connection()
+        now = self.clock()
+        self._sweep(conn, now)
+        conn.execute(
+            "INSERT OR REPLACE INTO nonces (client_id, protocol, value, expires_at) VALUES (?, ?, ?, ?)",
+            (client_id, protocol, _encode_value(value), now + self.ttl)
+        )
+
+    def get(self, key, default=None):
+        """Значение nonce или default, если nonce не выдан или истёк"""
+        row = self.database.connection().execute(
+            "SELECT value FROM nonces WHERE client_id = ? AND protocol = ? AND expires_at > ?",
+            (*key, self.clock())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def pop(self, key, default=None):
+        """Удаление nonce с возвратом его значения"""
+        row = self.database.connection().execute(
+            "DELETE FROM nonces WHERE client_id = ? AND protocol = ? RETURNING value, expires_at", key
+        ).fetchone()
+        if row is None or row[1] <= self.clock():
+            return default
+        return json.loads(row[0])
+
+    def consume(self, key, expected):
+        """Атомарная проверка и погашение nonce (одним оператором DELETE)"""
+        return self.database.connection().execute(
+            "DELETE FROM nonces WHERE client_id = ? AND protocol = ? AND value = ? AND expires_at > ?",
+            (*key, _encode_value(expected), self.clock())
+        ).rowcount == 1
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key):
+        if self.database.connection().execute(
+            "DELETE FROM nonces WHERE client_id = ? AND protocol = ?", key
+        ).rowcount == 0:
+            raise KeyError(key)
+
+    def __len__(self):
+        return self.database.connection().execute("SELECT COUNT(*) FROM nonces").fetchone()[0]
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "capacity": self.capacity,
+            "ttl": self.ttl,
+            "shared": True,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SharedReplayCache:
+    """Кэш принятых входов протокола с меткой времени в общей базе.
+
+    Запись - 16-байтовый хеш (client_id, метка, nonce), как в ReplayCache
+    (без подписи, которую можно изменить без ключа); встроенный hash()
+    не подходит, так как в каждом процессе он свой. Записи с метками старше
+    окна удаляются раз в bucket_width секунд. Число записей проверяется при
+    той же очистке, поэтому предел max_entries соблюдается с точностью до
+    входов за bucket_width секунд.
+    """
+
+    def __init__(self, database, window=300, bucket_width=10, max_entries=1000000, clock=time.time):
+        self.database = database
+        self.window = window
+        self.bucket_width = bucket_width
+        self.max_entries = max_entries
+        self.clock = clock
+        self._purged_before = None
+        self._size = 0
+        self._purge_lock = threading.Lock()
+        self.replays = 0
+        self.rejected_full = 0
+
+    @staticmethod
+    def _key(client_id, timestamp, nonce):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{client_id}\0{timestamp}".encode())
+        if nonce is not None:
+            digest.update(f"\0{nonce}".encode())
+        return digest.digest()
+
+    def _purge(self, conn, now):
+        oldest = int(now - self.window) // self.bucket_width
+        if self._purged_before == oldest or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            conn.execute("DELETE FROM replays WHERE timestamp < ?", (oldest * self.bucket_width,))
+            self._size = conn.execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+            self._purged_before = oldest
+        finally:
+            self._purge_lock.release()
+
+    def seen(self, client_id, timestamp, nonce=None):
+        """True, если вход клиента с этой меткой времени (и nonce) уже был принят"""
+        row = self.database.connection().execute(
+            "SELECT 1 FROM replays WHERE key = ?", (self._key(client_id, timestamp, nonce),)
+        ).fetchone()
+        if row is not None:
+            self.replays += 1
+            return True
+        return False
+
+    def add(self, client_id, timestamp, nonce=None):
+        """Запоминание принятого входа; возвращает False, если он уже был принят"""
+        conn = self.database.connection()
+        self._purge(conn, self.clock())
+        if self._size >= self.max_entries:
+            self.rejected_full += 1
+            raise ReplayCacheFull("Превышен предел памяти кэша повторов")
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO replays (key, timestamp) VALUES (?, ?)",
+            (self._key(client_id, timestamp, nonce), timestamp)
+        ).rowcount == 1
+        if not inserted:
+            self.replays += 1
+            return False
+        self._size += 1
+        return True
+
+    def __len__(self):
+        return self.database.connection().execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+
+    def stats(self):
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "window": self.window,
+            "shared": True,
+            "replays": self.replays,
+            "rejected_full": self.rejected_full
+        }
@@ -0,0 +1,165 @@
+"""Контейнеры, разделённые на сегменты с отдельными блокировками.
+
+Ключ попадает в сегмент по хешу, поэтому операции с разными ключами почти
+всегда берут разные блокировки и параллельные запросы разных клиентов не
+ждут друг друга. Составные операции над одним ключом (проверить и изменить)
+выполняются под блокировкой его сегмента и потому атомарны.
+"""
+import threading
+from collections import OrderedDict
+
+# Число сегментов по умолчанию (степень двойки, заметно больше числа потоков запросов)
+DEFAULT_SHARDS = 64
+
+
+class StripedDict:
+    """Словарь с блокировкой на каждый сегмент"""
+
+    def __init__(self, shards=DEFAULT_SHARDS):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key, default=None):
+        entries, lock = self._shard(key)
+        with lock:
+            return entries.get(key, default)
+
+    def __contains__(self, key):
+        entries, lock = self._shard(key)
+        with lock:
+            return key in entries
+
+    def __getitem__(self, key):
+        entries, lock = self._shard(key)
+        with lock:
+            return entries[key]
+
+    def __setitem__(self, key, value):
+        entries, lock = self._shard(key)
+        with lock:
+            entries[key] = value
+
+    def __delitem__(self, key):
+        entries, lock = self._shard(key)
+        with lock:
+            del entries[key]
+
+    def pop(self, key, default=None):
+        entries, lock = self._shard(key)
+        with lock:
+            return entries.pop(key, default)
+
+    def setdefault(self, key, value):
+        """Значение ключа; если ключа нет, он атомарно получает значение value"""
+        entries, lock = self._shard(key)
+        with lock:
+            return entries.setdefault(key, value)
+
+    def __len__(self):
+        return sum(len(entries) for entries, _ in self._shards)
+
+
+class StripedSet:
+    """Множество с блокировкой на каждый сегмент"""
+
+    def __init__(self, shards=DEFAULT_SHARDS):
+        self._shards = [(set(), threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def add(self, key):
+        """Добавление элемента; возвращает True, если его ещё не было"""
+        items, lock = self._shard(key)
+        with lock:
+            if key in items:
+                return False
+            items.add(key)
+            return True
+
+    def discard(self, key):
+        items, lock = self._shard(key)
+        with lock:
+            items.discard(key)
+
+    def __contains__(self, key):
+        items, lock = self._shard(key)
+        with lock:
+            return key in items
+
+    def __len__(self):
+        return sum(len(items) for items, _ in self._shards)
+
+
+class _LRUShard:
+    __slots__ = ("entries", "lock", "hits", "misses", "evictions")
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class ShardedLRU:
+    """Ограниченный LRU-кэш из независимых сегментов.
+
+    Каждый сегмент хранит не больше max_size / shards записей и вытесняет
+    свои самые давние, так что порядок вытеснения приближённый. Счётчики
+    попаданий, промахов и вытеснений ведутся по сегментам под их блокировками.
+    """
+
+    def __init__(self, max_size, shards=DEFAULT_SHARDS):
+        shards = max(1, min(shards, max_size))
+        self.max_size = max_size
+        self.shard_size = -(-max_size // shards)
+        self._shards = [_LRUShard() for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            value = shard.entries.get(key)
+            if value is None:
+                shard.misses += 1
+                return default
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return value
+
+    def put(self, key, value):
+        shard = self._shard(key)
+        with shard.lock:
+            shard.entries[key] = value
+            shard.entries.move_to_end(key)
+            while len(shard.entries) > self.shard_size:
+                shard.entries.popitem(last=False)
+                shard.evictions += 1
+
+    def pop(self, key, default=None):
+        shard = self._shard(key)
+        with shard.lock:
+            return shard.entries.pop(key, default)
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def counters(self):
+        """Суммарные (hits, misses, evictions) по всем сегментам"""
+        hits = misses = evictions = 0
+        for shard in self._shards:
+            with shard.lock:
+                hits += shard.hits
+                misses += shard.misses
+                evictions += shard.evictions
+        return hits, misses, evictions
@@ -0,0 +1,72 @@
+import base64
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "client"))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+sys.path.insert(0, ROOT)
+
+from common.signatures import export_public_pem, get_algorithm
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """Модуль сервера с реестром и общим состоянием во временном каталоге.
+
+    Настройки сервера читаются из окружения при импорте, а ключи сервера и
+    секрет сессий - из текущего каталога, поэтому модуль импортируется один
+    раз на все тесты; каталог и окружение восстанавливаются сразу после этого.
+    """
+    workdir = tmp_path_factory.mktemp("server")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(workdir)
+        for name, value in {
+            "REGISTRY_PATH": str(workdir / "clients.db"),
+            "SHARED_STATE_PATH": str(workdir / "state.db"),
+            "PROFILE_DIR": str(workdir / "profiles"),
+            "ADMISSION_CLIENT_RATE": "0",
+            "LOG_LEVEL": "WARNING",
+        }.items():
+            patch.setenv(name, value)
+        import server as module
+        module.generate_server_keys()
+        module.server_keys.load()
+    return module
+
+
+class TestClient:
+    """Ключ клиента и подпись сообщений в формате JSON-запросов"""
+
+    __test__ = False
+
+    def __init__(self, client_id, algorithm):
+        self.client_id = client_id
+        self.algorithm = get_algorithm(algorithm)
+        self.key = self.algorithm.generate()
+        self.signer = self.algorithm.signer(self.key)
+
+    @property
+    def public_key(self):
+        return export_public_pem(self.key)
+
+    def sign(self, message):
+        return base64.b64encode(self.signer.sign(message.encode())).decode()
+
+    def register(self, server):
+        body, status = server.handle_register({
+            "client_id": self.client_id, "public_key": self.public_key, "algorithm": self.algorithm.name
+        })
+        assert status == 200, body
+
+
+@pytest.fixture
+def make_client(server, request):
+    def make(algorithm="ecdsa-p256", register=True, client_id=None):
+        client = TestClient(client_id or f"{request.node.name}-{algorithm}", algorithm)
+        if register:
+            client.register(server)
+        return client
+    return make
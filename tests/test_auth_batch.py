@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from client_registry import ClientRegistry
+
+
+def timestamp_entry(client):
+    timestamp = int(time.time())
+    return {"client_id": client.client_id, "timestamp": timestamp,
+            "signature": client.sign(f"{client.client_id}:{timestamp}")}
+
+
+def reregister_elsewhere(server, client):
+    """Замена ключа клиента так, как это делает другой процесс сервера: только в базе"""
+    registry = ClientRegistry(server.REGISTRY_PATH, synchronous=True)
+    registry[client.client_id] = {"public_key": client.public_key}
+    registry.close()
+
+
+def test_batch_timestamp_entry(server, make_client):
+    client = make_client()
+    body, status = server.handle_auth_batch({"entries": [timestamp_entry(client), {"client_id": client.client_id}]})
+    assert status == 200
+    assert body["authenticated"] == 1
+    assert "session_token" in body["results"][0]
+
+
+@pytest.mark.parametrize("old, new", [("rsa", "ecdsa-p256"), ("ecdsa-p256", "ed25519")])
+def test_batch_after_reregistration_in_other_process(server, make_client, old, new):
+    client = make_client(old)
+    # Ключ клиента загружен в кэш этого процесса
+    body, _ = server.handle_auth_batch({"entries": [timestamp_entry(client)]})
+    assert body["authenticated"] == 1
+
+    replacement = make_client(new, register=False, client_id=client.client_id)
+    reregister_elsewhere(server, replacement)
+    # Новая метка времени: вход с прежней уже в кэше повторов
+    time.sleep(1)
+    body, status = server.handle_auth_batch({"entries": [timestamp_entry(replacement)]})
+    assert status == 200
+    assert body["authenticated"] == 1, body
@@ -0,0 +1,63 @@
+import pytest
+
+from client_registry import ClientRegistry
+
+
+@pytest.mark.parametrize("synchronous", [False, True])
+def test_len_counts_new_clients_only(tmp_path, synchronous):
+    path = str(tmp_path / "clients.db")
+    registry = ClientRegistry(path, synchronous=synchronous)
+    for client_id in ("a", "b", "c"):
+        registry[client_id] = {"public_key": f"key-{client_id}"}
+    registry["a"] = {"public_key": "new-key-a"}
+    registry.flush()
+    assert len(registry) == 3
+    registry.close()
+
+    # При открытии число клиентов читается из базы
+    reopened = ClientRegistry(path)
+    assert len(reopened) == 3
+    assert reopened["a"]["public_key"] == "new-key-a"
+    reopened.close()
+
+
+def test_bulk_import_counts_new_clients(tmp_path):
+    registry = ClientRegistry(str(tmp_path / "clients.db"))
+    registry["a"] = {"public_key": "key-a"}
+    registry.flush()
+
+    imported, skipped = registry.bulk_import([("a", "key-a2"), ("b", "key-b"), ("b", "key-b2")], chunk_size=2)
+    assert (imported, skipped) == (3, 0)
+    assert len(registry) == 2
+    assert registry["a"]["public_key"] == "key-a2"
+    assert registry["b"]["public_key"] == "key-b2"
+    registry.close()
+
+
+def test_len_sees_other_instances(tmp_path):
+    path = str(tmp_path / "clients.db")
+    first = ClientRegistry(path, synchronous=True)
+    second = ClientRegistry(path, synchronous=True)
+    first["a"] = {"public_key": "key-a"}
+    second["b"] = {"public_key": "key-b"}
+    assert len(first) == len(second) == 2
+    first.close()
+    second.close()
+
+
+def test_count_of_database_without_meta(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "clients.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE clients (client_id TEXT PRIMARY KEY, public_key TEXT NOT NULL, "
+                 "registered_at INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO clients VALUES (?, 'key', 0)", [(f"c{i}",) for i in range(5)])
+    conn.commit()
+    conn.close()
+
+    registry = ClientRegistry(path, synchronous=True)
+    assert len(registry) == 5
+    registry["c5"] = {"public_key": "key"}
+    assert len(registry) == 6
+    registry.close()
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from common.signatures import export_private_pem, export_public_pem, get_algorithm
+from crypto_pool import CryptoPool, CryptoPoolBusy
+
+SERVER_KEY = get_algorithm("ed25519").generate()
+PUBLIC_KEY_PEM = export_public_pem(SERVER_KEY)
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        # Процессы, которые были до пула, не относятся к нему
+        existing = {process.pid for process in multiprocessing.active_children()}
+        pool = CryptoPool(1, export_private_pem(SERVER_KEY), **kwargs)
+        pool.workers_of = lambda: [
+            process for process in multiprocessing.active_children() if process.pid not in existing
+        ]
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def check_signing(pool):
+    signature = pool.sign(b"message")
+    assert pool.verify(PUBLIC_KEY_PEM, b"message", signature)
+
+
+def kill_workers(pool):
+    workers = pool.workers_of()
+    assert workers
+    for process in workers:
+        os.kill(process.pid, signal.SIGKILL)
+
+
+def test_timeout_raises_busy(make_pool):
+    # Ни одна операция не успевает вернуться из другого процесса за микросекунду
+    pool = make_pool(timeout=1e-6)
+    with pytest.raises(CryptoPoolBusy):
+        pool.sign(b"message")
+    assert pool.timeouts == 1
+
+
+def test_killed_idle_worker_rebuilds_pool(make_pool):
+    pool = make_pool()
+    check_signing(pool)
+    kill_workers(pool)
+
+    # Операция повторяется на пересозданном пуле
+    check_signing(pool)
+    assert pool.rebuilds == 1
+
+
+def test_worker_killed_during_operation(make_pool):
+    pool = make_pool()
+    check_signing(pool)
+    items = [(PUBLIC_KEY_PEM, b"message", pool.sign(b"message"))] * 300
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = pool.verify_many(items)
+        except CryptoPoolBusy:
+            outcome["result"] = "busy"
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.05)
+    kill_workers(pool)
+    thread.join()
+
+    assert outcome["result"] in ([True] * len(items), "busy")
+    assert pool.rebuilds >= 1
+    check_signing(pool)
+
+
+def test_single_core_runs_inline(server, monkeypatch):
+    monkeypatch.setattr(server, "CRYPTO_WORKERS", 2)
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 1)
+    server.start_crypto_pool()
+    assert server.crypto_pool is None
@@ -0,0 +1,99 @@
+import base64
+import time
+
+# Порядок группы точек кривой P-256
+P256_ORDER = 0xFFFFFFFF00000000FFFFFFFFFFFFFFFFBCE6FAADA7179E84F3B9CAC2FC632551
+
+
+def malleate(signature):
+    """Подпись ECDSA (r, n - s): без приватного ключа и тоже верная"""
+    raw = base64.b64decode(signature)
+    r, s = raw[:32], int.from_bytes(raw[32:], "big")
+    return base64.b64encode(r + (P256_ORDER - s).to_bytes(32, "big")).decode()
+
+
+def test_timestamp_replay_rejected(server, make_client):
+    client = make_client()
+    timestamp = int(time.time())
+    data = {"client_id": client.client_id, "timestamp": timestamp,
+            "signature": client.sign(f"{client.client_id}:{timestamp}")}
+
+    body, status = server.handle_auth_timestamp(data)
+    assert status == 200, body
+    _, status = server.handle_auth_timestamp(data)
+    assert status == 401
+
+
+def test_timestamp_malleated_signature_rejected(server, make_client):
+    client = make_client()
+    timestamp = int(time.time())
+    signature = client.sign(f"{client.client_id}:{timestamp}")
+
+    body, status = server.handle_auth_timestamp(
+        {"client_id": client.client_id, "timestamp": timestamp, "signature": signature}
+    )
+    assert status == 200, body
+    body, status = server.handle_auth_timestamp(
+        {"client_id": client.client_id, "timestamp": timestamp, "signature": malleate(signature)}
+    )
+    assert status == 401
+    assert "session_token" not in body
+
+
+def test_handshake_malleated_signature_rejected(server, make_client):
+    client = make_client()
+    timestamp = int(time.time())
+    nonce = "0123456789abcdef"
+    signature = client.sign(f"handshake:{client.client_id}:{timestamp}:{nonce}")
+    data = {"client_id": client.client_id, "timestamp": timestamp, "client_nonce": nonce}
+
+    body, status = server.handle_auth_handshake({**data, "signature": signature})
+    assert status == 200, body
+    body, status = server.handle_auth_handshake({**data, "signature": malleate(signature)})
+    assert status == 401
+    assert "session_token" not in body
+
+    # Другой nonce с той же меткой - новый вход
+    signature = client.sign(f"handshake:{client.client_id}:{timestamp}:other")
+    body, status = server.handle_auth_handshake({**data, "client_nonce": "other", "signature": signature})
+    assert status == 200, body
+
+
+def test_replay_cache_keys_on_client_timestamp_and_nonce():
+    from replay_cache import ReplayCache
+
+    cache = ReplayCache(window=300)
+    timestamp = int(time.time())
+    assert cache.add("a", timestamp)
+    assert cache.seen("a", timestamp)
+    assert not cache.add("a", timestamp)
+    assert not cache.seen("b", timestamp)
+    assert not cache.seen("a", timestamp, "nonce")
+    assert cache.add("a", timestamp, "nonce")
+    assert cache.seen("a", timestamp, "nonce")
+
+
+def test_replay_cache_capacity_holds_whole_window():
+    from replay_cache import ReplayCache, capacity_for_rate
+
+    rate, window = 5, 30
+    now = [1_000_000.0]
+    cache = ReplayCache(window=window, max_entries=capacity_for_rate(rate, window), clock=lambda: now[0])
+    # Часы клиентов спешат на всё окно: записи живут дольше всего
+    for second in range(10 * window):
+        now[0] += 1
+        for i in range(rate):
+            assert cache.add(f"client-{second}-{i}", int(now[0]) + window)
+
+
+def test_client_waits_for_next_second(tmp_path, monkeypatch):
+    import client
+
+    monkeypatch.chdir(tmp_path)
+    # С handshake=True клиент не обращается к серверу при создании
+    instance = client.Client("timestamp-client", algorithm="ed25519", verbose=False, handshake=True)
+    first = instance.make_timestamp_entry()["timestamp"]
+    second = instance.make_timestamp_entry()["timestamp"]
+    assert second == first + 1
+    assert second <= time.time()
+    instance.close()
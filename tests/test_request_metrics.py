@@ -0,0 +1,41 @@
+import cProfile
+
+import pytest
+
+
+def requests_total(server, route, status):
+    prefix = f'auth_http_requests_total{{route="{route}",method="GET",status="{status}"}} '
+    for line in server.REQUESTS_TOTAL.collect():
+        if line.startswith(prefix):
+            return int(line[len(prefix):])
+    return 0
+
+
+def test_unhandled_exception_is_observed(server, monkeypatch, tmp_path):
+    def failing_stats():
+        raise RuntimeError("ошибка обработчика")
+
+    # Как при app.run(debug=True): исключение передаётся из приложения
+    monkeypatch.setitem(server.app.config, "PROPAGATE_EXCEPTIONS", True)
+    monkeypatch.setitem(server.app.view_functions, "get_stats", failing_stats)
+    monkeypatch.setattr(server.profiler, "output_dir", str(tmp_path))
+    server.profiler.start(1.0)
+    try:
+        before = requests_total(server, "/stats", 500)
+        with pytest.raises(RuntimeError):
+            server.app.test_client().get("/stats")
+        assert requests_total(server, "/stats", 500) == before + 1
+        assert server.profiler.status()["profiled"].get("/stats") == 1
+    finally:
+        server.profiler.stop()
+
+    # Профилировщик запроса выключен: в потоке можно запустить новый
+    profile = cProfile.Profile()
+    profile.enable()
+    profile.disable()
+
+
+def test_successful_request_is_observed(server):
+    before = requests_total(server, "/stats", 200)
+    assert server.app.test_client().get("/stats").status_code == 200
+    assert requests_total(server, "/stats", 200) == before + 1
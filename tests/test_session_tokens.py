@@ -0,0 +1,70 @@
+from session_tokens import SessionTokenIssuer
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_issuer(clock):
+    return SessionTokenIssuer(b"secret", ttl=900, max_lifetime=3600, clock=clock)
+
+
+def test_refresh_keeps_auth_time():
+    clock = Clock()
+    issuer = make_issuer(clock)
+    token, _ = issuer.issue("client|1")
+
+    clock.now += 600
+    token, expires_at = issuer.refresh(token)
+    assert issuer.verify_session(token) == ("client|1", 1_000_000)
+    assert expires_at == 1_000_000 + 600 + 900
+
+
+def test_refresh_stops_at_max_lifetime():
+    clock = Clock()
+    issuer = make_issuer(clock)
+    token, _ = issuer.issue("client")
+
+    # Продление каждые 10 минут доводит сессию ровно до max_lifetime после входа
+    for _ in range(6):
+        clock.now += 600
+        refreshed = issuer.refresh(token)
+        if refreshed is None:
+            break
+        token, expires_at = refreshed
+        assert expires_at <= 1_000_000 + 3600
+    assert refreshed is None
+    assert clock.now - 1_000_000 == 3600
+    assert issuer.verify(token) is None
+
+
+def test_refresh_endpoint_limits_session_lifetime(server):
+    now = int(server.session_tokens.clock())
+
+    # Новый токен сессии, начатой почти SESSION_MAX_LIFETIME назад, истекает с её концом
+    token, _ = server.session_tokens.issue("refresh-client", auth_time=now - server.SESSION_MAX_LIFETIME + 5)
+    body, status = server.handle_auth_refresh({}, f"Bearer {token}")
+    assert status == 200, body
+    assert body["expires_in"] <= 5
+
+    token, _ = server.session_tokens.issue("refresh-client", auth_time=now - server.SESSION_MAX_LIFETIME)
+    body, status = server.handle_auth_refresh({}, f"Bearer {token}")
+    assert status == 401
+    assert "session_token" not in body
+
+
+def test_token_without_auth_time_rejected():
+    import base64
+    import hashlib
+    import hmac
+
+    issuer = make_issuer(Clock())
+    # Токен прежнего формата "<client_id>|<expires_at>" с тем же секретом
+    payload = b"victim|999|2000000"
+    mac = hmac.new(b"secret", payload, hashlib.sha256).digest()[:16]
+    token = ".".join(base64.urlsafe_b64encode(part).rstrip(b"=").decode() for part in (payload, mac))
+    assert issuer.verify(token) is None